@@ -0,0 +1,155 @@
+"""Benchmark of `logs.statistics.geolocapi.GeolocClient`
+against a local stub HTTP server of a geolocation API
+
+The stub answers like www.geoplugin.net (`/json.gp?ip=<ip>`)
+and like a batch endpoint (POST `/batch`) after `latency` seconds,
+some requests fail with status 503 to exercise the retries.
+For several numbers of workers, the achieved throughput
+is compared with the rate limit of the client and the maximal
+number of requests received in any 1 second window is checked
+not to exceed the rate and the burst of the token bucket.
+
+Usage: python benchmarks/geolocapi.py [<IPs> [<rate> [<latency>]]]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logs.statistics.geolocapi import UNKNOWN, GeolocClient  # noqa: E402
+
+BURST = 3
+WORKERS = (1, 4, 16)
+FAILING_SUFFIX = ".7"  # IPs ending with it fail `FAILURES` times
+FAILURES = 2
+
+
+class StubServer(ThreadingHTTPServer):
+    """Stub geolocation API, `received` are times of received requests"""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.received: List[float] = []
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.received.clear()
+            self.failures.clear()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, data) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _receive(self) -> None:
+        with self.server.lock:
+            self.server.received.append(time.monotonic())
+        time.sleep(self.server.latency)
+
+    def do_GET(self):
+        self._receive()
+        ip = self.path.split("ip=", 1)[-1]
+
+        if ip.endswith(FAILING_SUFFIX):
+            with self.server.lock:
+                failed = self.server.failures.get(ip, 0)
+                self.server.failures[ip] = failed + 1
+            if failed < FAILURES:
+                self.send_response(503)
+                self.end_headers()
+                return
+
+        self._reply({"geoplugin_countryName": f"Country {ip.split('.')[-1]}"})
+
+    def do_POST(self):
+        self._receive()
+        ips = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self._reply([{"country": f"Country {ip.split('.')[-1]}"} for ip in ips])
+
+
+def max_in_window(times: List[float], window: float = 1.0) -> int:
+    """Returns the maximal number of `times` in any `window` seconds"""
+    times = sorted(times)
+    result = j = 0
+    for i, t in enumerate(times):
+        while times[j] < t - window:
+            j += 1
+        result = max(result, i - j + 1)
+    return result
+
+
+def main(ips_num: int = 60, rate: float = 20.0, latency: float = 0.3) -> None:
+    server = StubServer(latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ips = [f"10.0.{i // 250}.{i % 250}" for i in range(int(ips_num))]
+
+    print(f"{len(ips)} IPs, rate limit {rate} requests/s, latency {latency} s")
+    for workers in WORKERS:
+        server.reset()
+        client = GeolocClient(
+            base_url=server.url + "/json.gp?ip={ip}",
+            rate=rate,
+            burst=BURST,
+            workers=workers,
+            backoff=0.05,
+        )
+
+        start = time.monotonic()
+        locations = client.geolocate_many(ips)
+        duration = time.monotonic() - start
+
+        assert all(
+            location == f"Country {ip.split('.')[-1]}"
+            for ip, location in locations.items()
+        ), "retried requests were not geolocated"
+        in_window = max_in_window(server.received)
+        assert in_window <= rate + BURST, "rate limit exceeded"
+        print(
+            f"{workers:>2} workers: {len(ips) / duration:6.1f} IPs/s, "
+            f"at most {in_window} requests in 1 s, {client.summary()}"
+        )
+
+    server.reset()
+    client = GeolocClient(
+        base_url=server.url + "/json.gp?ip={ip}",
+        batch_url=server.url + "/batch",
+        country_field="country",
+        rate=rate,
+        batch_size=10,
+    )
+    start = time.monotonic()
+    locations = client.geolocate_many(ips)
+    duration = time.monotonic() - start
+    assert UNKNOWN not in locations.values()
+    print(
+        f"batch endpoint: {len(ips) / duration:6.1f} IPs/s, "
+        f"{len(server.received)} requests"
+    )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,102 @@
+"""Benchmark of parsing crafted malformed log lines
+
+The regex of the parser engines backtracks on malformed lines in time
+growing with about the fifth power of their length, e.g. the line
+`'a b c [x] "' * 54` of 594 characters takes about 30 s to be matched.
+Such lines are parsed in linear time and matched by the regex only
+up to `DEFAULT_MAX_LINE_LENGTH` characters, see
+`logs.parser.logparser.get_log_entry_parser`.
+
+Parses crafted lines of lengths up to `<max length>` (100 000 by default)
+by both engines from text and from a mapped file, measures the slowest line
+and checks that no line takes longer than `MAX_SECONDS`.
+
+Usage: python benchmarks/hostilelines.py [<max length>]
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logs.parser.logentry import USED_FIELDS  # noqa: E402
+from logs.parser.logfile import MappedLog  # noqa: E402
+from logs.parser.logparser import (  # noqa: E402
+    DEFAULT_MAX_LINE_LENGTH,
+    LOG_ENTRY_REGEX,
+    get_log_entry_parser,
+    get_mapped_log_entry_parser,
+    get_mapped_split_log_entry_parser,
+    get_split_log_entry_parser,
+)
+
+MAX_SECONDS = 0.1
+# repeated parts of the crafted lines, the regex backtracks the most on them
+PATTERNS = (
+    'a b c [x] "',
+    ' ] " [',
+    ' [] "',
+    '1 - - [x] "a" 1 1 "',
+    'a b [c] "d" 2 3 "',
+)
+
+
+def crafted_lines(max_length: int):
+    lengths = [DEFAULT_MAX_LINE_LENGTH, 595]
+    while lengths[-1] < max_length:
+        lengths.append(lengths[-1] * 4)
+
+    for pattern in PATTERNS:
+        for length in lengths:
+            # lengths include the line break
+            line = (pattern * (length // len(pattern) + 1))[: length - 1]
+            yield line + "\n"
+
+
+def main():
+    max_length = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lines = list(crafted_lines(max_length))
+
+    str_regex = re.compile(LOG_ENTRY_REGEX)
+    bytes_regex = re.compile(LOG_ENTRY_REGEX.encode())
+    parsers = {
+        "regex": get_log_entry_parser(str_regex, USED_FIELDS),
+        "split": get_split_log_entry_parser(str_regex, USED_FIELDS),
+    }
+
+    with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as f:
+        f.write("".join(lines))
+    try:
+        with MappedLog(f.name) as log:
+            spans = list(log.spans())
+            mapped_parsers = {
+                "regex -m": get_mapped_log_entry_parser(bytes_regex, log, USED_FIELDS),
+                "split -m": get_mapped_split_log_entry_parser(
+                    bytes_regex, log, USED_FIELDS
+                ),
+            }
+
+            slowest = {}
+            for name, parser in parsers.items():
+                slowest[name] = max(_time(parser, line) for line in lines)
+            for name, parser in mapped_parsers.items():
+                slowest[name] = max(_time(parser, *span) for span in spans)
+    finally:
+        os.remove(f.name)
+
+    print(f"lines: {len(lines)}, max length: {max(map(len, lines))}")
+    for name, seconds in slowest.items():
+        print(f"{name}: slowest line {seconds * 1000:.1f} ms")
+    assert max(slowest.values()) < MAX_SECONDS, "a crafted line slows down parsing"
+
+
+def _time(parser, *args) -> float:
+    start = time.perf_counter()
+    parser(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
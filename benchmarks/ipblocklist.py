@@ -0,0 +1,80 @@
+"""Benchmark of `logs.helpers.ipaddr.IpBlocklist`
+
+Builds a blocklist of random IPv4 and IPv6 networks in CIDR notation
+(100 000 by default) and measures the time of building it
+and of looking up distinct and repeated (memoized) IP addresses,
+the results are checked against `ipaddress`.
+
+Usage: python benchmarks/ipblocklist.py [<networks> [<lookups>]]
+"""
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logs.helpers.ipaddr import IpBlocklist  # noqa: E402
+
+IPV6_SHARE = 0.25  # share of IPv6 networks and looked up addresses
+CHECKED = 100  # number of lookups checked against `ipaddress`
+REPEATED = 10000  # number of distinct addresses of repeated lookups
+
+
+def random_network(rng: random.Random) -> str:
+    if rng.random() < IPV6_SHARE:
+        prefix = rng.randint(32, 128)
+        return str(ipaddress.IPv6Network((rng.getrandbits(128), prefix), strict=False))
+
+    prefix = rng.randint(16, 32)
+    return str(ipaddress.IPv4Network((rng.getrandbits(32), prefix), strict=False))
+
+
+def random_address(rng: random.Random, networks) -> str:
+    if rng.random() < 0.5:
+        # an address inside of a listed network
+        net = ipaddress.ip_network(rng.choice(networks))
+        return str(net.network_address + rng.randrange(net.num_addresses))
+    if rng.random() < IPV6_SHARE:
+        return str(ipaddress.IPv6Address(rng.getrandbits(128)))
+    return str(ipaddress.IPv4Address(rng.getrandbits(32)))
+
+
+def main(networks_num: int = 100000, lookups_num: int = 200000) -> None:
+    rng = random.Random(0)
+    networks = [random_network(rng) for _ in range(networks_num)]
+    addresses = [random_address(rng, networks) for _ in range(lookups_num)]
+
+    start = time.perf_counter()
+    blocklist = IpBlocklist(networks)
+    build = time.perf_counter() - start
+    print(f"build: {networks_num} networks in {build:.2f} s, {len(blocklist)} ranges")
+
+    start = time.perf_counter()
+    found = sum(addr in blocklist for addr in addresses)
+    distinct = time.perf_counter() - start
+    print(
+        f"distinct lookups: {1e6 * distinct / lookups_num:.2f} us/lookup, "
+        f"{found} of {lookups_num} found"
+    )
+
+    # logs contain the same addresses many times
+    repeated_addresses = [addresses[i % REPEATED] for i in range(lookups_num)]
+    blocklist = IpBlocklist(networks)
+    start = time.perf_counter()
+    for addr in repeated_addresses:
+        addr in blocklist
+    repeated = time.perf_counter() - start
+    print(f"repeated lookups: {1e6 * repeated / lookups_num:.2f} us/lookup")
+
+    parsed = [ipaddress.ip_network(net) for net in networks]
+    for addr in addresses[:CHECKED]:
+        ip = ipaddress.ip_address(addr)
+        expected = any(ip.version == net.version and ip in net for net in parsed)
+        assert (addr in blocklist) == expected, addr
+    print(f"checked {CHECKED} lookups against ipaddress")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
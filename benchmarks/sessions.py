@@ -0,0 +1,119 @@
+"""Benchmark of adding parsed log entries to statistics
+
+Adds entries of a few hundred IP addresses to `LogStats`
+by `logs.statistics.processing.process_entries`, measures the time
+per entry and checks with `tracemalloc` that no memory is allocated
+by the session checks of the entries, i.e. the session gaps are compared
+in epoch seconds without `datetime.timedelta` objects. Once the IP addresses,
+days and user agents were seen, the memory allocated for an entry
+is only the `int` objects of the incremented counters.
+
+Usage: python benchmarks/sessions.py [<entries> [<passes>]]
+"""
+import datetime
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logs.parser.logentry import LogEntry  # noqa: E402
+from logs.parser.timestamp import TimestampDecoder  # noqa: E402
+from logs.statistics.constants import OLD_DATE  # noqa: E402
+from logs.statistics.ipstats import IpStats  # noqa: E402
+from logs.statistics.logstats import LogStats  # noqa: E402
+from logs.statistics.processing import (  # noqa: E402
+    SESSION_SECONDS,
+    _ip_stats_add_entry,
+    _log_stats_add_entry,
+    get_daily_stats,
+    process_entries,
+)
+from logs.statistics.uacache import UserAgentCache  # noqa: E402
+
+IPS = 500
+USER_AGENTS = (
+    "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "curl/7.88.1",
+)
+START = datetime.datetime(2023, 10, 10, 8, tzinfo=datetime.timezone.utc)
+
+
+def make_entries(count: int, rng: random.Random):
+    """Returns `count` entries of one day in time order,
+    gaps of an IP address are both shorter and longer than a session"""
+    seconds = sorted(rng.randrange(12 * 3600) for _ in range(count))
+    entries = []
+    for second in seconds:
+        dt = START + datetime.timedelta(seconds=second)
+        entries.append(
+            LogEntry.from_fields(
+                f"10.0.{rng.randrange(IPS) // 256}.{rng.randrange(256)}",
+                "-",
+                "-",
+                dt.strftime("%d/%b/%Y:%H:%M:%S %z"),
+                "GET / HTTP/1.1",
+                "200",
+                "512",
+                "-",
+                rng.choice(USER_AGENTS),
+            )
+        )
+    return entries
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    passes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    entries = make_entries(count, random.Random(1))
+    log_stats = LogStats()
+    ua_cache = UserAgentCache()
+    # the first pass creates IpStats, daily data and cached user agents
+    process_entries(log_stats, [entries], set(), OLD_DATE, ua_cache=ua_cache)
+
+    start = time.perf_counter()
+    for _ in range(passes):
+        process_entries(log_stats, [entries], set(), OLD_DATE, ua_cache=ua_cache)
+    elapsed = time.perf_counter() - start
+
+    decode_time = TimestampDecoder().decode
+    decoded = []
+    for entry in entries:
+        dt, ts = decode_time(entry.time)
+        decoded.append((entry, dt, ts, get_daily_stats(log_stats, dt.date())))
+
+    # memory allocated and freed while an entry is added raises the peak
+    # of traced memory above the memory traced after it was added
+    args = (set(), None, ua_cache)
+    allocated = 0
+    session_allocated = 0
+    tracemalloc.start()
+    for entry, dt, ts, daily_stats in decoded:
+        tracemalloc.reset_peak()
+        _log_stats_add_entry(log_stats, entry, dt, ts, daily_stats, *args)
+        current, peak = tracemalloc.get_traced_memory()
+        allocated += peak - current
+
+        # counters greater than 256 are new `int` objects,
+        # small counters are cached, so only the session check is measured
+        ip_stat = IpStats(entry.ip_addr)
+        ip_stat.datetime, ip_stat.timestamp = dt, ts - SESSION_SECONDS / 2
+        tracemalloc.reset_peak()
+        _ip_stats_add_entry(ip_stat, dt, ts)
+        current, peak = tracemalloc.get_traced_memory()
+        session_allocated += peak - current
+    tracemalloc.stop()
+
+    print(f"entries: {count}, IP addresses: {IPS}")
+    print(f"time per entry: {elapsed / passes / count * 1e6:.2f} us")
+    print(f"allocated per entry (counters): {allocated / count:.1f} B")
+    print(f"allocated by session checks: {session_allocated} B")
+    assert session_allocated == 0, "memory is allocated by session checks"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,58 @@
+import glob
 import sys
+from contextlib import ExitStack, closing
 from optparse import OptionParser
-from typing import List
+from typing import ContextManager, Iterable, List, Optional, Set, Tuple
+from logs.helpers.dns import (
+    DEFAULT_DNS_BUDGET,
+    DEFAULT_DNS_TIMEOUT,
+    DEFAULT_DNS_WORKERS,
+)
 from logs.helpers.simplelogger import SimpleLogger
+from logs.parser.extsort import (
+    DEFAULT_MEMORY_BUDGET,
+    is_log_sorted,
+    sort_lines,
+    sorted_log_lines,
+)
+from logs.parser.logfile import (
+    DECODINGS,
+    DEFAULT_DECODING,
+    MappedLog,
+    detect_compression,
+    find_resume_offset,
+    find_years_range,
+    open_log,
+    read_lines,
+)
+from logs.parser.logformat import LOG_FORMATS
+from logs.parser.logparser import DEFAULT_MAX_LINE_LENGTH, DEFAULT_PARSER, PARSERS
+from logs.parser.rejects import RejectedLines, open_quarantine
+from logs.statistics.botrules import BotRules, load_keywords
 from logs.statistics.dailystat import SimpleDailyStats
+from logs.statistics.dnscache import DEFAULT_DNS_TTL, DEFAULT_NEGATIVE_DNS_TTL
+from logs.statistics.logstats import LogStats
 
 from logs.statistics.overviewpicture import make_pictures
 from logs.statistics.print import make_histogram, print_stats, test_geolocation
+from logs.statistics.geolocapi import (
+    DEFAULT_GEOLOC_WORKERS,
+    GeolocClient,
+    set_default_client,
+)
 from logs.statistics.geolocdb import GeolocDB
+from logs.statistics.geolocplan import plan_geolocation
+from logs.statistics.geolocranges import load_geoloc_ranges
 from logs.statistics.cache import (
     logstats_to_logcache,
     log_stats_from_cache,
     dailydata_to_logcache,
     simple_dailydata_from_logcache,
+    dns_cache_from_logcache,
+    ua_cache_from_logcache,
+    ua_cache_to_logcache,
 )
+from logs.statistics.parallel import make_stats_parallel
 from logs.statistics.processing import (
     load_log_stats,
     make_stats,
@@ -20,6 +60,7 @@ from logs.statistics.processing import (
     save_log_stats,
     group_bots_on_url,
 )
+from logs.statistics.uacache import DEFAULT_UA_CACHE_SIZE, UserAgentCache
 
 
 def main():
@@ -30,6 +71,16 @@ def main():
     log_stats = None
     cached_dailydata = []
 
+    # with -Y only the given years are loaded and processed,
+    # but not when the cache is saved, data of other years would be lost
+    pushdown_years = None
+    if (
+        options.years is not None
+        and options.just_years
+        and (options.cache is None or options.input == ["-"])
+    ):
+        pushdown_years = set(options.years)
+
     # load json or cache
     if options.json_in is not None:
         log_stats = load_log_stats(options.json_in, options.error, logger=logger)
@@ -37,36 +88,125 @@ def main():
     elif options.cache is not None:
         logger.addTask("loading cache")
 
-        log_stats = log_stats_from_cache(base_path=options.cache)
+        log_stats = log_stats_from_cache(base_path=options.cache, years=pushdown_years)
         cached_dailydata = simple_dailydata_from_logcache(base_path=options.cache)
 
         logger.finishTask("loading cache")
 
     # parse and process log from input
-    if options.input != '-':
+    if options.input != ["-"]:
+        ranges = input_ranges(options, log_stats, pushdown_years, logger)
+        max_line_length = options.max_line_length or None
+        rejects = RejectedLines(
+            None if options.quarantine is None else open_quarantine(options.quarantine),
+            options.quarantine_sample,
+        )
+        bot_rules = BotRules(
+            keywords=load_keywords(options.bot_keywords),
+            profile=options.profile_bot_rules,
+        )
+        ua_cache = (
+            UserAgentCache(options.ua_cache_size, bot_rules)
+            if options.cache is None
+            else ua_cache_from_logcache(
+                base_path=options.cache,
+                max_size=options.ua_cache_size,
+                rules=bot_rules,
+            )
+        )
+
         if options.input is None:
             log_stats = make_stats(
-                sys.stdin, config_f=options.bot_config, logger=logger, cached_log_stats=log_stats
+                sys.stdin
+                if not options.sort
+                else sort_lines(sys.stdin, options.sort_memory << 20, logger=logger),
+                config_f=options.bot_config,
+                logger=logger,
+                cached_log_stats=log_stats,
+                parser=options.parser,
+                years=pushdown_years,
+                log_format=options.log_format,
+                max_line_length=max_line_length,
+                rejects=rejects,
+                columnar=options.columnar,
+                ua_cache=ua_cache,
+            )
+        elif (
+            options.workers > 1
+            and len(options.input) == 1
+            and detect_compression(options.input[0]) is None
+            and (not options.sort or is_log_sorted(options.input[0]))
+        ):
+            log_stats = make_stats_parallel(
+                options.input[0],
+                options.workers,
+                config_f=options.bot_config,
+                logger=logger,
+                cached_log_stats=log_stats,
+                parser=options.parser,
+                offset=ranges[0][0],
+                end=ranges[0][1],
+                years=pushdown_years,
+                log_format=options.log_format,
+                decoding=options.decoding if options.mmap else None,
+                max_line_length=max_line_length,
+                rejects=rejects,
+                columnar=options.columnar,
+                ua_cache=ua_cache,
             )
         else:
-            with open(options.input, "r") as input_f:
+            with ExitStack() as stack:
+                inputs = [
+                    stack.enter_context(open_input(path, start, end, options, logger))
+                    for path, (start, end) in zip(options.input, ranges)
+                ]
                 log_stats = make_stats(
-                    input_f, config_f=options.bot_config, logger=logger, cached_log_stats=log_stats
+                    inputs if len(inputs) > 1 else inputs[0],
+                    config_f=options.bot_config,
+                    logger=logger,
+                    cached_log_stats=log_stats,
+                    parser=options.parser,
+                    years=pushdown_years,
+                    log_format=options.log_format,
+                    max_line_length=max_line_length,
+                    rejects=rejects,
+                    columnar=options.columnar,
+                    ua_cache=ua_cache,
                 )
+
+        if rejects.quarantine is not None:
+            rejects.quarantine.close()
+    # DNS lookups are cached together with the log cache
+    dns_cache = None
+    if options.cache is not None:
+        dns_cache = dns_cache_from_logcache(
+            base_path=options.cache,
+            ttl=options.dns_ttl * 3600,
+            negative_ttl=options.dns_negative_ttl * 3600,
+        )
+
     # fix nonvalid ips
-    resolve_and_group_ips(log_stats, ip_map={}, logger=logger)
+    resolve_and_group_ips(
+        log_stats,
+        ip_map={},
+        logger=logger,
+        dns_workers=options.dns_workers,
+        dns_timeout=options.dns_timeout or None,
+        dns_cache=dns_cache,
+    )
 
     # save to json or cache
     if options.json_out is not None:
         save_log_stats(log_stats, options.json_out, logger=logger)
 
-    if options.cache is not None and options.input != '-':
+    if options.cache is not None and options.input != ["-"]:
         logger.addTask("saving cache")
 
         logstats_to_logcache(log_stats, base_path=options.cache)
         dailydata_to_logcache(
             log_stats.daily_data, cached_dailydata, base_path=options.cache
         )
+        ua_cache_to_logcache(ua_cache, base_path=options.cache)
         logger.finishTask("saving cache")
     
     if options.group_url:
@@ -79,8 +219,31 @@ def main():
     years = sorted(years)
 
     geoloc_db = None if options.geoloc_db is None else GeolocDB(options.geoloc_db)
+    geoloc_provider = None
+    if options.geoloc_ranges is not None:
+        logger.addTask("loading geolocation ranges")
+        geoloc_provider = load_geoloc_ranges(options.geoloc_ranges)
+        logger.finishTask("loading geolocation ranges")
+    geoloc_client = GeolocClient(workers=options.geoloc_workers)
+    set_default_client(geoloc_client)
     selected = True
 
+    # geolocate IPs of all outputs at once, each IP only once
+    if options.hist:
+        test_year = max(log_stats.year_stats.keys(), default=log_stats.current_year)
+    else:
+        test_year = years[-1] if years else log_stats.current_year
+
+    geoloc_plan = plan_geolocation(
+        log_stats,
+        years,
+        options.geoloc_sample,
+        test_year=test_year,
+        test_repetitions=options.test,
+        histogram_years=log_stats.year_stats.keys() if options.hist else (),
+    )
+    geoloc_plan.resolve(geoloc_db, geoloc_provider, geoloc_client, logger)
+
     # generate htmls for years
     logger.addTask("creating output html files")
 
@@ -96,6 +259,12 @@ def main():
                 display_overview_imgs=True,
                 logger=logger,
                 log_name=options.name,
+                dns_cache=dns_cache,
+                dns_workers=options.dns_workers,
+                dns_timeout=options.dns_timeout or None,
+                dns_budget=options.dns_budget or None,
+                geoloc_provider=geoloc_provider,
+                geoloc_sample=geoloc_plan.samples.get(year),
             )
 
     # Generate index html
@@ -133,9 +302,22 @@ def main():
                 geoloc_sample_size=options.geoloc_sample,
                 selected=selected,
                 repetitions=options.test,
+                year=test_year,
                 geoloc_db=geoloc_db,
+                geoloc_provider=geoloc_provider,
+                samples=geoloc_plan.test_samples,
+                logger=logger,
             )
-    
+
+    if geoloc_provider is not None:
+        geoloc_provider.close()
+    if geoloc_client.requests:
+        logger.logMessage(geoloc_client.summary())
+
+    if dns_cache is not None:
+        logger.logMessage(dns_cache.summary())
+        dns_cache.close()
+
     logger.finishTask("Logs.py")
 
 
@@ -180,17 +362,163 @@ def parse_options():
     parser.add_option(
         "-i",
         "--input",
-        action="store",
+        action="append",
         type="str",
         dest="input",
         default=None,
         help="Specify the path to input log file which will be procces; "
-        "if not specified, standar input will be taken as input."
+        "if not specified, standar input will be taken as input. "
+        "The file can be compressed by gzip, bzip2 or xz. "
+        "The option can be repeated and the path can be a glob pattern, "
+        "e.g. 'access.log*', then entries of all the files "
+        "are merged in their time order. "
         "When equal to '-' no input is will be parsed, "
         "only data from cache of json might be used."
         "When used together with -l, --load or -c, --cache options, "
         "only entries older than loaded timestamp will be proccessed.",
     )
+    parser.add_option(
+        "-p",
+        "--parser",
+        action="store",
+        type="choice",
+        choices=list(PARSERS),
+        dest="parser",
+        default=DEFAULT_PARSER,
+        help="Specify the parser engine for the input log: "
+        "'regex' matches each line with a regular expression, "
+        "'split' splits lines on field delimiters and uses the regex only "
+        "for unusual lines. Both give the same results. Default is 'regex'.",
+    )
+    parser.add_option(
+        "-f",
+        "--log_format",
+        action="store",
+        type="str",
+        dest="log_format",
+        default=None,
+        help="Specify the format of the input log as Apache LogFormat string, "
+        "e.g. '%h %l %u %t \"%r\" %>s %b \"%{User-agent}i\"', "
+        "or as a name of predefined format: "
+        f"{', '.join(LOG_FORMATS)}. "
+        "The log is then parsed by a parser compiled for the format "
+        "instead of the engine given by -p, --parser option. "
+        "If not specified, Combined Log Format is expected.",
+    )
+    parser.add_option(
+        "-w",
+        "--workers",
+        action="store",
+        type="int",
+        dest="workers",
+        default=1,
+        help="Specify the number of worker processes for parsing the input log. "
+        "When greater than 1, the input file is split into parts "
+        "which are parsed and processed in parallel. "
+        "Works only with single uncompressed input file given by -i, --input option, "
+        "not with standard input.",
+    )
+    parser.add_option(
+        "--columnar",
+        action="store_true",
+        dest="columnar",
+        default=False,
+        help="Process the parsed log entries in batches by numpy "
+        "instead of one by one. Gives the same results.",
+    )
+    parser.add_option(
+        "-m",
+        "--mmap",
+        action="store_true",
+        dest="mmap",
+        default=False,
+        help="Read uncompressed input files in binary mode by memory-mapping them. "
+        "Only the fields used for the statistics are decoded "
+        "and bytes which can not be decoded do not abort the parsing, "
+        "see --decoding option.",
+    )
+    parser.add_option(
+        "--decoding",
+        action="store",
+        type="choice",
+        choices=list(DECODINGS),
+        dest="decoding",
+        default=DEFAULT_DECODING,
+        help="Specify how the fields are decoded with -m, --mmap option: "
+        "'replace' decodes UTF-8 and replaces invalid bytes by U+FFFD, "
+        "'surrogateescape' decodes UTF-8 and keeps invalid bytes as surrogates, "
+        "'latin-1' decodes each byte as a Latin-1 character. "
+        f"Default is '{DEFAULT_DECODING}'.",
+    )
+    parser.add_option(
+        "-S",
+        "--sort",
+        action="store_true",
+        dest="sort",
+        default=False,
+        help="Sort the input log entries by their time before processing. "
+        "Use for logs which are not time ordered, e.g. from load balancers. "
+        "The order is checked while the input is read, already ordered "
+        "input is not sorted.",
+    )
+    parser.add_option(
+        "--sort_memory",
+        action="store",
+        type="int",
+        dest="sort_memory",
+        default=DEFAULT_MEMORY_BUDGET >> 20,
+        help="Specify the approximate memory in MiB used for sorting "
+        "by -S, --sort option, "
+        "larger inputs are sorted in parts stored in temporary files. "
+        f"Default is {DEFAULT_MEMORY_BUDGET >> 20}.",
+    )
+    parser.add_option(
+        "--no_seek",
+        action="store_false",
+        dest="seek",
+        default=True,
+        help="Disable seeking in the input files. "
+        "By default, when statistics are loaded by -c, --cache or -l, --load option, "
+        "the first entry newer than the loaded timestamp is binary searched "
+        "in uncompressed input files, so older entries are not read at all, "
+        "and similarly the input files are sliced to the years given by -Y option. "
+        "Use this option for input files which are not ordered by time.",
+    )
+    parser.add_option(
+        "--max_line_length",
+        action="store",
+        type="int",
+        dest="max_line_length",
+        default=DEFAULT_MAX_LINE_LENGTH,
+        help="Specify the maximal length of input log lines "
+        "which are matched by the regular expression of -p, --parser option. "
+        "All lines are parsed in linear time as by -f combined option "
+        "and their fields are validated as by the regular expression at first, "
+        "only the lines which are not valid are matched by the regular "
+        "expression, so that malformed lines can not slow down the parsing. "
+        f"Value 0 means no limit. Default is {DEFAULT_MAX_LINE_LENGTH}.",
+    )
+    parser.add_option(
+        "-q",
+        "--quarantine",
+        action="store",
+        type="str",
+        dest="quarantine",
+        default=None,
+        help="Specify the path to a file where rejected input log lines are written, "
+        "i.e. lines which can not be parsed or which have invalid time. "
+        "Numbers of rejected lines by the reason are logged by -e, --error option.",
+    )
+    parser.add_option(
+        "--quarantine_sample",
+        action="store",
+        type="int",
+        dest="quarantine_sample",
+        default=1,
+        help="Write only the first and then every N-th rejected line "
+        "of each reason into the file given by -q, --quarantine option. "
+        "Default is 1, all rejected lines are written.",
+    )
     parser.add_option(
         "-n",
         "--name",
@@ -238,9 +566,94 @@ def parse_options():
         dest="bot_config",
         default=None,
         help="Specify the path of the bot configuration file. "
-        "That is plain text file, containing just an IPv4 on each line."
+        "That is plain text file, containing just an IPv4 or IPv6 address "
+        "or a network in CIDR notation (e.g. 10.0.0.0/8) on each line, "
+        "lines starting with # are skipped. "
         "Ip addresses from the config file will be clasified as bots.",
     )
+    parser.add_option(
+        "--bot_keywords",
+        action="store",
+        type="str",
+        dest="bot_keywords",
+        default=None,
+        help="Specify the path of a file with bot keywords. "
+        "That is plain text file, containing just a keyword on each line. "
+        "Entries with User agent containing a keyword will be clasified as bots.",
+    )
+    parser.add_option(
+        "--profile_bot_rules",
+        action="store_true",
+        dest="profile_bot_rules",
+        default=False,
+        help="Measure matching time of each User agent rule of bot classification "
+        "separately and of the IP addresses of -b, --bot_config option, "
+        "the times are logged by -e, --error option. "
+        "This makes the classification slower.",
+    )
+    parser.add_option(
+        "--ua_cache_size",
+        action="store",
+        type="int",
+        dest="ua_cache_size",
+        default=DEFAULT_UA_CACHE_SIZE,
+        help="Specify the maximal number of user agents "
+        "whose bot classification is cached, the least recently used are evicted. "
+        "With -c, --cache option the classifications are also saved to the cache "
+        "and loaded by the next run, unless the bot regexes have changed. "
+        f"Default is {DEFAULT_UA_CACHE_SIZE}.",
+    )
+    parser.add_option(
+        "--dns_workers",
+        action="store",
+        type="int",
+        dest="dns_workers",
+        default=DEFAULT_DNS_WORKERS,
+        help="Specify the number of concurrent DNS lookups "
+        "of host names found instead of IP addresses in the log. "
+        f"Default is {DEFAULT_DNS_WORKERS}.",
+    )
+    parser.add_option(
+        "--dns_timeout",
+        action="store",
+        type="float",
+        dest="dns_timeout",
+        default=DEFAULT_DNS_TIMEOUT,
+        help="Specify the number of seconds after which a DNS lookup is abandoned "
+        "and the host name is considered unresolved. Value 0 means no limit. "
+        f"Default is {DEFAULT_DNS_TIMEOUT}.",
+    )
+    parser.add_option(
+        "--dns_budget",
+        action="store",
+        type="float",
+        dest="dns_budget",
+        default=DEFAULT_DNS_BUDGET,
+        help="Specify the number of seconds after which unfinished DNS lookups "
+        "of host names in most frequent tables of one year are abandoned "
+        "and the host names are displayed as Unknown. Value 0 means no limit. "
+        f"Default is {DEFAULT_DNS_BUDGET}.",
+    )
+    parser.add_option(
+        "--dns_ttl",
+        action="store",
+        type="float",
+        dest="dns_ttl",
+        default=DEFAULT_DNS_TTL / 3600,
+        help="Specify the number of hours for which results of DNS lookups "
+        "are kept in the cache given by -c, --cache option. "
+        f"Default is {DEFAULT_DNS_TTL // 3600}.",
+    )
+    parser.add_option(
+        "--dns_negative_ttl",
+        action="store",
+        type="float",
+        dest="dns_negative_ttl",
+        default=DEFAULT_NEGATIVE_DNS_TTL / 3600,
+        help="Specify the number of hours for which failed DNS lookups "
+        "are kept in the cache given by -c, --cache option. "
+        f"Default is {DEFAULT_NEGATIVE_DNS_TTL // 3600}.",
+    )
     parser.add_option(
         "-d",
         "--geoloc_database",
@@ -251,6 +664,27 @@ def parse_options():
         help="Specify the path of geolocation database. "
         "This is SQLite database used for saving resolved geolocations",
     )
+    parser.add_option(
+        "--geoloc_ranges",
+        action="store",
+        type="str",
+        dest="geoloc_ranges",
+        default=None,
+        help="Specify the path of CSV file with IP ranges and their countries "
+        "(e.g. DB-IP or IP2Location lite country database) used for geolocation "
+        "instead of the geolocation API. The CSV is compiled into binary file "
+        "with '.bin' suffix next to it, which is reused by next runs.",
+    )
+    parser.add_option(
+        "--geoloc_workers",
+        action="store",
+        type="int",
+        dest="geoloc_workers",
+        default=DEFAULT_GEOLOC_WORKERS,
+        help="Specify the number of concurrent requests to the geolocation API. "
+        "All requests are limited to 3 requests per 2 seconds together. "
+        f"Default is {DEFAULT_GEOLOC_WORKERS}.",
+    )
     parser.add_option(
         "-y",
         "--year",
@@ -272,7 +706,9 @@ def parse_options():
         default=False,
         help="Restrict to given years also the content of "
         "the general index html and general overview pictures. "
-        "To specify the years use -y, --year option.",
+        "To specify the years use -y, --year option. "
+        "Unless the cache is saved, only the given years are also loaded "
+        "from the cache and processed from the input.",
     )
     parser.add_option(
         "-H",
@@ -343,8 +779,77 @@ def parse_options():
     
 
     options, _ = parser.parse_args()
+    if options.input is not None:
+        options.input = expand_input_paths(options.input)
+
     return options
 
 
+def input_ranges(
+    options,
+    log_stats: Optional[LogStats],
+    years: Optional[Set[int]],
+    logger: Optional[SimpleLogger],
+) -> List[Tuple[int, Optional[int]]]:
+    """Returns byte ranges `(<start>, <end>)` in which the input files should be read,
+    `end` is `None` for reading to the end of file.
+
+    In uncompressed files, if `log_stats` were loaded, then entries older
+    than `log_stats.last_entry_ts` are skipped by seeking
+    and if `years` are given, then the files are sliced to these years.
+    """
+    if options.input is None:
+        return []
+
+    ranges = []
+    for path in options.input:
+        start, end = 0, None
+
+        if options.seek and not options.sort and detect_compression(path) is None:
+            if log_stats is not None:
+                start = find_resume_offset(path, log_stats.last_entry_ts, logger=logger)
+            if years is not None:
+                years_start, years_end = find_years_range(path, years, logger=logger)
+                start = max(start, years_start)
+                end = max(start, years_end)
+
+        ranges.append((start, end))
+
+    return ranges
+
+
+def open_input(
+    path: str,
+    start: int,
+    end: Optional[int],
+    options,
+    logger: Optional[SimpleLogger],
+) -> ContextManager[Iterable[str]]:
+    """Opens input log file with `path` for reading lines
+    in byte range from `start` to `end` (see `input_ranges`)
+    as required by `options`"""
+    if options.sort:
+        return closing(sorted_log_lines(path, options.sort_memory << 20, logger=logger))
+
+    if options.mmap and detect_compression(path) is None:
+        return MappedLog(path, start, end, options.decoding)
+
+    if end is None:
+        return open_log(path, offset=start)
+
+    return closing(read_lines(path, start, end))
+
+
+def expand_input_paths(patterns: List[str]) -> List[str]:
+    """Expands glob `patterns` into sorted paths,
+    patterns without any matching file are kept as they are"""
+    paths = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern)) if pattern != "-" else []
+        paths.extend(matched if matched else [pattern])
+
+    return paths
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,168 @@
+import queue
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+DEFAULT_DNS_WORKERS = 32
+DEFAULT_DNS_TIMEOUT = 5.0
+DEFAULT_DNS_BUDGET = 10.0
+
+
+def resolve_concurrently(
+    keys: Iterable[str],
+    resolve: Callable[[str], str],
+    workers: int = DEFAULT_DNS_WORKERS,
+    timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+    budget: Optional[float] = None,
+) -> Dict[str, Optional[str]]:
+    """Calls `resolve` on distinct `keys` in at most `workers` threads
+
+    Blocking resolver calls can not be interrupted, so a lookup
+    taking longer than `timeout` seconds is abandoned, its thread
+    is left running as a daemon and a new thread takes its place
+    only if there are less than `workers` threads.
+    When the function returns, the threads stop after their current
+    lookup, so no lookups are made for the caller which has not waited.
+
+    Parameters
+    ----------
+    keys: Iterable[str]
+        e.g. host names or IP addresses
+    resolve: Callable[[str], str]
+        blocking lookup of a key, which raises an exception if it fails
+    workers: int, optional
+        default: `32`; number of concurrent lookups
+    timeout: float, optional
+        default: `5.0`; maximal duration of a lookup in seconds,
+        `None` means no limit
+    budget: float, optional
+        default: `None`; if given then lookups not finished
+        in `budget` seconds in total are abandoned
+
+    Returns
+    -------
+    Dict[str, Optional[str]]
+        maps each of `keys` to the result of `resolve`,
+        or to `None` if the lookup failed or was abandoned
+    """
+    keys = list(dict.fromkeys(keys))
+    results: Dict[str, Optional[str]] = {}
+    if not keys:
+        return results
+
+    tasks: "queue.Queue[str]" = queue.Queue()
+    for key in keys:
+        tasks.put(key)
+    done: queue.Queue = queue.Queue()
+    started: Dict[str, float] = {}
+    stop = threading.Event()
+    lock = threading.Lock()
+    workers = max(workers, 1)
+    threads = 0  # running threads, including the abandoned ones
+
+    def work():
+        nonlocal threads
+        try:
+            while not stop.is_set():
+                try:
+                    key = tasks.get_nowait()
+                except queue.Empty:
+                    return
+
+                started[key] = time.monotonic()
+                try:
+                    value = resolve(key)
+                except Exception:
+                    value = None
+                done.put((key, value))
+        finally:
+            with lock:
+                threads -= 1
+
+    def add_worker():
+        nonlocal threads
+        with lock:
+            if threads >= workers:
+                return
+            threads += 1
+        threading.Thread(target=work, daemon=True).start()
+
+    for _ in range(min(workers, len(keys))):
+        add_worker()
+
+    deadline = None if budget is None else time.monotonic() + budget
+    try:
+        while len(results) < len(keys):
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+
+            # wake up at the nearest timeout of a running lookup
+            wait = None if deadline is None else deadline - now
+            if timeout is not None:
+                running = [t for key, t in list(started.items()) if key not in results]
+                nearest = min(running, default=now) + timeout - now
+                wait = nearest if wait is None else min(wait, nearest)
+
+            try:
+                key, value = done.get(timeout=None if wait is None else max(wait, 0.0))
+                if key not in results:
+                    results[key] = value
+            except queue.Empty:
+                if timeout is None:
+                    continue  # the budget is checked at the beginning
+                now = time.monotonic()
+                for key, t in list(started.items()):
+                    if key not in results and now - t >= timeout:
+                        results[key] = None  # abandoned
+                        add_worker()
+    finally:
+        stop.set()
+
+    return {key: results.get(key) for key in keys}
+
+
+def host_address_of(host: str) -> str:
+    """Returns IPv4 address of `host`, raises `OSError` if it could not be resolved"""
+    return socket.gethostbyname(host)
+
+
+def host_name_of(ip: str) -> str:
+    """Returns host name of `ip` (PTR lookup),
+    raises `OSError` if it could not be resolved"""
+    return socket.gethostbyaddr(ip)[0]
+
+
+def resolve_hosts(
+    hosts: Iterable[str],
+    workers: int = DEFAULT_DNS_WORKERS,
+    timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+) -> Dict[str, Optional[str]]:
+    """Resolves `hosts` to IPv4 addresses concurrently,
+    see `resolve_concurrently`
+
+    Returns
+    -------
+    Dict[str, Optional[str]]
+        maps each host to its IP address, `None` if it could not be resolved
+    """
+    return resolve_concurrently(hosts, host_address_of, workers, timeout)
+
+
+def resolve_addresses(
+    ips: Iterable[str],
+    workers: int = DEFAULT_DNS_WORKERS,
+    timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+    budget: Optional[float] = DEFAULT_DNS_BUDGET,
+) -> Dict[str, Optional[str]]:
+    """Resolves `ips` to host names (PTR lookups) concurrently,
+    see `resolve_concurrently`
+
+    Returns
+    -------
+    Dict[str, Optional[str]]
+        maps each IP address to its host name,
+        `None` if it could not be resolved
+    """
+    return resolve_concurrently(ips, host_name_of, workers, timeout, budget)
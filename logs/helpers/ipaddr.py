@@ -0,0 +1,171 @@
+import ipaddress
+import re
+import socket
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+IPV4 = 4
+IPV6 = 6
+IPV4_MAPPED_PREFIX = 0xFFFF << 32
+
+# host name of labels of letters, digits, hyphens (not at their ends)
+# and underscores, not all labels numeric, optionally ending with a dot
+RE_PATTERN_HOSTNAME = re.compile(
+    r"(?=.{1,253}\.?$)(?![0-9.]+$)"
+    r"(?:[A-Za-z0-9_](?:[A-Za-z0-9_-]{0,61}[A-Za-z0-9_])?\.)*"
+    r"[A-Za-z0-9_](?:[A-Za-z0-9_-]{0,61}[A-Za-z0-9_])?\.?"
+)
+
+
+def ip_to_int(addr: str) -> Optional[Tuple[int, int]]:
+    """Returns `(<version>, <integer value>)` of IP address `addr`,
+    IPv4-mapped IPv6 addresses (e.g. `::ffff:10.0.0.1`) are returned as IPv4,
+    `None` if `addr` is not an IP address"""
+    # `inet_pton` is much faster than `ipaddress` and as strict
+    try:
+        return (IPV4, int.from_bytes(socket.inet_pton(socket.AF_INET, addr), "big"))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        value = int.from_bytes(socket.inet_pton(socket.AF_INET6, addr), "big")
+    except (OSError, ValueError):
+        return None
+
+    if value >> 32 == 0xFFFF:
+        return (IPV4, value - IPV4_MAPPED_PREFIX)
+    return (IPV6, value)
+
+
+def int_to_ip(version: int, value: int) -> str:
+    """Returns canonical string of IP address
+    with `version` and integer `value`, see `ip_to_int`"""
+    if version == IPV4:
+        return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, "big"))
+    return str(ipaddress.IPv6Address(value))
+
+
+def canonical_ip(addr: str) -> Optional[str]:
+    """Returns canonical form of IP address `addr`, i.e. lowercase
+    compressed IPv6 (e.g. `2001:db8::1` for `2001:DB8:0:0::1`)
+    or IPv4 (also for IPv4-mapped IPv6 addresses),
+    `None` if `addr` is not an IP address"""
+    ip = ip_to_int(addr)
+    if ip is None:
+        return None
+
+    version, value = ip
+    if version == IPV4 and "." in addr and ":" not in addr:
+        return addr  # dotted decimal accepted by `inet_pton` is canonical
+    return int_to_ip(version, value)
+
+
+def is_hostname(name: str) -> bool:
+    """Tests if `name` is syntactically valid host name,
+    which is worth a DNS lookup"""
+    return RE_PATTERN_HOSTNAME.fullmatch(name) is not None
+
+
+def network_to_range(network: str) -> Optional[Tuple[int, int, int]]:
+    """Returns `(<version>, <first address>, <last address>)` of `network`
+    in CIDR notation (e.g. `10.0.0.0/8`) or of single IP address
+    as integers, host bits of the network are ignored,
+    `None` if `network` is not a network or IP address"""
+    try:
+        net = ipaddress.ip_network(network, strict=False)
+    except ValueError:
+        return None
+
+    if net.version == IPV6 and net.prefixlen >= 96:
+        mapped = net.network_address.ipv4_mapped
+        if mapped is not None:
+            # IPv4-mapped networks are looked up as IPv4
+            first = int(mapped)
+            return (IPV4, first, first + net.num_addresses - 1)
+
+    return (net.version, int(net.network_address), int(net.broadcast_address))
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    """Merges overlapping and adjacent ranges `(<first>, <last>)`
+
+    Returns
+    -------
+    Tuple[List[int], List[int]]
+        `(<firsts>, <lasts>)` of disjoint ranges sorted by their firsts
+    """
+    firsts: List[int] = []
+    lasts: List[int] = []
+
+    for first, last in sorted(ranges):
+        if lasts and first <= lasts[-1] + 1:
+            if last > lasts[-1]:
+                lasts[-1] = last
+        else:
+            firsts.append(first)
+            lasts.append(last)
+
+    return (firsts, lasts)
+
+
+class IpBlocklist:
+    """Collection of IPv4 and IPv6 networks and addresses
+    supporting `in` operator for IP address strings.
+
+    Networks are stored as sorted tables of disjoint ranges
+    of integer addresses for each IP version,
+    an address is looked up by binary search in O(log n).
+    Items which are not networks (e.g. host names) are matched exactly.
+    Last `memo_size` looked up addresses are memoized,
+    as logs contain the same addresses many times.
+    """
+
+    __slots__ = ("memo_size", "_ranges", "_names", "_memo", "_length")
+
+    def __init__(self, items: Iterable[str] = (), memo_size: int = 65536):
+        ranges: Dict[int, List[Tuple[int, int]]] = {IPV4: [], IPV6: []}
+        self.memo_size = memo_size
+        self._names: Set[str] = set()
+        self._memo: Dict[str, bool] = {}
+
+        for item in items:
+            network = network_to_range(item)
+            if network is None:
+                self._names.add(item)
+            else:
+                version, first, last = network
+                ranges[version].append((first, last))
+
+        self._ranges = {version: merge_ranges(r) for version, r in ranges.items()}
+        self._length = len(self._names) + sum(
+            len(firsts) for firsts, _ in self._ranges.values()
+        )
+
+    def __len__(self) -> int:
+        """Returns the number of disjoint ranges and exactly matched items"""
+        return self._length
+
+    def __contains__(self, addr: str) -> bool:
+        found = self._memo.get(addr)
+        if found is None:
+            found = self._lookup(addr)
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[addr] = found
+
+        return found
+
+    def _lookup(self, addr: str) -> bool:
+        if not self._length:
+            return False
+        if addr in self._names:
+            return True
+
+        ip = ip_to_int(addr)
+        if ip is None:
+            return False
+
+        version, value = ip
+        firsts, lasts = self._ranges[version]
+        i = bisect_right(firsts, value) - 1
+        return i >= 0 and value <= lasts[i]
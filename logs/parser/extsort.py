@@ -0,0 +1,211 @@
+import heapq
+import tempfile
+from contextlib import ExitStack
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from logs.helpers.simplelogger import SimpleLogger
+from logs.parser.logfile import open_log
+from logs.parser.timestamp import TimestampDecoder, find_timestamp
+
+DEFAULT_MEMORY_BUDGET = 256 << 20  # 256 MiB
+LINE_OVERHEAD = 100
+# approximate memory taken by one buffered line besides its characters
+
+SortKey = Callable[[str], float]
+
+
+def get_line_key() -> SortKey:
+    """Returns function which returns unix timestamp of log line
+    for sorting the lines by their time.
+
+    The timestamp is found by `find_timestamp`.
+    Lines without a valid timestamp get the timestamp of the previous line,
+    so they stay next to it.
+    """
+    decode_time = TimestampDecoder().decode
+    last_ts = float("-inf")
+
+    def line_key(line: str) -> float:
+        nonlocal last_ts
+
+        timestamp = find_timestamp(line)
+        if timestamp is not None:
+            try:
+                _, last_ts = decode_time(timestamp)
+            except ValueError:
+                pass
+
+        return last_ts
+
+    return line_key
+
+
+def is_sorted(lines: Iterable[str]) -> bool:
+    """Returns whether `lines` of log are ordered by their time,
+    stops reading `lines` on the first line out of order"""
+    line_key = get_line_key()
+    last_ts = float("-inf")
+
+    for line in lines:
+        ts = line_key(line)
+        if ts < last_ts:
+            return False
+        last_ts = ts
+
+    return True
+
+
+def is_log_sorted(path: str) -> bool:
+    """Returns whether lines of log file with `path` are ordered by their time,
+    see `is_sorted`"""
+    with open_log(path) as f:
+        return is_sorted(f)
+
+
+def sort_lines(
+    lines: Iterable[str],
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    tmp_dir: Optional[str] = None,
+    logger: Optional[SimpleLogger] = None,
+    reread: Optional[Callable[[], TextIO]] = None,
+) -> Iterator[str]:
+    """Yields `lines` of log ordered by their time.
+
+    Lines are read into memory until they take approximately `memory_budget`
+    bytes, then they are sorted and spilled into a temporary file (a run).
+    The runs are merged while the lines are yielded.
+    The sort is stable, lines with the same time keep their order.
+
+    The order is checked while the lines are read, the ordered beginning
+    of `lines` (up to the first line out of order) is the first run.
+    If `lines` are ordered and fit into the memory budget,
+    they are yielded without any sorting or temporary files.
+
+    Parameters
+    ----------
+    lines: Iterable[str]
+    memory_budget: int, optional
+        default: 256 MiB; approximate memory used for buffered lines
+    tmp_dir: str, optional
+        default: `None`; directory of temporary files,
+        if `None`, the default temporary directory is used
+    logger: SimpleLogger, optional
+        default: `None`; if given, then whether `lines` were ordered
+        and the number of spilled runs are logged
+    reread: Callable[[], TextIO], optional
+        default: `None`; if given, then it opens `lines` again,
+        the ordered beginning of `lines` larger than the memory budget
+        is not spilled, but read again from the file opened by `reread`
+    """
+    line_key = get_line_key()
+    by_key = itemgetter(0)
+    runs: List[TextIO] = []
+    buffer: List[Tuple[float, str]] = []
+    size = 0
+    ordered = True
+    last_ts = float("-inf")
+    prefix = 0  # lines of the ordered beginning, which are read again
+
+    try:
+        for line in lines:
+            ts = line_key(line)
+            if ordered:
+                if ts >= last_ts:
+                    last_ts = ts
+                    if prefix:
+                        prefix += 1
+                        continue
+                else:
+                    ordered = False
+
+            buffer.append((ts, line))
+            size += len(line) + LINE_OVERHEAD
+
+            if size >= memory_budget:
+                if ordered and reread is not None:
+                    prefix = len(buffer)
+                else:
+                    buffer.sort(key=by_key)
+                    runs.append(_spill_run(buffer, tmp_dir))
+                buffer = []
+                size = 0
+
+        if logger is not None:
+            logger.logMessage(
+                f"log is {'already' if ordered else 'not'} ordered by time"
+            )
+
+        if ordered and prefix:
+            with reread() as f:
+                yield from islice(f, prefix)
+            return
+
+        buffer.sort(key=by_key)
+
+        if logger is not None and (runs or prefix):
+            logger.logMessage(f"log sorted in {len(runs) + bool(prefix) + 1} runs")
+
+        with ExitStack() as stack:
+            first_run: Iterable[Tuple[float, str]] = ()
+            if prefix:
+                f = stack.enter_context(reread())
+                prefix_key = get_line_key()
+                first_run = ((prefix_key(line), line) for line in islice(f, prefix))
+            # the buffer is the last run, it is merged without spilling;
+            # merge keeps the order of runs for lines with the same time
+            for _, line in heapq.merge(
+                first_run, *map(_read_run, runs), buffer, key=by_key
+            ):
+                yield line
+    finally:
+        for run in runs:
+            run.close()
+
+
+def sorted_log_lines(
+    path: str,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    tmp_dir: Optional[str] = None,
+    logger: Optional[SimpleLogger] = None,
+) -> Iterator[str]:
+    """Yields lines of log file with `path` ordered by their time
+    by `sort_lines`, see its parameters.
+
+    The order is checked while the file is read, an ordered file
+    which fits into the memory budget is read once,
+    the ordered beginning of a larger file is read again instead of being spilled.
+    """
+    if logger is not None:
+        logger.logMessage(f"sorting log '{path}'")
+
+    with open_log(path) as f:
+        yield from sort_lines(
+            f, memory_budget, tmp_dir, logger, reread=lambda: open_log(path)
+        )
+
+
+def _spill_run(buffer: List[Tuple[float, str]], tmp_dir: Optional[str]) -> TextIO:
+    """Writes sorted `buffer` into a new temporary file
+    and returns the file rewound to its beginning"""
+    run = tempfile.TemporaryFile(
+        "w+", encoding="utf-8", errors="surrogateescape", newline="\n", dir=tmp_dir
+    )
+
+    for ts, line in buffer:
+        run.write(repr(ts))
+        run.write("\t")
+        run.write(line)
+        if not line.endswith("\n"):
+            run.write("\n")
+
+    run.seek(0)
+    return run
+
+
+def _read_run(run: TextIO) -> Iterator[Tuple[float, str]]:
+    """Yields pairs `(<unix timestamp>, <line>)` from run written by `_spill_run`"""
+    for record in run:
+        ts, line = record.split("\t", 1)
+        yield (float(ts), line)
@@ -1,5 +1,10 @@
+import mmap
+from typing import Callable, Iterable, Optional, Tuple, Union
+
+
 class LogEntry:
-    """Data structure to store single access log entry"""
+    """Data structure to store single access log entry
+    and the line it was parsed from"""
 
     __slots__ = (
         "ip_addr",
@@ -12,13 +17,45 @@ class LogEntry:
         "referer",
         "user_agent",
         "length",
+        "_line",
     )
 
-    def __init__(self):
+    def __init__(self, line: Optional[Union[str, bytes]] = None):
         self.length = 0
+        self._line = line
+
+    @classmethod
+    def from_fields(
+        cls,
+        ip_addr: str,
+        slot1: str,
+        slot2: str,
+        time: str,
+        request: str,
+        http_code: str,
+        bytes: str,
+        referer: str,
+        user_agent: str,
+        line: Optional[Union[str, bytes]] = None,
+    ) -> "LogEntry":
+        """Returns complete entry (of length 9) with all fields set at once,
+        `line` is the line the fields were parsed from"""
+        entry = cls.__new__(cls)
+        entry.ip_addr = ip_addr
+        entry.slot1 = slot1
+        entry.slot2 = slot2
+        entry.time = time
+        entry.request = request
+        entry.http_code = http_code
+        entry.bytes = bytes
+        entry.referer = referer
+        entry.user_agent = user_agent
+        entry.length = 9
+        entry._line = line
+        return entry
 
     def __str__(self) -> str:
-        content = [getattr(self, self.__slots__[i]) for i in range(self.length)]
+        content = [getattr(self, LogEntry.__slots__[i]) for i in range(self.length)]
         content = ", ".join(content)
         return f"[{content}]"
 
@@ -27,3 +64,142 @@ class LogEntry:
 
     def __len__(self):
         return self.length
+
+    def line(self) -> Union[str, bytes]:
+        """Returns the parsed line, not decoded, the line of entry
+        created without it is made of its fields in Combined Log Format"""
+        if self._line is not None:
+            return self._line
+
+        return (
+            f"{self.ip_addr} {self.slot1} {self.slot2} [{self.time}] "
+            f'"{self.request}" {self.http_code} {self.bytes} '
+            f'"{self.referer}" "{self.user_agent}"\n'
+        )
+
+
+ENTRY_FIELDS = LogEntry.__slots__[:9]
+FIELD_INDEX = {name: i for i, name in enumerate(ENTRY_FIELDS)}
+
+# fields of log entries used for making statistics
+USED_FIELDS = ("ip_addr", "time", "user_agent")
+
+# reasons of rejecting log lines, see `RejectedEntry`
+MALFORMED = "malformed"  # the line does not match the log format
+TOO_LONG = "too long"  # the long line could not be split without regex
+BAD_TIME = "bad time"  # the time of the entry can not be decoded
+REJECT_REASONS = (MALFORMED, TOO_LONG, BAD_TIME)
+
+
+class RejectedEntry(LogEntry):
+    """Empty log entry (of length 0) of a line which could not be parsed,
+    keeps the line and the reason of the rejection,
+    see `logs.parser.rejects.RejectedLines`"""
+
+    __slots__ = ("reason",)
+
+    def __init__(self, line: Union[str, bytes], reason: str = MALFORMED):
+        self.length = 0
+        self._line = line
+        self.reason = reason
+
+
+class MappedLogEntry(LogEntry):
+    """Complete log entry (of length 9) of a line in a buffer,
+    e.g. in a mapped file, which keeps offsets of the line instead of its copy"""
+
+    __slots__ = ("_data", "_start", "_end")
+
+    @classmethod
+    def from_span(
+        cls, data: Union[bytes, mmap.mmap], start: int, end: int, *fields: str
+    ) -> "MappedLogEntry":
+        """Returns entry with `fields` (see `LogEntry.from_fields`)
+        of the line `data[start:end]`"""
+        entry = cls.from_fields(*fields)
+        entry._data = data
+        entry._start = start
+        entry._end = end
+        return entry
+
+    def line(self) -> bytes:
+        """Returns the parsed line, not decoded"""
+        return self._data[self._start : self._end]
+
+
+class LazyLogEntry(LogEntry):
+    """Complete log entry (of length 9) which keeps its parsed line
+    and materializes its fields on their first access.
+
+    Only the fields given on creation are set at once,
+    so unused fields of the line are never sliced.
+    If the line is `bytes`, then the fields are decoded by `decode`.
+    """
+
+    __slots__ = ("_source", "_spans", "_decode")
+
+    @classmethod
+    def from_match(
+        cls,
+        match,
+        fields: Iterable[str],
+        decode: Optional[Callable[[bytes], str]] = None,
+    ) -> "LazyLogEntry":
+        """Returns entry of `match` of the log entry regex,
+        fields of the entry are the groups of the match"""
+        entry = cls.__new__(cls)
+        entry._source = match
+        entry._spans = None
+        entry._decode = decode
+        entry.length = 9
+        for name in fields:
+            value = match.group(FIELD_INDEX[name] + 1)
+            setattr(entry, name, value if decode is None else decode(value))
+        return entry
+
+    @classmethod
+    def from_spans(
+        cls,
+        line: Union[str, bytes],
+        spans: Tuple[int, ...],
+        fields: Iterable[str],
+        decode: Optional[Callable[[bytes], str]] = None,
+    ) -> "LazyLogEntry":
+        """Returns entry of `line`, where i-th field of the entry
+        is `line[spans[2 * i] : spans[2 * i + 1]]` and the parsed line
+        is `line[spans[18] : spans[19]]`, so `line` can be a mapped file"""
+        entry = cls.__new__(cls)
+        entry._source = line
+        entry._spans = spans
+        entry._decode = decode
+        entry.length = 9
+        for name in fields:
+            i = 2 * FIELD_INDEX[name]
+            value = line[spans[i] : spans[i + 1]]
+            setattr(entry, name, value if decode is None else decode(value))
+        return entry
+
+    def __getattr__(self, name: str) -> str:
+        # called only for fields which have not been set yet
+        index = FIELD_INDEX.get(name)
+        if index is None:
+            raise AttributeError(name)
+
+        if self._spans is None:
+            value = self._source.group(index + 1)
+        else:
+            value = self._source[self._spans[2 * index] : self._spans[2 * index + 1]]
+
+        if self._decode is not None:
+            value = self._decode(value)
+
+        setattr(self, name, value)
+        return value
+
+    def line(self) -> Union[str, bytes]:
+        """Returns the parsed line, not decoded"""
+        if self._spans is None:
+            # the line searched by the match, not only its matched part
+            match = self._source
+            return match.string[match.pos : match.endpos]
+        return self._source[self._spans[18] : self._spans[19]]
@@ -0,0 +1,435 @@
+import bz2
+import datetime
+import gzip
+import io
+import locale
+import lzma
+import mmap
+import os
+import queue
+import threading
+from typing import (
+    BinaryIO,
+    Callable,
+    Collection,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from logs.helpers.simplelogger import SimpleLogger
+from logs.parser.timestamp import TimestampDecoder, find_timestamp
+
+# magic bytes at the beginning of compressed files
+COMPRESSION_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+}
+COMPRESSION_OPENERS = {
+    "gzip": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+}
+# lossy decodings of binary input: name - (encoding, error handler)
+DECODINGS = {
+    "replace": ("utf-8", "replace"),
+    "surrogateescape": ("utf-8", "surrogateescape"),
+    "latin-1": ("latin-1", "strict"),
+}
+DEFAULT_DECODING = "replace"
+
+# the earliest and the latest time zones in use,
+# a year begins in them first and last respectively
+EARLIEST_TZ = datetime.timezone(datetime.timedelta(hours=14))
+LATEST_TZ = datetime.timezone(datetime.timedelta(hours=-12))
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Returns the compression format of file with `path`
+    detected by its magic bytes: `"gzip"`, `"bz2"` or `"xz"`,
+    `None` if the file is not compressed"""
+    with open(path, "rb") as f:
+        head = f.read(max(map(len, COMPRESSION_MAGIC.values())))
+
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+
+    return None
+
+
+def open_log(
+    path: str, encoding: Optional[str] = None, offset: int = 0
+) -> Union[TextIO, "ThreadedLineReader"]:
+    """Opens log file with `path` for reading lines.
+
+    Compressed files (see `detect_compression`) are decompressed
+    in a background thread, see `ThreadedLineReader`.
+    Both returned objects can be used as context managers
+    and iterated over lines.
+
+    Uncompressed files are read from byte `offset`,
+    e.g. found by `find_resume_offset`.
+    """
+    compression = detect_compression(path)
+
+    if compression is None:
+        if not offset:
+            return open(path, "r", encoding=encoding)
+
+        f = open(path, "rb")
+        f.seek(offset)
+        return io.TextIOWrapper(f, encoding=encoding)
+
+    if offset:
+        raise ValueError("Compressed log file can not be read from an offset")
+
+    return ThreadedLineReader(COMPRESSION_OPENERS[compression], path, encoding)
+
+
+class ThreadedLineReader:
+    """Iterator over lines of a file which are read in a background thread.
+
+    The file is opened by `opener` (e.g. `gzip.open`) in text mode
+    and batches of its lines are passed through a bounded queue,
+    so decompressing the file and processing its lines can overlap.
+
+    Exceptions raised while reading the file are re-raised by the iterator.
+    """
+
+    def __init__(
+        self,
+        opener: Callable[..., TextIO],
+        path: str,
+        encoding: Optional[str] = None,
+        queue_size: int = 8,
+        batch_size: int = 1 << 20,
+    ):
+        """
+        Parameters
+        ----------
+        opener: Callable[..., TextIO]
+            function opening the file, called as `opener(path, "rt", encoding=encoding)`
+        path: str
+        encoding: str, optional
+            default: `None`; encoding of the file, if `None`,
+            then the same encoding as `open` uses
+        queue_size: int, optional
+            default: `8`; maximal number of batches waiting in the queue
+        batch_size: int, optional
+            default: 1 MiB; approximate size of one batch of lines in characters
+        """
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._read, args=(opener, path, encoding, batch_size), daemon=True
+        )
+        self._thread.start()
+
+    def _read(self, opener, path: str, encoding: Optional[str], batch_size: int):
+        try:
+            with opener(path, "rt", encoding=encoding) as f:
+                while not self._closed.is_set():
+                    lines = f.readlines(batch_size)
+                    if not lines:
+                        break
+                    self._put(lines)
+        except Exception as e:  # re-raised by the iterator
+            self._put(e)
+        else:
+            self._put(None)
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+
+            yield from item
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+
+    def __enter__(self) -> "ThreadedLineReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MappedLog:
+    """Log file memory-mapped for reading in binary mode.
+
+    Parser engines accept `MappedLog` as their input, they find lines
+    in the mapped file by their offsets, without decoding or copying the lines,
+    and decode only the fields of log entries which are used,
+    see `logs.parser.logparser`.
+
+    Bytes which can not be decoded are handled by lossy `decoding`,
+    see `DECODINGS`, so they never abort the parsing.
+    Entries have to be processed before the file is closed.
+    Iterating over `MappedLog` yields decoded lines.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        decoding: str = DEFAULT_DECODING,
+    ):
+        """
+        Parameters
+        ----------
+        path: str
+            path to uncompressed regular file
+        start: int, optional
+            default: `0`; offset of the first line which is read
+        end: int, optional
+            default: `None`; offset of the line beginning before which
+            the file is read, if `None`, the file is read to its end
+        decoding: str, optional
+            default: `"replace"`; name of decoding from `DECODINGS`
+        """
+        self.decoding = decoding
+        self.decode = get_decoder(decoding)
+
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # empty file can not be mapped
+        self.data = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+        self.start = start
+        self.end = size if end is None else end
+
+    def spans(self) -> Iterator[Tuple[int, int]]:
+        """Yields `(<start>, <end>)` offsets of lines, including the line breaks"""
+        find = self.data.find
+        pos = self.start
+        end = self.end
+
+        while pos < end:
+            line_end = find(b"\n", pos, end) + 1
+            if line_end == 0:
+                line_end = end
+            yield (pos, line_end)
+            pos = line_end
+
+    def __iter__(self) -> Iterator[str]:
+        data = self.data
+        decode = self.decode
+        for start, end in self.spans():
+            yield decode(data[start:end])
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def __enter__(self) -> "MappedLog":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_decoder(decoding: str) -> Callable[[bytes], str]:
+    """Returns function decoding bytes by `decoding` from `DECODINGS`"""
+    encoding, errors = DECODINGS[decoding]
+
+    def decode(data: bytes) -> str:
+        return data.decode(encoding, errors)
+
+    return decode
+
+
+def split_byte_ranges(
+    path: str, parts: int, offset: int = 0, end: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """Splits file with `path` from byte `offset` to byte `end`
+    (both line beginnings, `end` defaults to the file size)
+    into at most `parts` byte ranges of roughly the same size,
+    aligned to the beginnings of lines
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        ordered list of non-empty ranges `(<start>, <end>)`,
+        `start` is inclusive, `end` exclusive,
+        together covering the file from `offset` to `end`
+    """
+    size = os.path.getsize(path) if end is None else end
+    bounds = [offset]
+
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            pos = offset + (size - offset) * i // parts
+            if pos <= bounds[-1]:
+                continue
+
+            # `pos - 1` so that `pos` is kept if it is already a line beginning
+            f.seek(pos - 1)
+            f.readline()
+            bound = min(f.tell(), size)
+
+            if bound > bounds[-1]:
+                bounds.append(bound)
+
+    if size > bounds[-1]:
+        bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_lines(
+    path: str, start: int = 0, end: Optional[int] = None, encoding: Optional[str] = None
+) -> Iterator[str]:
+    """Yields decoded lines of file with `path`
+    beginning in the byte range from `start` (inclusive) to `end` (exclusive)
+
+    Parameters
+    ----------
+    path: str
+    start: int, optional
+        default: `0`; has to be an offset of a line beginning
+    end: int, optional
+        default: `None`; if `None` lines are read to the end of the file
+    encoding: str, optional
+        default: `None`; encoding of the file,
+        if `None`, then the same encoding as `open` uses
+    """
+    encoding = locale.getpreferredencoding(False) if encoding is None else encoding
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+
+        for line in f:
+            if end is not None and pos >= end:
+                break
+            pos += len(line)
+            yield line.decode(encoding)
+
+
+def find_resume_offset(
+    path: str, from_time: datetime.datetime, logger: Optional[SimpleLogger] = None
+) -> int:
+    """Returns byte offset of the first line of log file with `path`
+    which follows the last entry not newer than `from_time`.
+
+    The file has to be uncompressed and ordered by time.
+    Byte offsets are binary searched by sampling timestamps of lines,
+    so only a few lines of the file are read.
+    Lines without a valid timestamp are skipped while sampling.
+
+    If `logger` is given, then the number of skipped bytes
+    and approximate number of skipped lines are logged.
+    """
+    from_ts = from_time.timestamp()
+    decode_time = TimestampDecoder().decode
+    sampled = [0, 0]  # bytes and number of lines read while sampling
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        lo, hi = 0, size
+
+        # first `pos` with the next timed line newer than `from_time`
+        while lo < hi:
+            mid = (lo + hi) // 2
+            ts = _next_line_time(f, mid, decode_time, sampled)
+            if ts is None or ts > from_ts:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        offset = _line_beginning(f, lo)
+
+    if logger is not None:
+        lines = round(offset * sampled[1] / sampled[0]) if sampled[0] else 0
+        logger.logMessage(
+            f"resuming '{path}' from byte {offset}, "
+            f"skipped {offset} bytes, approximately {lines} lines"
+        )
+
+    return offset
+
+
+def find_years_range(
+    path: str, years: Collection[int], logger: Optional[SimpleLogger] = None
+) -> Tuple[int, int]:
+    """Returns byte range `(<start>, <end>)` of log file with `path`
+    which contains all its entries from the earliest to the latest of `years`.
+
+    The file has to be uncompressed and ordered by time,
+    the range is found by binary search, see `find_resume_offset`.
+    The range can contain also some entries from the neighbouring years,
+    since the year of an entry depends on its time zone.
+
+    If `logger` is given, then the number of skipped bytes is logged.
+    """
+    year_begin = datetime.datetime(min(years), 1, 1, tzinfo=EARLIEST_TZ)
+    years_end = datetime.datetime(max(years) + 1, 1, 1, tzinfo=LATEST_TZ)
+    second = datetime.timedelta(seconds=1)
+
+    start = find_resume_offset(path, year_begin - second)
+    end = find_resume_offset(path, years_end - second)
+
+    if logger is not None:
+        skipped = os.path.getsize(path) - (end - start)
+        logger.logMessage(
+            f"reading '{path}' from byte {start} to byte {end} "
+            f"for years {', '.join(map(str, sorted(years)))}, skipped {skipped} bytes"
+        )
+
+    return (start, end)
+
+
+def _line_beginning(f: BinaryIO, pos: int) -> int:
+    """Returns offset of the first line beginning at or after `pos`"""
+    if pos == 0:
+        return 0
+
+    # `pos - 1` so that `pos` is kept if it is already a line beginning
+    f.seek(pos - 1)
+    f.readline()
+    return f.tell()
+
+
+def _next_line_time(
+    f: BinaryIO, pos: int, decode_time, sampled: List[int]
+) -> Optional[float]:
+    """Returns unix timestamp of the first line with a valid timestamp
+    beginning at or after `pos`, `None` if there is no such line"""
+    f.seek(_line_beginning(f, pos))
+
+    for line in f:
+        sampled[0] += len(line)
+        sampled[1] += 1
+
+        timestamp = find_timestamp(line.decode("utf-8", "replace"))
+        if timestamp is None:
+            continue
+        try:
+            _, ts = decode_time(timestamp)
+            return ts
+        except ValueError:
+            continue
+
+    return None
@@ -0,0 +1,225 @@
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple, Union
+
+from logs.parser.logentry import (
+    ENTRY_FIELDS,
+    USED_FIELDS,
+    LogEntry,
+    MappedLogEntry,
+    RejectedEntry,
+)
+from logs.parser.logfile import get_decoder
+
+# Apache LogFormat strings of supported log formats
+LOG_FORMATS = {
+    "combined": '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i"',
+    "vhost_combined": '%v:%p %h %l %u %t "%r" %>s %O "%{Referer}i" "%{User-Agent}i"',
+    "nginx": '%h - %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i" %T',
+}
+
+# directive - LogEntry field, other directives are only skipped
+DIRECTIVE_FIELDS = {
+    "h": "ip_addr",
+    "a": "ip_addr",
+    "l": "slot1",
+    "u": "slot2",
+    "t": "time",
+    "r": "request",
+    "s": "http_code",
+    "b": "bytes",
+    "B": "bytes",
+    "O": "bytes",
+    "{referer}i": "referer",
+    "{user-agent}i": "user_agent",
+}
+# directives of the fields used for the statistics, which formats have to contain
+USED_DIRECTIVES = {"ip_addr": "%h", "time": "%t", "user_agent": "%{User-agent}i"}
+MISSING = "-"  # value of fields which are not in the format
+BACKSLASH = "\\"
+LINE_BREAKS = "\r\n"
+
+RE_DIRECTIVE = re.compile(r"%[<>!,0-9]*(\{[^}]*\})?([a-zA-Z%])")
+
+
+def parse_log_format(log_format: str) -> Tuple[List[str], List[Optional[str]]]:
+    """Splits Apache `log_format` (or name of the format from `LOG_FORMATS`)
+    into literals and LogEntry fields of its directives.
+
+    Returns
+    -------
+    Tuple[List[str], List[Optional[str]]]
+        `(<literals>, <fields>)`, where `literals` has one more item
+        than `fields`, i-th field is between i-th and (i+1)-th literal;
+        field is `None` for directives which are not stored in LogEntry
+
+    Raises ValueError if two directives are not separated by a literal
+    or if the time has a custom format (`%{format}t`), which can not be decoded.
+    """
+    log_format = LOG_FORMATS.get(log_format, log_format).replace('\\"', '"')
+    literals = []
+    fields = []
+    literal = []
+    pos = 0
+
+    for match in RE_DIRECTIVE.finditer(log_format):
+        literal.append(log_format[pos : match.start()])
+        pos = match.end()
+        param, directive = match.groups()
+
+        if directive == "%":
+            literal.append("%")
+            continue
+        if directive == "t" and param is not None:
+            raise ValueError(
+                f"Custom time format '{match.group()}' in log format '{log_format}' "
+                "is not supported, use %t"
+            )
+        if fields and not "".join(literal):
+            raise ValueError(
+                f"Directives in log format '{log_format}' "
+                "have to be separated by a literal"
+            )
+
+        literals.append("".join(literal))
+        literal = []
+        fields.append(DIRECTIVE_FIELDS.get((param or "").lower() + directive))
+
+        if directive == "t" and param is None:
+            # time is logged in square brackets
+            literals[-1] += "["
+            literal.append("]")
+
+    literal.append(log_format[pos:])
+    literals.append("".join(literal))
+
+    return (literals, fields)
+
+
+@lru_cache(maxsize=None)
+def compile_log_format(
+    log_format: str,
+    fields: Tuple[str, ...] = ENTRY_FIELDS,
+    decoding: Optional[str] = None,
+) -> Callable[[Union[str, bytes]], LogEntry]:
+    """Returns parser of log lines in Apache `log_format`
+    (or in format with name from `LOG_FORMATS`).
+
+    Source code of the parser is generated for the format:
+    the line is scanned for the literals of the format by `find`
+    and only the LogEntry `fields` are sliced out,
+    other fields of returned entries are `MISSING`.
+    Literals following a quote are not matched, if the quote is escaped.
+    Lines which do not match the format are parsed into `RejectedEntry`,
+    contents of the fields are not validated, except for the host
+    which has to be non-empty and printable.
+
+    Raises ValueError for invalid formats (see `parse_log_format`)
+    and for formats without any of `USED_FIELDS`, i.e. the host,
+    the time (`%t`) and the User-agent, as their lines could not be processed.
+
+    If `decoding` (see `logs.parser.logfile.DECODINGS`) is given,
+    then the parser parses `bytes` lines and decodes the sliced fields.
+    The parser can be called as `parser(line, start, stop)` to parse
+    `line[start:stop]` in place, e.g. a line in a mapped file,
+    binary parsers then return `MappedLogEntry`, which keeps only the offsets.
+
+    Compiled parsers are cached for each format.
+    """
+    literals, format_fields = parse_log_format(log_format)
+    missing = [USED_DIRECTIVES[f] for f in USED_FIELDS if f not in format_fields]
+    if missing:
+        raise ValueError(
+            f"Log format '{log_format}' does not contain directives "
+            f"used for the statistics: {', '.join(missing)}"
+        )
+    binary = decoding is not None
+    field_value = "decode(line[pos:end])" if binary else "line[pos:end]"
+
+    def literal_repr(literal: str) -> str:
+        return repr(literal.encode() if binary else literal)
+
+    def literal_len(literal: str) -> int:
+        return len(literal.encode() if binary else literal)
+
+    code = [
+        "def log_format_parser(line, start=0, stop=None):",
+        "    if stop is None:",
+        "        stop = len(line)",
+        "    pos = start",
+    ]
+
+    if literals[0]:
+        length = literal_len(literals[0])
+        code += [
+            f"    if line.find({literal_repr(literals[0])}, start, "
+            f"start + {length}) < 0:",
+            "        return RejectedEntry(line[start:stop])",
+            f"    pos = start + {length}",
+        ]
+
+    for field, literal in zip(format_fields, literals[1:]):
+        if literal:
+            code += [
+                f"    end = line.find({literal_repr(literal)}, pos, stop)",
+            ]
+            if literal.startswith('"'):
+                code += [
+                    "    while end > start and "
+                    f"line.find({literal_repr(BACKSLASH)}, end - 1, end) >= 0:",
+                    f"        end = line.find({literal_repr(literal)}, end + 1, stop)",
+                ]
+            code += [
+                "    if end < 0:",
+                "        return RejectedEntry(line[start:stop])",
+            ]
+        else:
+            # the last field ends with the line
+            code += [
+                "    end = stop",
+                "    while end > pos and "
+                f"line[end - 1 : end] in {literal_repr(LINE_BREAKS)}:",
+                "        end -= 1",
+            ]
+
+        if field in fields:
+            code += [
+                f"    {field} = {field_value}",
+            ]
+        if field == "ip_addr" and field in fields:
+            code += [
+                "    if not ip_addr or not ip_addr.isprintable():",
+                "        return RejectedEntry(line[start:stop])",
+            ]
+        code += [
+            f"    pos = end + {literal_len(literal)}",
+        ]
+
+    # fields can not contain line breaks
+    code += [
+        f"    if line.find({literal_repr(LINE_BREAKS[1])}, start, pos) >= 0:",
+        "        return RejectedEntry(line[start:stop])",
+    ]
+
+    values = [
+        name if name in fields and name in format_fields else repr(MISSING)
+        for name in ENTRY_FIELDS
+    ]
+    if binary:
+        code += [
+            "    return MappedLogEntry.from_span("
+            f"line, start, stop, {', '.join(values)})",
+        ]
+    else:
+        code += [
+            f"    return LogEntry.from_fields({', '.join(values)}, line=line)",
+        ]
+
+    namespace = {
+        "LogEntry": LogEntry,
+        "MappedLogEntry": MappedLogEntry,
+        "RejectedEntry": RejectedEntry,
+        "decode": get_decoder(decoding) if binary else None,
+    }
+    exec("\n".join(code), namespace)
+    return namespace["log_format_parser"]
@@ -1,23 +1,75 @@
+import mmap
 import re
-from typing import Callable, Iterator, TextIO
+from functools import partial
+from typing import Callable, Iterator, List, Optional, Sequence, TextIO, Tuple, Union
 
-from logs.parser.logentry import LogEntry
+from logs.parser.logentry import (
+    ENTRY_FIELDS,
+    MALFORMED,
+    TOO_LONG,
+    LazyLogEntry,
+    LogEntry,
+    RejectedEntry,
+)
+from logs.parser.logfile import MappedLog
+from logs.parser.logformat import compile_log_format
 
 # LOG_ENTRY_REGEX = r'([0-9.]+?) (.+?) (.+?) \[(.+?)\] "(.*?[^\\])" ([0-9]+?) ([0-9\-]+?) "(.*?)(?<!\\)" "(.*?)(?<!\\)"'
 # matches only numbers and dots in the first - 'Host' group - eg. excepts only IPv4 as a host
 LOG_ENTRY_REGEX = r'(\S+) (.+?) (.+?) \[(.+?)\] "(.*?[^\\])" ([0-9]+?) ([0-9\-]+?) "(.*?)(?<!\\)" "(.*?)(?<!\\)"'
 # matches all nonwhitespace characters in the first - 'Host' group - e.g allows for both IP address and hostname as a host
 
+DIGITS = "0123456789"
+DIGITS_DASH = DIGITS + "-"
+BYTES_DIGITS = DIGITS.encode()
+BYTES_DIGITS_DASH = DIGITS_DASH.encode()
+# delimiters of fields in Combined Log Format, see `split_combined_spans`
+DELIMITERS = (" ", " [", "]", ' "', '"', "\\", "\n")
+BYTES_DELIMITERS = tuple(delimiter.encode() for delimiter in DELIMITERS)
+DEFAULT_PARSER = "regex"
+DEFAULT_MAX_LINE_LENGTH = 100
+# longer lines are not matched by the regex, which can backtrack on malformed
+# lines in time growing with the fifth power of their length, crafted lines
+# of 100 characters take about 20 ms, see `get_log_entry_parser`
+# fields of lines validated as by the regex, see `get_linear_parser`
+VALIDATED_FIELDS = ("ip_addr", "slot1", "slot2", "time", "request", "http_code", "bytes")
+COMBINED_QUOTES = 6  # number of quotes delimiting the fields in Combined Log Format
 
-def get_log_entry_parser(re_prog) -> Callable[[str], LogEntry]:
-    """`re_prog` is compiled re.Pattern object of log entry regex"""
+
+def get_log_entry_parser(
+    re_prog,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Callable[[str], LogEntry]:
+    """`re_prog` is compiled re.Pattern object of log entry regex,
+    if `fields` are given, then complete entries matched by the regex
+    are `LazyLogEntry` with only these fields set at once.
+
+    Lines are parsed in linear time by parser compiled for Combined Log Format
+    with the fields validated as by the regex at first, see `get_linear_parser`.
+    Only the lines which it does not accept are matched by the regex,
+    unless they are longer than `max_line_length`, then they are rejected
+    as decided by the linear parser, so the backtracking of the regex
+    on malformed lines is bounded.
+    Other lines which are not matched are parsed into `RejectedEntry`.
+    """
+    linear_parser = get_linear_parser(fields)
 
     def log_entry_parser(line: str) -> LogEntry:
-        result = LogEntry()
+        entry = linear_parser(line)
+        if len(entry) == 9 or (
+            max_line_length is not None and len(line) > max_line_length
+        ):
+            return entry
+
+        result = LogEntry(line)
         match = re_prog.search(line)
 
         if match is None:
-            return result
+            return RejectedEntry(line)
+
+        if fields is not None and match.lastindex == 9:
+            return LazyLogEntry.from_match(match, fields)
 
         result.length = match.lastindex
         for i in range(match.lastindex):
@@ -28,13 +80,455 @@ def get_log_entry_parser(re_prog) -> Callable[[str], LogEntry]:
     return log_entry_parser
 
 
-def regex_parser(input: TextIO, buffer_size: int = 1000) -> Iterator[LogEntry]:
+def get_split_log_entry_parser(
+    re_prog,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Callable[[str], LogEntry]:
+    """Returns parser of lines in Combined Log Format
+    which splits the line by positional scanning.
+    Lines which can not be split unambiguously are parsed
+    as by `get_log_entry_parser` with `re_prog`, compiled re.Pattern object
+    of log entry regex, and `max_line_length`.
+
+    If `fields` are given, then complete entries are `LazyLogEntry`
+    with only these fields set at once.
+    """
+    fallback = get_log_entry_parser(re_prog, fields, max_line_length)
+
+    def split_log_entry_parser(line: str) -> LogEntry:
+        values = split_combined(line)
+
+        if values is None:
+            return fallback(line)
+
+        return LogEntry.from_fields(*values, line=line)
+
+    def lazy_split_log_entry_parser(line: str) -> LogEntry:
+        spans = split_combined_spans(line)
+
+        if spans is None:
+            return fallback(line)
+
+        return LazyLogEntry.from_spans(line, spans, fields)
+
+    return split_log_entry_parser if fields is None else lazy_split_log_entry_parser
+
+
+def split_combined(line: str) -> Optional[Tuple[str, ...]]:
+    """Splits `line` in Combined Log Format into its nine fields
+    using `str.find` only.
+
+    Returns
+    -------
+    Tuple[str, ...]
+        the same fields as `LOG_ENTRY_REGEX` would match
+    None
+        if the line is malformed or contains escaped quotes
+        on field boundaries, i.e. if the split could differ
+        from the regex match
+
+    See also
+    --------
+    split_combined_spans
+    """
+    spans = split_combined_spans(line)
+
+    if spans is None:
+        return None
+
+    return tuple(line[spans[i] : spans[i + 1]] for i in range(0, 18, 2))
+
+
+def split_combined_spans(
+    line: Union[str, bytes, mmap.mmap], start: int = 0, end: Optional[int] = None
+) -> Optional[Tuple[int, ...]]:
+    """Finds spans of nine fields of `line` in Combined Log Format
+    using `find` only, `line` can be `str`, `bytes` or memory-mapped file.
+
+    If `start` and `end` are given, then the line is `line[start:end]`,
+    it is scanned in place without slicing it, e.g. in a mapped file.
+
+    Returns
+    -------
+    Tuple[int, ...]
+        `(<start 1>, <end 1>, ..., <start 9>, <end 9>, <start>, <end>)`,
+        i-th field is `line[<start i> : <end i>]`,
+        the fields are the same as `LOG_ENTRY_REGEX` would match,
+        the last two offsets are the span of the line
+    None
+        if the line is malformed or contains escaped quotes
+        on field boundaries, i.e. if the split could differ
+        from the regex match
+    """
+    binary = not isinstance(line, str)
+    space, space_bracket, bracket, space_quote, quote, backslash, newline = (
+        BYTES_DELIMITERS if binary else DELIMITERS
+    )
+    digits, digits_dash = (
+        (BYTES_DIGITS, BYTES_DIGITS_DASH) if binary else (DIGITS, DIGITS_DASH)
+    )
+    if end is None:
+        end = len(line)
+
+    # host - regex `(\S+) `
+    ip_end = line.find(space, start, end)
+    if ip_end <= start:
+        return None
+    host = line[start:ip_end]
+    # bytes regex `\S` does not match ASCII whitespace only
+    if not (host.split() == [host] if binary else host.isprintable()):
+        return None
+
+    # identity and user id - regex `(.+?) (.+?) \[`
+    slot1_start = ip_end + 1
+    slot1_end = line.find(space, slot1_start, end)
+    if slot1_end <= slot1_start:
+        return None
+
+    slot2_start = slot1_end + 1
+    slot2_end = line.find(space_bracket, slot2_start, end)
+    if slot2_end <= slot2_start:
+        return None
+
+    # time - regex `\[(.+?)\] "`
+    time_start = slot2_end + 2
+    time_end = line.find(bracket, time_start, end)
+    if (
+        time_end <= time_start
+        or line.find(space_quote, time_end + 1, time_end + 3) < 0
+    ):
+        return None
+
+    # request - regex `"(.*?[^\\])" `
+    request_start = time_end + 3
+    request_end = line.find(quote, request_start, end)
+    if (
+        request_end <= request_start
+        or line.find(backslash, request_end - 1, request_end) >= 0
+        or line.find(space, request_end + 1, request_end + 2) < 0
+    ):
+        return None
+
+    # status code - regex ` ([0-9]+?) `
+    code_start = request_end + 2
+    code_end = line.find(space, code_start, end)
+    if code_end <= code_start or line[code_start:code_end].strip(digits):
+        return None
+
+    # size - regex ` ([0-9\-]+?) "`
+    size_start = code_end + 1
+    size_end = line.find(space_quote, size_start, end)
+    if size_end <= size_start or line[size_start:size_end].strip(digits_dash):
+        return None
+
+    # referer - regex `"(.*?)(?<!\\)" "`
+    referer_start = size_end + 2
+    referer_end = line.find(quote, referer_start, end)
+    if (
+        referer_end < 0
+        or line.find(backslash, referer_end - 1, referer_end) >= 0
+        or line.find(space_quote, referer_end + 1, referer_end + 3) < 0
+    ):
+        return None
+
+    # user agent - regex `"(.*?)(?<!\\)"`
+    agent_start = referer_end + 3
+    agent_end = line.find(quote, agent_start, end)
+    if agent_end < 0 or line.find(backslash, agent_end - 1, agent_end) >= 0:
+        return None
+
+    # regex dot does not match line breaks inside the entry
+    if line.find(newline, start, agent_end) >= 0:
+        return None
+
+    return (
+        start,
+        ip_end,
+        slot1_start,
+        slot1_end,
+        slot2_start,
+        slot2_end,
+        time_start,
+        time_end,
+        request_start,
+        request_end,
+        code_start,
+        code_end,
+        size_start,
+        size_end,
+        referer_start,
+        referer_end,
+        agent_start,
+        agent_end,
+        start,
+        end,
+    )
+
+
+def get_linear_parser(
+    fields: Optional[Sequence[str]] = None, decoding: Optional[str] = None
+) -> Callable[..., LogEntry]:
+    """Returns parser of lines in Combined Log Format which takes linear time
+    in length of the line, used before the regex, which can take much longer.
+
+    Fields are found by `find` as by parser compiled for the format,
+    so the escaped quotes are skipped, and then they are validated
+    as by groups of `LOG_ENTRY_REGEX`, e.g. the status code has to be a number.
+    Lines which can not be parsed are rejected as malformed, as the regex
+    can not match them either. Lines with invalid fields are rejected
+    as malformed too, unless they contain more quotes than the delimiters
+    of the fields, then the regex could match other quotes as the delimiters,
+    so they are rejected as too long.
+    If `decoding` is given, then the lines are `bytes`
+    and the parser can be called as `parser(data, start, stop)`
+    to parse line `data[start:stop]` in place, e.g. in a mapped file.
+    """
+    fields = ENTRY_FIELDS if fields is None else fields
+    parser = compile_log_format(
+        "combined",
+        tuple(f for f in ENTRY_FIELDS if f in fields or f in VALIDATED_FIELDS),
+        decoding,
+    )
+    quote = b'"' if decoding is not None else '"'
+
+    def linear_parser(
+        line: Union[str, bytes, mmap.mmap], start: int = 0, stop: Optional[int] = None
+    ) -> LogEntry:
+        entry = parser(line, start, stop)
+        if len(entry) == 9 and _is_valid_combined(entry):
+            return entry
+
+        line = line[start:stop]
+        if len(entry) == 9 and line.count(quote) > COMBINED_QUOTES:
+            return RejectedEntry(line, TOO_LONG)
+        return RejectedEntry(line, MALFORMED)
+
+    return linear_parser
+
+
+def _is_valid_combined(entry: LogEntry) -> bool:
+    """Returns `True` if `VALIDATED_FIELDS` of `entry` parsed without the regex
+    are valid values of their groups of `LOG_ENTRY_REGEX`,
+    the host is validated by the parser compiled for the format"""
+    return bool(
+        entry.slot1
+        and entry.slot2
+        and entry.time
+        and entry.request
+        and entry.http_code
+        and not entry.http_code.strip(DIGITS)
+        and entry.bytes
+        and not entry.bytes.strip(DIGITS_DASH)
+    )
+
+
+def get_mapped_log_entry_parser(
+    re_prog,
+    log: MappedLog,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Callable[[int, int], LogEntry]:
+    """Returns parser of lines of `log` given by their offsets,
+    `re_prog` is compiled re.Pattern object of log entry regex in bytes.
+    The lines are parsed and matched in the mapped file without copying them
+    and only their fields are decoded, see `get_log_entry_parser`."""
+    data = log.data
+    decode = log.decode
+    linear_parser = get_linear_parser(fields, log.decoding)
+    entry_fields = ENTRY_FIELDS if fields is None else fields
+
+    def mapped_log_entry_parser(start: int, end: int) -> LogEntry:
+        entry = linear_parser(data, start, end)
+        if len(entry) == 9 or (
+            max_line_length is not None and end - start > max_line_length
+        ):
+            return entry
+
+        match = re_prog.search(data, start, end)
+
+        if match is None:
+            return RejectedEntry(data[start:end])
+
+        if match.lastindex == 9:
+            return LazyLogEntry.from_match(match, entry_fields, decode)
+
+        result = LogEntry(data[start:end])
+        result.length = match.lastindex
+        for i in range(match.lastindex):
+            setattr(result, result.__slots__[i], decode(match.group(i + 1)))
+
+        return result
+
+    return mapped_log_entry_parser
+
+
+def get_mapped_split_log_entry_parser(
+    re_prog,
+    log: MappedLog,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Callable[[int, int], LogEntry]:
+    """Returns parser of lines of `log` given by their offsets,
+    which splits the lines by positional scanning, see `get_split_log_entry_parser`.
+    The lines are scanned in the mapped file without copying them
+    and only the split fields are sliced and decoded."""
+    fallback = get_mapped_log_entry_parser(re_prog, log, fields, max_line_length)
+    data = log.data
+    decode = log.decode
+    fields = ENTRY_FIELDS if fields is None else fields
+
+    def mapped_split_log_entry_parser(start: int, end: int) -> LogEntry:
+        spans = split_combined_spans(data, start, end)
+
+        if spans is None:
+            return fallback(start, end)
+
+        return LazyLogEntry.from_spans(data, spans, fields, decode)
+
+    return mapped_split_log_entry_parser
+
+
+def regex_parser(
+    input: Union[TextIO, MappedLog],
+    buffer_size: int = 1000,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Iterator[LogEntry]:
     """Reads `buffer_size` lines from `input`,
     parses them with regex and yields an iterator of
-    `buffer_size` of Log_entries
+    `buffer_size` of Log_entries.
+
+    If `fields` are given, then only these fields are set at once
+    in complete entries, the other are sliced on their first access,
+    see `LazyLogEntry`.
+
+    Lines are parsed in linear time at first, only the lines
+    not longer than `max_line_length` are matched by the regex,
+    see `get_log_entry_parser`, lines which can not be parsed
+    are yielded as `RejectedEntry`.
     """
+    if isinstance(input, MappedLog):
+        re_prog_entry = re.compile(LOG_ENTRY_REGEX.encode())
+        return _buffered_mapped_parser(
+            input,
+            get_mapped_log_entry_parser(
+                re_prog_entry, input, fields, max_line_length
+            ),
+            buffer_size,
+        )
 
     re_prog_entry = re.compile(LOG_ENTRY_REGEX)
+    return _buffered_parser(
+        input,
+        get_log_entry_parser(re_prog_entry, fields, max_line_length),
+        buffer_size,
+    )
+
+
+def split_parser(
+    input: Union[TextIO, MappedLog],
+    buffer_size: int = 1000,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Iterator[LogEntry]:
+    """Reads `buffer_size` lines from `input`,
+    splits them on field delimiters and yields an iterator of
+    `buffer_size` of Log_entries.
+
+    Gives the same entries as `regex_parser`,
+    the regex is used only for lines which can not be split
+    unambiguously, see `split_combined`,
+    such lines are parsed as by `regex_parser`.
+    """
+    if isinstance(input, MappedLog):
+        re_prog_entry = re.compile(LOG_ENTRY_REGEX.encode())
+        return _buffered_mapped_parser(
+            input,
+            get_mapped_split_log_entry_parser(
+                re_prog_entry, input, fields, max_line_length
+            ),
+            buffer_size,
+        )
+
+    re_prog_entry = re.compile(LOG_ENTRY_REGEX)
+    return _buffered_parser(
+        input,
+        get_split_log_entry_parser(re_prog_entry, fields, max_line_length),
+        buffer_size,
+    )
+
+
+def log_format_parser(
+    input: Union[TextIO, MappedLog],
+    buffer_size: int = 1000,
+    fields: Optional[Sequence[str]] = None,
+    log_format: str = "combined",
+) -> Iterator[LogEntry]:
+    """Reads `buffer_size` lines from `input`,
+    parses them with parser compiled for Apache `log_format`
+    (or format with name from `logs.parser.logformat.LOG_FORMATS`)
+    and yields an iterator of `buffer_size` of Log_entries.
+
+    If `fields` are given, then only these fields are set in the entries,
+    see `logs.parser.logformat.compile_log_format`.
+    """
+    fields = ENTRY_FIELDS if fields is None else tuple(fields)
+
+    if isinstance(input, MappedLog):
+        line_parser = compile_log_format(log_format, fields, input.decoding)
+        data = input.data
+        return _buffered_mapped_parser(
+            input, lambda start, end: line_parser(data, start, end), buffer_size
+        )
+
+    return _buffered_parser(input, compile_log_format(log_format, fields), buffer_size)
+
+
+PARSERS = {
+    "regex": regex_parser,
+    "split": split_parser,
+}
+
+
+def get_parser(
+    name: str,
+    log_format: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Callable[[TextIO, int], Iterator[LogEntry]]:
+    """Returns parser engine with given `name`, see `PARSERS`.
+    Raises ValueError for unknown names.
+
+    If `log_format` is given, then parser compiled for the format
+    is returned instead, see `log_format_parser`.
+    Raises ValueError for invalid formats.
+
+    If `fields` are given, then the parser sets only these fields
+    of log entries at once, e.g. `logs.parser.logentry.USED_FIELDS`.
+    Lines which are not parsed in linear time are matched by the regex
+    only if they are not longer than `max_line_length`,
+    `None` means no limit, see `get_log_entry_parser`;
+    parsers compiled for `log_format` take linear time for all lines."""
+    if log_format is not None:
+        compile_log_format(log_format)  # fail early on invalid format
+        return partial(log_format_parser, fields=fields, log_format=log_format)
+
+    parser = PARSERS.get(name)
+
+    if parser is None:
+        raise ValueError(
+            f"Unknown parser '{name}', expected one of: {', '.join(PARSERS)}"
+        )
+
+    return partial(parser, fields=fields, max_line_length=max_line_length)
+
+
+def _buffered_parser(
+    input: TextIO, line_parser: Callable[[str], LogEntry], buffer_size: int
+) -> Iterator[LogEntry]:
+    """Reads `buffer_size` lines from `input` and yields
+    them mapped by `line_parser`"""
     buffer = []
     i = 0
 
@@ -42,9 +536,36 @@ def regex_parser(input: TextIO, buffer_size: int = 1000) -> Iterator[LogEntry]:
         buffer.append(line)
         i += 1
         if i == buffer_size:
-            yield map(get_log_entry_parser(re_prog_entry), buffer)
+            yield map(line_parser, buffer)
             buffer = []
             i = 0
 
     if i > 0:
-        yield map(get_log_entry_parser(re_prog_entry), buffer)
+        yield map(line_parser, buffer)
+
+
+def _buffered_mapped_parser(
+    input: MappedLog, span_parser: Callable[[int, int], LogEntry], buffer_size: int
+) -> Iterator[List[LogEntry]]:
+    """Finds `buffer_size` lines in `input` and yields
+    them parsed by `span_parser` called with line offsets"""
+    find = input.data.find
+    pos = input.start
+    end = input.end
+    buffer = []
+
+    # the same as iterating `input.spans()`, inlined
+    while pos < end:
+        line_end = find(b"\n", pos, end) + 1
+        if line_end == 0:
+            line_end = end
+
+        buffer.append(span_parser(pos, line_end))
+        pos = line_end
+
+        if len(buffer) == buffer_size:
+            yield buffer
+            buffer = []
+
+    if buffer:
+        yield buffer
@@ -0,0 +1,64 @@
+import heapq
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from logs.parser.logentry import LogEntry
+from logs.parser.logparser import DEFAULT_MAX_LINE_LENGTH, DEFAULT_PARSER, get_parser
+from logs.parser.timestamp import TimestampDecoder
+
+
+def merged_parser(
+    inputs: Sequence[Iterable[str]],
+    parser: str = DEFAULT_PARSER,
+    buffer_size: int = 1000,
+    log_format: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+) -> Iterator[List[LogEntry]]:
+    """Parses each of `inputs` with parser engine named `parser`
+    (or parser compiled for `log_format`, setting `fields`
+    and limiting `max_line_length`, see `get_parser`)
+    and yields buffers of `buffer_size` log entries
+    merged from all the inputs in their time order.
+
+    Each of `inputs` has to be ordered by time.
+    The merge is lazy, only the current buffer of each input is held in memory.
+    Entries with the same time are ordered as `inputs` are.
+    Entries which could not be parsed keep their position
+    after the previous entry from the same input.
+    """
+    parse = get_parser(parser, log_format, fields, max_line_length)
+    streams = [
+        _timed_entries(parse(input, buffer_size), i) for i, input in enumerate(inputs)
+    ]
+
+    buffer = []
+    for _, _, _, entry in heapq.merge(*streams):
+        buffer.append(entry)
+        if len(buffer) == buffer_size:
+            yield buffer
+            buffer = []
+
+    if buffer:
+        yield buffer
+
+
+def _timed_entries(
+    buffers: Iterator[Iterable[LogEntry]], index: int
+) -> Iterator[Tuple[float, int, int, LogEntry]]:
+    """Yields tuples `(<unix timestamp>, index, <sequence number>, <log entry>)`
+    for log entries from `buffers`,
+    so the tuples can be ordered without comparing log entries"""
+    decode_time = TimestampDecoder().decode
+    ts = float("-inf")
+    seq = 0
+
+    for buffer in buffers:
+        for entry in buffer:
+            if len(entry) == 9:
+                try:
+                    _, ts = decode_time(entry.time)
+                except ValueError:
+                    pass  # keep the time of the previous entry
+
+            yield (ts, index, seq, entry)
+            seq += 1
@@ -0,0 +1,83 @@
+import os
+import shutil
+from typing import Dict, Optional, TextIO
+
+from logs.parser.logentry import MALFORMED, REJECT_REASONS, LogEntry, RejectedEntry
+
+QUARANTINE_ENCODING = ("utf-8", "surrogateescape")
+# rejected lines read in binary mode are decoded with surrogates,
+# so their original bytes are written into the quarantine file
+
+
+class RejectedLines:
+    """Counts log lines rejected by parsers or during processing
+    by the reason of the rejection (see `logs.parser.logentry.REJECT_REASONS`)
+    and writes them into `quarantine` file.
+
+    If `sample` is greater than 1, then only the first and then every
+    `sample`-th rejected line of each reason is written into the quarantine,
+    so hostile traffic can not make the quarantine grow as fast as the log.
+    The quarantine should be opened by `open_quarantine`.
+    """
+
+    def __init__(self, quarantine: Optional[TextIO] = None, sample: int = 1):
+        self.quarantine = quarantine
+        self.sample = max(sample, 1)
+        self.counts: Dict[str, int] = dict.fromkeys(REJECT_REASONS, 0)
+        self.quarantined = 0
+
+    def reject(self, entry: LogEntry, reason: Optional[str] = None) -> None:
+        """Counts the line of `entry` as rejected for `reason`,
+        if `reason` is not given, then the reason of `RejectedEntry` is used"""
+        if reason is None:
+            reason = entry.reason if isinstance(entry, RejectedEntry) else MALFORMED
+
+        count = self.counts.get(reason, 0)
+        self.counts[reason] = count + 1
+
+        if self.quarantine is not None and count % self.sample == 0:
+            line = entry.line()
+            if isinstance(line, bytes):
+                line = line.decode(*QUARANTINE_ENCODING)
+
+            self.quarantine.write(line)
+            if not line.endswith("\n"):
+                self.quarantine.write("\n")
+            self.quarantined += 1
+
+    def update(self, other: "RejectedLines", quarantine: Optional[str] = None) -> None:
+        """Adds counts of `other` to the counts,
+        if path to a `quarantine` file of `other` is given, then its lines
+        are appended to the quarantine and the file is removed"""
+        for reason, count in other.counts.items():
+            self.counts[reason] = self.counts.get(reason, 0) + count
+
+        if quarantine is not None:
+            with open_quarantine(quarantine, "r") as f:
+                if self.quarantine is not None:
+                    shutil.copyfileobj(f, self.quarantine)
+                    self.quarantined += other.quarantined
+            os.remove(quarantine)
+
+    def total(self) -> int:
+        """Returns the number of rejected lines"""
+        return sum(self.counts.values())
+
+    def summary(self) -> str:
+        """Returns one line summary of the counts"""
+        counts = ", ".join(
+            f"{reason}: {count}" for reason, count in self.counts.items() if count
+        )
+        message = f"rejected log lines: {self.total()}"
+        if counts:
+            message += f" ({counts})"
+        if self.quarantine is not None:
+            message += f", {self.quarantined} written to '{self.quarantine.name}'"
+
+        return message
+
+
+def open_quarantine(path: str, mode: str = "w") -> TextIO:
+    """Opens quarantine file with `path` for `RejectedLines`"""
+    encoding, errors = QUARANTINE_ENCODING
+    return open(path, mode, encoding=encoding, errors=errors, newline="\n")
@@ -0,0 +1,117 @@
+import datetime
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from logs.statistics.constants import LOG_DT_FORMAT, MONTHS
+
+TIMESTAMP_LEN = len("10/Oct/2000:13:55:36 -0700")
+MONTH_NUMBERS = {name: i for i, name in enumerate(MONTHS) if i > 0}
+
+
+class TimestampDecoder:
+    """Decodes timestamps of log entries, e.g. `10/Oct/2000:13:55:36 -0700`,
+    into a pair `(<aware datetime>, <unix timestamp>)`.
+
+    Timestamps are decoded by slicing instead of `datetime.strptime`,
+    time zones are cached by their offset string
+    and last `memo_size` distinct timestamps are memoized,
+    so runs of entries from the same second are decoded only once.
+
+    Timestamps which are not in the exact `LOG_DT_FORMAT` layout
+    are decoded with `datetime.strptime`, so the results
+    (including the raised ValueError) are the same.
+    """
+
+    __slots__ = ("memo_size", "_memo", "_timezones", "_last_timestamp", "_last")
+
+    def __init__(self, memo_size: int = 16):
+        self.memo_size = memo_size
+        self._memo: Dict[str, Tuple[datetime.datetime, float]] = OrderedDict()
+        self._timezones: Dict[str, datetime.timezone] = {}
+        self._last_timestamp = None
+        self._last = None
+
+    def decode(self, timestamp: str) -> Tuple[datetime.datetime, float]:
+        """Returns `(<aware datetime>, <unix timestamp>)` of `timestamp`.
+        Raises ValueError if `timestamp` is not in `LOG_DT_FORMAT`"""
+        if timestamp == self._last_timestamp:
+            return self._last
+
+        decoded = self._memo.get(timestamp)
+        if decoded is None:
+            decoded = self._decode(timestamp)
+            if len(self._memo) >= self.memo_size:
+                self._memo.popitem(last=False)
+            self._memo[timestamp] = decoded
+
+        self._last_timestamp = timestamp
+        self._last = decoded
+        return decoded
+
+    def _decode(self, timestamp: str) -> Tuple[datetime.datetime, float]:
+        dt = None
+        month = MONTH_NUMBERS.get(timestamp[3:6])
+
+        if (
+            month is not None
+            and len(timestamp) == TIMESTAMP_LEN
+            and timestamp[2] == "/"
+            and timestamp[6] == "/"
+            and timestamp[11] == ":"
+            and timestamp[14] == ":"
+            and timestamp[17] == ":"
+            and timestamp[20] == " "
+        ):
+            day = timestamp[0:2]
+            year = timestamp[7:11]
+            hour = timestamp[12:14]
+            minute = timestamp[15:17]
+            second = timestamp[18:20]
+            tz = self._timezone(timestamp[21:])
+
+            if tz is not None and (day + year + hour + minute + second).isdigit():
+                dt = datetime.datetime(
+                    int(year),
+                    month,
+                    int(day),
+                    int(hour),
+                    int(minute),
+                    int(second),
+                    tzinfo=tz,
+                )
+
+        if dt is None:
+            dt = datetime.datetime.strptime(timestamp, LOG_DT_FORMAT)
+
+        return (dt, dt.timestamp())
+
+    def _timezone(self, offset: str) -> Optional[datetime.timezone]:
+        """Returns timezone for `offset` in format `[+-]HHMM`,
+        `None` if `offset` is in different format"""
+        tz = self._timezones.get(offset)
+        if tz is not None:
+            return tz
+
+        if offset[0] not in "+-" or not offset[1:].isdigit() or offset[3] > "5":
+            return None
+
+        delta = datetime.timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+        if offset[0] == "-":
+            delta = -delta
+
+        tz = datetime.timezone.utc if not delta else datetime.timezone(delta)
+        self._timezones[offset] = tz
+        return tz
+
+
+def find_timestamp(line: str) -> Optional[str]:
+    """Returns timestamp of log `line` found between the first `" ["`
+    and following `"]"` without parsing the whole line,
+    `None` if there are no such delimiters in `line`"""
+    start = line.find(" [")
+    end = line.find("]", start)
+
+    if start < 0 or end < 0:
+        return None
+
+    return line[start + 2 : end]
@@ -0,0 +1,262 @@
+import hashlib
+import re
+import time
+from typing import Collection, Container, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from logs.statistics.constants import BOT_URL_REGEX, BOT_USER_AGENT_REGEX
+
+RE_PATTERN_BOT_USER_AGENT = re.compile(BOT_USER_AGENT_REGEX)
+RE_PATTERN_BOT_URL = re.compile(BOT_URL_REGEX)
+
+NO_URL = ""
+NOT_BOT = (False, NO_URL)
+BOT_WITHOUT_URL = (True, NO_URL)
+
+# names of the default rules
+URL_RULE = "url"
+USER_AGENT_RULE = "user agent"
+IP_RULE = "ip list"
+DEFAULT_USER_AGENT_RULES = ((USER_AGENT_RULE, BOT_USER_AGENT_REGEX),)
+
+
+def classify_user_agent(user_agent: str) -> Tuple[bool, str]:
+    """Classifies `user_agent` as a bot if it contains an URL
+    or if it matches with `BOT_USER_AGENT_REGEX`
+
+    Returns
+    -------
+    Tuple[bool, str]
+        - (True, <url>) if the user agent contains an url
+        - (True, NO_URL) if the user agent matches `BOT_USER_AGENT_REGEX`
+        - (False, NO_URL)  otherwise
+
+    See also
+    --------
+    BotRules.classify_user_agent
+    """
+    match = RE_PATTERN_BOT_URL.search(user_agent)
+    if match is not None:
+        return (True, match.group(1))
+
+    if RE_PATTERN_BOT_USER_AGENT.search(user_agent) is not None:
+        return BOT_WITHOUT_URL
+
+    return NOT_BOT
+
+
+def load_keywords(keywords_f: Optional[str]) -> List[str]:
+    """Returns list of keywords from the file `keywords_f`, one on each line,
+    empty list if `keywords_f` is `None`"""
+    keywords = []
+    if keywords_f is not None:
+        with open(keywords_f, "r") as f:
+            keywords = [line.strip() for line in f if line.strip()]
+
+    return keywords
+
+
+class BotRule:
+    """Named rule classifying bots, `pattern` is a regex
+    or a collection of IP addresses for the IP rule.
+    `hits` counts log entries classified by the rule
+    and `time` is the cumulative time of its matching in seconds."""
+
+    __slots__ = ("name", "pattern", "hits", "time")
+
+    def __init__(self, name: str, pattern: Collection[str]):
+        self.name = name
+        self.pattern = pattern
+        self.hits = 0
+        self.time = 0.0
+
+
+class IpRule(BotRule):
+    """Bot rule matching IP addresses from its `pattern`,
+    supports `in` operator, so it can be used in place of a set of IPs,
+    which counts the hit of a matched IP address.
+    The matching time is measured only if `profile` is `True`."""
+
+    __slots__ = ("profile",)
+
+    def __init__(self, name: str, pattern: Collection[str], profile: bool = False):
+        super().__init__(name, pattern)
+        self.profile = profile
+
+    def match(self, ip_addr: str) -> bool:
+        """Returns `True` if `ip_addr` is matched, without counting the hit"""
+        if not self.profile:
+            return ip_addr in self.pattern
+
+        start = time.perf_counter()
+        found = ip_addr in self.pattern
+        self.time += time.perf_counter() - start
+        return found
+
+    def __contains__(self, ip_addr: str) -> bool:
+        found = self.match(ip_addr)
+        if found:
+            self.hits += 1
+        return found
+
+    def __len__(self) -> int:
+        return len(self.pattern)
+
+
+class BotRules:
+    """Rule engine classifying log entries as bots.
+
+    The rules are checked in this order:
+    - the url rule, user agent containing an URL (`url_regex`)
+      is classified as a bot with the URL
+    - the IP rule, see `ip_rule`
+    - user agent rules, pairs `(<name>, <regex>)`,
+      followed by a rule for each of `keywords`
+
+    The user agent rules are compiled into a single alternation
+    of named groups, so each user agent is scanned once,
+    the rule of the group which matched decides the user agent
+    (the one matching at the leftmost position, the first one of them).
+    Matching time of the alternation is counted in `scan_time`,
+    if `profile` is `True`, then each user agent rule is also matched
+    on its own to measure its `time`, which makes the classification slower,
+    and the time of the IP rule is measured.
+
+    Hits of all the rules count log entries, each entry is counted
+    to the first rule which matched it, see `decide`.
+    Classifications of user agents are meant to be cached
+    by `logs.statistics.uacache.UserAgentCache`, so the matching times
+    are the times of classifying distinct user agents.
+    """
+
+    def __init__(
+        self,
+        user_agent_rules: Sequence[Tuple[str, str]] = DEFAULT_USER_AGENT_RULES,
+        keywords: Iterable[str] = (),
+        url_regex: str = BOT_URL_REGEX,
+        profile: bool = False,
+    ):
+        self.url_rule = BotRule(URL_RULE, url_regex)
+        self.user_agent_rules = [BotRule(name, regex) for name, regex in user_agent_rules]
+        self.user_agent_rules += [
+            BotRule(f"keyword '{keyword}'", re.escape(keyword)) for keyword in keywords
+        ]
+        self.ip_rule = IpRule(IP_RULE, frozenset(), profile)
+        self.profile = profile
+        self.scan_time = 0.0
+
+        self._url = re.compile(url_regex)
+        self._user_agent = re.compile(
+            "|".join(
+                f"(?P<r{i}>{rule.pattern})"
+                for i, rule in enumerate(self.user_agent_rules)
+            )
+            or "(?!)"  # no rules, never matches
+        )
+        self._group_rules: Dict[str, BotRule] = {
+            f"r{i}": rule for i, rule in enumerate(self.user_agent_rules)
+        }
+        self._compiled = [re.compile(rule.pattern) for rule in self.user_agent_rules]
+
+    @property
+    def signature(self) -> str:
+        """Hash of the url and user agent rules,
+        classifications of user agents are valid only for the same signature"""
+        patterns = [self.url_rule.pattern] + [
+            rule.pattern for rule in self.user_agent_rules
+        ]
+        return hashlib.sha1("\n".join(patterns).encode()).hexdigest()
+
+    def rules(self) -> List[BotRule]:
+        """Returns all rules in the order of their checking"""
+        return [self.url_rule, self.ip_rule] + self.user_agent_rules
+
+    def set_ips(self, ips: Collection[str]) -> IpRule:
+        """Sets IP addresses matched by the IP rule,
+        returns the rule, which can be used as a collection of `ips`"""
+        self.ip_rule.pattern = ips
+        return self.ip_rule
+
+    def match_user_agent(
+        self, user_agent: str
+    ) -> Tuple[Tuple[bool, str], Optional[BotRule]]:
+        """Classifies `user_agent` by the url and user agent rules,
+        returns the same classification as `classify_user_agent`
+        for the default rules and the rule which decided it,
+        `None` if the user agent is not a bot. The hit is not counted."""
+        start = time.perf_counter()
+        match = self._url.search(user_agent)
+        end = time.perf_counter()
+        self.url_rule.time += end - start
+
+        if match is not None:
+            return ((True, match.group(1)), self.url_rule)
+
+        match = self._user_agent.search(user_agent)
+        self.scan_time += time.perf_counter() - end
+
+        if self.profile:
+            for rule, pattern in zip(self.user_agent_rules, self._compiled):
+                start = time.perf_counter()
+                pattern.search(user_agent)
+                rule.time += time.perf_counter() - start
+
+        if match is not None:
+            return (BOT_WITHOUT_URL, self._group_rules[match.lastgroup])
+
+        return (NOT_BOT, None)
+
+    def classify_user_agent(self, user_agent: str) -> Tuple[bool, str]:
+        """Classifies `user_agent` by the url and user agent rules,
+        returns the same as `classify_user_agent` for the default rules,
+        the hit is counted to the rule which decided it"""
+        classification, rule = self.match_user_agent(user_agent)
+        if rule is not None:
+            rule.hits += 1
+        return classification
+
+    def decide(
+        self,
+        classification: Tuple[bool, str],
+        rule: Optional[BotRule],
+        ip_addr: str,
+        ips: Container[str],
+    ) -> Tuple[bool, str]:
+        """Classifies log entry with IP address `ip_addr` and user agent
+        with `classification` decided by `rule` (see `match_user_agent`)
+        by the rules in their order, the hit is counted
+        to the first rule which matched the entry.
+
+        `ips` are the IP addresses of bots, usually `ip_rule`,
+        which counts its hits, see `set_ips`."""
+        if rule is not self.url_rule and ip_addr in ips:
+            return BOT_WITHOUT_URL
+
+        if rule is not None:
+            rule.hits += 1
+        return classification
+
+    def reset(self) -> None:
+        """Sets the counters of all rules to zero"""
+        for rule in self.rules():
+            rule.hits = 0
+            rule.time = 0.0
+        self.scan_time = 0.0
+
+    def update(self, other: "BotRules") -> None:
+        """Adds counters of `other` with the same rules,
+        used for merging rules of worker processes"""
+        for rule, other_rule in zip(self.rules(), other.rules()):
+            rule.hits += other_rule.hits
+            rule.time += other_rule.time
+        self.scan_time += other.scan_time
+
+    def summary(self) -> List[str]:
+        """Returns lines with the counters of the rules"""
+        lines = [f"bot rules: user agent rules scanned in {self.scan_time:.3f} s"]
+        for rule in self.rules():
+            line = f"  {rule.name}: {rule.hits} hits"
+            if rule is self.url_rule or self.profile:
+                line += f", {rule.time:.3f} s"
+            lines.append(line)
+
+        return lines
@@ -1,13 +1,22 @@
 import datetime
+import json
 import os
-from typing import Dict, List, Optional
+from typing import Collection, Dict, List, Optional
 
 from logs.statistics.constants import LOG_DT_FORMAT
 from logs.statistics.dailystat import (
     DailyStats,
     SimpleDailyStats,
 )
+from logs.statistics.botrules import BotRules
+from logs.statistics.dnscache import (
+    DEFAULT_DNS_TTL,
+    DEFAULT_NEGATIVE_DNS_TTL,
+    DNS_CACHE_FILE,
+    DnsCache,
+)
 from logs.statistics.logstats import LogStats
+from logs.statistics.uacache import DEFAULT_UA_CACHE_SIZE, UserAgentCache
 
 LOG_CACHE = "logcache"
 
@@ -81,8 +90,10 @@ def log_stats_from_cache(
     bot_distrib_file: str = "bot_distrib_file",
     human_distrib_file: str = "human_distrib_file",
     last_ts_file: str = "last_ts_file",
+    years: Optional[Collection[int]] = None,
 ) -> Optional[LogStats]:
-    """Loads into `logs_stats` data from log cache
+    """Loads into `logs_stats` data from log cache,
+    if `years` are given then only files of these years are read
 
     Returns
     -------
@@ -106,11 +117,16 @@ def log_stats_from_cache(
         return
 
     log_stats = LogStats()
+    year_prefixes = None if years is None else set(map(str, years))
+
     for file in os.listdir(cache_path):
         if file == last_ts_file:
             with open(os.path.join(cache_path, last_ts_file), "r") as f:
                 log_stats.last_entry_ts = datetime.datetime.fromtimestamp(float(f.readlines()[0]), tz=datetime.timezone.utc)
 
+        elif years is not None and file.split("-")[0] not in year_prefixes:
+            continue
+
         elif bot_stats_file in file:
             year = int(file.split("-")[0])
             log_stats.switch_year(year)
@@ -209,3 +225,66 @@ def merge_simple_dailydata(older: List[SimpleDailyStats], newer:List[SimpleDaily
         return older[:-1] + [summed_stat] + newer[1:]
 
     return older + newer
+
+
+def ua_cache_to_logcache(
+    ua_cache: UserAgentCache,
+    base_path: str = ".",
+    ua_cache_file: str = "ua_cache_file",
+):
+    """Writes classifications of user agents cached in `ua_cache`
+    into log cache together with the signature of its bot rules"""
+    cache_path = os.path.join(base_path, LOG_CACHE)
+    os.makedirs(cache_path, exist_ok=True)
+
+    with open(os.path.join(cache_path, ua_cache_file), "w") as f:
+        json.dump(
+            {"signature": ua_cache.rules.signature, "user_agents": ua_cache.dump()}, f
+        )
+
+
+def ua_cache_from_logcache(
+    base_path: str = ".",
+    ua_cache_file: str = "ua_cache_file",
+    max_size: int = DEFAULT_UA_CACHE_SIZE,
+    rules: Optional[BotRules] = None,
+) -> UserAgentCache:
+    """Returns
+    -------
+    UserAgentCache
+        with bot `rules` (default rules if not given) and with at most
+        `max_size` classifications loaded from the log cache,
+        empty if the file does not exist or if the classifications
+        were made by other bot rules (its signature differs)
+    """
+    ua_cache = UserAgentCache(max_size, rules)
+    path = os.path.join(base_path, LOG_CACHE, ua_cache_file)
+
+    if not os.path.isfile(path):
+        return ua_cache
+
+    with open(path, "r") as f:
+        cached = json.load(f)
+
+    if cached.get("signature") == ua_cache.rules.signature:
+        ua_cache.load(cached["user_agents"])
+
+    return ua_cache
+
+
+def dns_cache_from_logcache(
+    base_path: str = ".",
+    dns_cache_file: str = DNS_CACHE_FILE,
+    ttl: float = DEFAULT_DNS_TTL,
+    negative_ttl: float = DEFAULT_NEGATIVE_DNS_TTL,
+) -> DnsCache:
+    """Returns
+    -------
+    DnsCache
+        opened SQLite DNS cache in the log cache, see `DnsCache`
+        for `ttl` and `negative_ttl`, it is created if it does not exist
+    """
+    cache_path = os.path.join(base_path, LOG_CACHE)
+    os.makedirs(cache_path, exist_ok=True)
+
+    return DnsCache(os.path.join(cache_path, dns_cache_file), ttl, negative_ttl)
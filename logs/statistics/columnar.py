@@ -0,0 +1,409 @@
+import datetime
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+try:
+    import numpy as np
+except ImportError:  # the columnar engine is optional
+    np = None
+
+from logs.parser.logentry import BAD_TIME, LogEntry
+from logs.parser.rejects import RejectedLines
+from logs.parser.timestamp import MONTH_NUMBERS, TIMESTAMP_LEN, TimestampDecoder
+from logs.statistics.botrules import IpRule
+from logs.statistics.groupstats import GroupStats
+from logs.statistics.ipstats import IpStats
+from logs.statistics.logstats import LogStats
+from logs.statistics.processing import SESSION_SECONDS, get_daily_stats
+from logs.statistics.uacache import UserAgentCache
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+EPOCH_WEEKDAY = datetime.date(1970, 1, 1).weekday()
+
+# layout of timestamps, e.g. `10/Oct/2000:13:55:36 -0700`
+DIGIT_POSITIONS = [0, 1, 7, 8, 9, 10, 12, 13, 15, 16, 18, 19, 22, 23, 24, 25]
+SEPARATORS = {2: "/", 6: "/", 11: ":", 14: ":", 17: ":", 20: " "}
+MONTH_POSITIONS = [3, 4, 5]
+
+TimeColumns = Tuple["np.ndarray", ...]
+# `(<valid>, <unix timestamp>, <year>, <month>, <hour>, <local day number>)`,
+# local day number is the number of days from 1970-01-01 to the local date
+
+
+def process_entries_columnar(
+    log_stats: LogStats,
+    buffers: Iterator[Iterable[LogEntry]],
+    bots_set: Container[str],
+    from_time: datetime.datetime,
+    rejects: Optional[RejectedLines] = None,
+    first_seen: Optional[Dict[Tuple[int, bool, str], datetime.datetime]] = None,
+    years: Optional[Set[int]] = None,
+    ua_cache: Optional[UserAgentCache] = None,
+) -> None:
+    """Adds parsed log entries from `buffers` to `log_stats`
+    with the same result as `logs.statistics.processing.process_entries`,
+    see its parameters.
+
+    Each buffer is turned into columns of ids of interned times,
+    IP addresses and user agents. The distinct times are decoded
+    into unix timestamps and day numbers by numpy and user agents
+    are classified once for each distinct value in the buffer
+    by `ua_cache`.
+    The distributions, request and session counts and daily data
+    are then updated by numpy for the whole buffer.
+    Datetime objects are created only for the times stored in `log_stats`,
+    times of the last entries of IpStats are set after all the buffers.
+
+    Raises ImportError if numpy is not installed.
+    """
+    if np is None:
+        raise ImportError("columnar processing requires numpy")
+
+    decode_time = TimestampDecoder().decode
+    ua_cache = UserAgentCache() if ua_cache is None else ua_cache
+    from_ts = from_time.timestamp()
+    last_times: Dict[IpStats, Tuple[int, str]] = {}
+
+    for buffer in buffers:
+        _add_buffer(
+            log_stats,
+            buffer,
+            bots_set,
+            decode_time,
+            ua_cache,
+            from_ts,
+            rejects,
+            first_seen,
+            years,
+            last_times,
+        )
+
+    for ip_stat, (_, timestamp) in last_times.items():
+        ip_stat.datetime, ip_stat.timestamp = decode_time(timestamp)
+
+
+def decode_timestamps(
+    timestamps: List[str],
+    decode_time: Callable[[str], Tuple[datetime.datetime, float]],
+) -> TimeColumns:
+    """Decodes `timestamps` of log entries into columns, see `TimeColumns`.
+
+    Timestamps in the exact layout of `LOG_DT_FORMAT` are decoded by numpy,
+    the other are decoded by `decode_time`
+    (`logs.parser.timestamp.TimestampDecoder.decode`),
+    timestamps which it can not decode are not valid.
+    """
+    size = len(timestamps)
+    chars = (
+        np.array(timestamps, dtype=f"U{TIMESTAMP_LEN + 1}")
+        .view(np.uint32)
+        .reshape(size, TIMESTAMP_LEN + 1)
+        .astype(np.int64)
+    )
+
+    # the layout, timestamps longer than the layout are truncated by one character
+    valid = (chars[:, TIMESTAMP_LEN - 1] != 0) & (chars[:, TIMESTAMP_LEN] == 0)
+    digits = chars[:, DIGIT_POSITIONS] - ord("0")
+    valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+    for position, separator in SEPARATORS.items():
+        valid &= chars[:, position] == ord(separator)
+    sign = chars[:, 21]
+    valid &= (sign == ord("+")) | (sign == ord("-"))
+    digits[~valid] = 0  # values of other layouts are computed below
+
+    month_names = sorted(MONTH_NUMBERS)
+    month_codes = np.array(
+        [_month_code([ord(c) for c in name]) for name in month_names], dtype=np.int64
+    )
+    codes = _month_code([chars[:, i] for i in MONTH_POSITIONS])
+    found = np.searchsorted(month_codes, codes).clip(0, len(month_names) - 1)
+    valid &= month_codes[found] == codes
+    month = np.array([MONTH_NUMBERS[name] for name in month_names])[found]
+
+    day, year, hour, minute, second, tz_hours, tz_minutes = (
+        digits[:, 0] * 10 + digits[:, 1],
+        digits[:, 2] * 1000 + digits[:, 3] * 100 + digits[:, 4] * 10 + digits[:, 5],
+        digits[:, 6] * 10 + digits[:, 7],
+        digits[:, 8] * 10 + digits[:, 9],
+        digits[:, 10] * 10 + digits[:, 11],
+        digits[:, 12] * 10 + digits[:, 13],
+        digits[:, 14] * 10 + digits[:, 15],
+    )
+
+    # days from 1970-01-01 to the first day of the month and of the next month
+    months = (year - 1970) * 12 + month - 1
+    month_start = months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    next_start = (months + 1).astype("datetime64[M]").astype("datetime64[D]")
+    valid &= (year >= 1) & (day >= 1) & (day <= next_start.astype(np.int64) - month_start)
+    valid &= (hour < 24) & (minute < 60) & (second < 60)
+    valid &= (tz_hours < 24) & (tz_minutes < 60)
+
+    days = month_start + day - 1
+    offset = (tz_hours * 3600 + tz_minutes * 60) * np.where(sign == ord("-"), -1, 1)
+    ts = days * 86400 + hour * 3600 + minute * 60 + second - offset
+
+    # the other layouts
+    for i in np.flatnonzero(~valid).tolist():
+        try:
+            dt, timestamp = decode_time(timestamps[i])
+        except ValueError:
+            continue
+
+        valid[i] = True
+        ts[i] = int(timestamp)
+        year[i] = dt.year
+        month[i] = dt.month
+        hour[i] = dt.hour
+        days[i] = dt.toordinal() - EPOCH_ORDINAL
+
+    return (valid, ts, year, month, hour, days)
+
+
+def _month_code(chars):
+    """Returns number encoding the three characters of month name"""
+    return (chars[0] << 42) | (chars[1] << 21) | chars[2]
+
+
+def _add_buffer(
+    log_stats: LogStats,
+    buffer: Iterable[LogEntry],
+    bots_set: Container[str],
+    decode_time: Callable[[str], Tuple[datetime.datetime, float]],
+    ua_cache: UserAgentCache,
+    from_ts: float,
+    rejects: Optional[RejectedLines],
+    first_seen: Optional[Dict[Tuple[int, bool, str], datetime.datetime]],
+    years: Optional[Set[int]],
+    last_times: Dict[IpStats, Tuple[int, str]],
+) -> None:
+    """Adds log entries from one `buffer` to `log_stats`,
+    see `process_entries_columnar`.
+
+    `last_times` maps IpStats to the unix timestamp and the timestamp
+    of their last entry, which are not set to their `datetime` yet.
+    """
+    timestamps: Dict[str, int] = {}
+    ips: Dict[str, int] = {}
+    agents: Dict[str, int] = {}
+    entries = []
+    time_ids = []
+    ip_ids = []
+    agent_ids = []
+    rejected = []
+
+    for entry in buffer:
+        if len(entry) != 9:
+            rejected.append((len(entries), 0, entry, None))
+            continue
+
+        entries.append(entry)
+        time_ids.append(timestamps.setdefault(entry.time, len(timestamps)))
+        ip_ids.append(ips.setdefault(entry.ip_addr, len(ips)))
+        agent_ids.append(agents.setdefault(entry.user_agent, len(agents)))
+
+    if not entries:
+        _reject(rejects, rejected)
+        return
+
+    # the time columns are decoded for distinct times, then indexed by entries
+    timestamp_list = list(timestamps)
+    valid, times_ts, times_year, times_month, times_hour, times_days = (
+        decode_timestamps(timestamp_list, decode_time)
+    )
+    processed = valid & (times_ts > from_ts)
+    if years is not None:
+        processed &= np.isin(times_year, list(years))
+
+    all_t = np.array(time_ids, dtype=np.intp)
+    if rejects is not None and not valid.all():
+        # rejected entries are ordered as in the buffer
+        for i in np.flatnonzero(~valid[all_t]).tolist():
+            rejected.append((i, 1, entries[i], BAD_TIME))
+        rejected.sort(key=lambda rejection: rejection[:2])
+    _reject(rejects, rejected)
+
+    selected = np.flatnonzero(processed[all_t])
+    if not len(selected):
+        return
+
+    # columns of processed entries
+    t = all_t[selected]
+    ip = np.array(ip_ids, dtype=np.int64)[selected]
+    agent = np.array(agent_ids, dtype=np.intp)[selected]
+    ts = times_ts[t]
+    days = times_days[t]
+    dts: Dict[int, datetime.datetime] = {}
+
+    def entry_datetime(i: int) -> datetime.datetime:
+        """Returns the same datetime of i-th processed entry
+        as `process_entries` would"""
+        time_id = int(t[i])
+        dt = dts.get(time_id)
+        if dt is None:
+            dt, _ = decode_time(timestamp_list[time_id])
+            dts[time_id] = dt
+        return dt
+
+    # bot classification of distinct user agents and IP addresses,
+    # the hits of the rules are counted for the processed entries
+    # as by `UserAgentCache.classify_entry`
+    ip_list = list(ips)
+    agent_lookups = [ua_cache.lookup(user_agent) for user_agent in agents]
+    agent_classifications = [classification for classification, _ in agent_lookups]
+    agent_bots = np.array(
+        [agent_bot for agent_bot, _ in agent_classifications], dtype=bool
+    )
+    url_rule = ua_cache.rules.url_rule
+    agent_urls = np.array([rule is url_rule for _, rule in agent_lookups], dtype=bool)
+    match_ip = bots_set.match if isinstance(bots_set, IpRule) else bots_set.__contains__
+    ip_bots = np.array([match_ip(ip_addr) for ip_addr in ip_list], dtype=bool)
+    by_ip = ip_bots[ip] & ~agent_urls[agent]
+    is_bot = agent_bots[agent] | by_ip
+
+    if isinstance(bots_set, IpRule):
+        bots_set.hits += int(np.count_nonzero(by_ip))
+    agent_hits = np.bincount(agent[~by_ip], minlength=len(agent_lookups))
+    for (_, rule), hits in zip(agent_lookups, agent_hits.tolist()):
+        if rule is not None:
+            rule.hits += hits
+
+    # years and dates are numbered in the order of their first entries
+    year_list, year = _first_seen_order(times_year[t])
+    date_list, date = _first_seen_order(days)
+
+    for y in year_list:
+        if y not in log_stats.year_stats:
+            log_stats.year_stats[y] = (GroupStats(), GroupStats())
+
+    # group of an entry is its year and bot flag, key is group and IP address
+    group = year * 2 + is_bot
+    key = group * len(ip_list) + ip
+    keys, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    # IpStats of the keys, new ones are created in the order of their first entries
+    ip_stats: List[Optional[IpStats]] = [None] * len(keys)
+    for k in np.argsort(first, kind="stable").tolist():
+        i = int(first[k])
+        bot = bool(is_bot[i])
+        ip_addr = ip_list[ip[i]]
+        group_stats = log_stats.year_stats[year_list[year[i]]][0 if bot else 1]
+
+        ip_stat = group_stats.stats.get(ip_addr)
+        if ip_stat is None:
+            # user agents which are not bots have no url
+            _, bot_url = agent_classifications[agent[i]]
+            ip_stat = IpStats(ip_addr, bot, bot_url)
+            group_stats.stats[ip_addr] = ip_stat
+            if first_seen is not None:
+                first_seen[(year_list[year[i]], bot, ip_addr)] = entry_datetime(i)
+        ip_stats[k] = ip_stat
+
+    # sessions from entries of each key in their order,
+    # the first entry is compared with the last entry in IpStats
+    order = np.argsort(inverse, kind="stable")
+    sorted_keys = inverse[order]
+    sorted_ts = ts[order]
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    ends = np.ones(len(order), dtype=bool)
+    ends[:-1] = starts[1:]
+
+    previous = np.empty_like(sorted_ts)
+    previous[1:] = sorted_ts[:-1]
+    previous[starts] = [
+        last_times[ip_stat][0]
+        if ip_stat in last_times
+        else int(ip_stat.timestamp)
+        for ip_stat in ip_stats
+    ]
+    new_sess = np.empty(len(order), dtype=bool)
+    new_sess[order] = np.abs(sorted_ts - previous) >= SESSION_SECONDS
+
+    requests = np.bincount(inverse, minlength=len(keys))
+    sessions = np.zeros(len(keys), dtype=np.int64)
+    np.add.at(sessions, inverse, new_sess.astype(np.int64))
+
+    last_ts = sorted_ts[ends].tolist()
+    for k, i in enumerate(order[ends].tolist()):
+        ip_stat = ip_stats[k]
+        ip_stat.requests_num += int(requests[k])
+        ip_stat.sessions_num += int(sessions[k])
+        last_times[ip_stat] = (last_ts[k], timestamp_list[t[i]])
+
+    # distributions of groups
+    groups = 2 * len(year_list)
+    for name, parts, size in (
+        ("day", times_hour[t], 24),
+        ("week", (days + EPOCH_WEEKDAY) % 7, 7),
+        ("month", times_month[t] - 1, 12),
+    ):
+        bins = group * size + parts
+        req_distribs = np.bincount(bins, minlength=groups * size)
+        sess_distribs = np.bincount(bins[new_sess], minlength=groups * size)
+
+        for g in range(groups):
+            group_stats = log_stats.year_stats[year_list[g // 2]][1 - g % 2]
+            distribs = slice(g * size, (g + 1) * size)
+            _add_counts(getattr(group_stats, f"{name}_req_distrib"), req_distribs[distribs])
+            _add_counts(
+                getattr(group_stats, f"{name}_sess_distrib"), sess_distribs[distribs]
+            )
+
+    # daily data in the order of the first entries of dates
+    date_requests = np.bincount(date, minlength=len(date_list))
+    date_sessions = np.bincount(date[new_sess & ~is_bot], minlength=len(date_list))
+    daily = [
+        get_daily_stats(log_stats, datetime.date.fromordinal(d + EPOCH_ORDINAL))
+        for d in date_list
+    ]
+
+    for d, daily_stats in enumerate(daily):
+        daily_stats.requests += int(date_requests[d])
+        daily_stats.sessions += int(date_sessions[d])
+
+    # IP addresses are added in the order of their first entries,
+    # so the sets are the same as if they were added one by one
+    pairs, first = np.unique(date * len(ip_list) + ip, return_index=True)
+    for pair in pairs[np.argsort(first, kind="stable")].tolist():
+        daily[pair // len(ip_list)].ips.add(ip_list[pair % len(ip_list)])
+
+    # the first of the latest entries, the last entry sets the current year
+    i = int(np.argmax(ts))
+    if ts[i] > log_stats.last_entry_ts.timestamp():
+        log_stats.last_entry_ts = entry_datetime(i)
+
+    log_stats.switch_year(year_list[year[-1]])
+
+
+def _first_seen_order(values) -> Tuple[List[int], "np.ndarray"]:
+    """Numbers distinct `values` in the order of their first occurrence,
+    returns the list of distinct values and the numbers of `values`"""
+    distinct, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    numbers = np.empty(len(order), dtype=np.intp)
+    numbers[order] = np.arange(len(order))
+    return (distinct[order].tolist(), numbers[inverse.reshape(-1)])
+
+
+def _add_counts(distrib: List[int], counts) -> None:
+    """Adds numpy array of `counts` to the list `distrib` in place"""
+    for i, count in enumerate(counts.tolist()):
+        distrib[i] += count
+
+
+def _reject(rejects: Optional[RejectedLines], rejected: List[tuple]) -> None:
+    """Counts `rejected` tuples `(<index of complete entry>, <order>, <entry>, <reason>)`
+    into `rejects`, incomplete entries are before the complete entry with the index"""
+    if rejects is not None:
+        for _, _, entry, reason in rejected:
+            rejects.reject(entry, reason)
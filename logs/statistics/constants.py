@@ -44,6 +44,9 @@ def old_date() -> datetime.datetime:
         "01/Jan/1980:00:00:00 +0000", "%d/%b/%Y:%H:%M:%S %z"
     )
 
+
+OLD_DATE = old_date()  # datetime is immutable, so the object can be shared
+
 """
 ========== Other ==========
 """
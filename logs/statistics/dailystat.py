@@ -1,4 +1,4 @@
-from typing import Set, NamedTuple
+from typing import Set
 import datetime
 from typing import Optional
 
@@ -9,8 +9,9 @@ LOG_DELIM = "\t"
 ###################
 ##### CLASSES #####
 ###################
-class DailyStats(NamedTuple):
-    """Data structure to strore information for single day
+class DailyStats:
+    """Data structure to strore information for single day,
+    it is updated in place for each log entry from the day
     Attribures
     ----------
     date: datetime.date
@@ -20,10 +21,23 @@ class DailyStats(NamedTuple):
     sessions: int
     """
 
-    date: datetime.date
-    ips: Set[str]
-    requests: int
-    sessions: int
+    __slots__ = ("date", "ips", "requests", "sessions")
+
+    def __init__(
+        self,
+        date: datetime.date,
+        ips: Set[str],
+        requests: int,
+        sessions: int,
+    ):
+        self.date = date
+        self.ips = ips
+        self.requests = requests
+        self.sessions = sessions
+
+    def __iter__(self):
+        for slot in self.__slots__:
+            yield getattr(self, slot)
 
 
 class SimpleDailyStats:
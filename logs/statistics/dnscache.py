@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from logs.helpers.dns import (
+    DEFAULT_DNS_TIMEOUT,
+    DEFAULT_DNS_WORKERS,
+    host_address_of,
+    host_name_of,
+    resolve_concurrently,
+)
+
+DNS_CACHE_FILE = "dns_cache.db"
+DEFAULT_DNS_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_NEGATIVE_DNS_TTL = 24 * 3600  # seconds
+
+# kinds of cached lookups
+FORWARD = "A"  # host name to IP address
+PTR = "PTR"  # IP address to host name
+
+SQL_CHUNK = 500  # number of keys in one `IN` clause
+
+
+LOOKUPS = {FORWARD: host_address_of, PTR: host_name_of}
+FAILED = ""  # result of a failed lookup, which is stored as negative result
+
+
+def _failing_lookup(kind: str) -> Callable[[str], str]:
+    """Returns lookup of `kind` which returns `FAILED` instead of raising,
+    so failed lookups can be told from abandoned ones"""
+    lookup = LOOKUPS[kind]
+
+    def failing_lookup(key: str) -> str:
+        try:
+            return lookup(key)
+        except Exception:
+            return FAILED
+
+    return failing_lookup
+
+
+class DnsCache:
+    """SQLite cache of forward (`FORWARD`) and reverse (`PTR`) DNS lookups.
+
+    Results are cached for `ttl` seconds, failed lookups (negative results)
+    for `negative_ttl` seconds. Looked up results are also kept in memory,
+    `prefetch` loads results of many keys at once.
+    `hits` and `misses` count lookups answered by the cache and the resolver.
+    """
+
+    def __init__(
+        self,
+        path: str = DNS_CACHE_FILE,
+        ttl: float = DEFAULT_DNS_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_DNS_TTL,
+    ):
+        self._path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._memo: Dict[Tuple[str, str], Optional[str]] = {}
+        self.__connection = None
+
+        directory = os.path.dirname(os.path.realpath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connect()
+
+    def connect(self):
+        self.__connection = sqlite3.connect(self._path)
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS dns(kind, key, value, expires, "
+            "PRIMARY KEY (kind, key))"
+        )
+        self.__connection.commit()
+
+    def close(self):
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def prefetch(self, kind: str, keys: Iterable[str]) -> None:
+        """Loads unexpired cached results of `kind` for `keys` into memory"""
+        if self.__connection is None:
+            self.connect()
+
+        keys = [key for key in set(keys) if (kind, key) not in self._memo]
+        now = time.time()
+
+        for i in range(0, len(keys), SQL_CHUNK):
+            chunk = keys[i : i + SQL_CHUNK]
+            res = self.__connection.execute(
+                "SELECT key, value FROM dns WHERE kind=? AND expires>? "
+                f"AND key IN ({', '.join('?' * len(chunk))})",
+                [kind, now, *chunk],
+            )
+            for key, value in res:
+                self._memo[(kind, key)] = value
+
+    def store(self, kind: str, results: Dict[str, Optional[str]]) -> None:
+        """Stores `results` of lookups of `kind`, `None` is a failed lookup"""
+        if self.__connection is None:
+            self.connect()
+
+        now = time.time()
+        with self.__connection:
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO dns VALUES(?, ?, ?, ?)",
+                [
+                    (
+                        kind,
+                        key,
+                        value,
+                        now + (self.negative_ttl if value is None else self.ttl),
+                    )
+                    for key, value in results.items()
+                ],
+            )
+        for key, value in results.items():
+            self._memo[(kind, key)] = value
+
+    def resolve(
+        self,
+        kind: str,
+        keys: Iterable[str],
+        workers: int = DEFAULT_DNS_WORKERS,
+        timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+        budget: Optional[float] = None,
+    ) -> Dict[str, Optional[str]]:
+        """Returns results of lookups of `kind` for distinct `keys`,
+        keys which are not cached are resolved concurrently
+        (see `logs.helpers.dns.resolve_concurrently`) and stored,
+        results of abandoned lookups are `None`, but they are not stored"""
+        keys = list(dict.fromkeys(keys))
+        self.prefetch(kind, keys)
+
+        missing = [key for key in keys if (kind, key) not in self._memo]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            resolved = resolve_concurrently(
+                missing, _failing_lookup(kind), workers, timeout, budget
+            )
+            self.store(
+                kind,
+                {
+                    key: None if value == FAILED else value
+                    for key, value in resolved.items()
+                    if value is not None  # abandoned lookups are not stored
+                },
+            )
+
+        return {key: self._memo.get((kind, key)) for key in keys}
+
+    def host_to_ip(self, host: str) -> Tuple[bool, str]:
+        """Cached `logs.statistics.ipstats.host_to_ip`"""
+        ip = self.resolve(FORWARD, [host], workers=1)[host]
+        return (False, host) if ip is None else (True, ip)
+
+    def ip_to_host(self, ip: str) -> Optional[str]:
+        """Returns host name of `ip` by cached PTR lookup,
+        `None` if it could not be resolved"""
+        return self.resolve(PTR, [ip], workers=1)[ip]
+
+    def summary(self) -> str:
+        """Returns one line summary of the counters"""
+        return f"DNS cache: {self.hits} hits, {self.misses} misses"
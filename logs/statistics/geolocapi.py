@@ -1,11 +1,242 @@
-import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+# www.geoplugin.net api oficial limit is 120 requsts/min,
+# at most 3 requests per 2 seconds are made
+GEOPLUGIN_URL = "http://www.geoplugin.net/json.gp?ip={ip}"
+GEOPLUGIN_COUNTRY_FIELD = "geoplugin_countryName"
+DEFAULT_GEOLOC_RATE = 1.5  # requests per second
+DEFAULT_GEOLOC_BURST = 3
+DEFAULT_GEOLOC_WORKERS = 4
+DEFAULT_GEOLOC_RETRIES = 2
+DEFAULT_GEOLOC_BACKOFF = 1.0  # seconds
+DEFAULT_GEOLOC_TIMEOUT = 5.0  # seconds
+DEFAULT_BATCH_SIZE = 100
+
+UNKNOWN = "Unknown"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread safe token bucket rate limiter,
+    allows `rate` acquisitions per second on average
+    and bursts of at most `capacity` acquisitions.
+
+    Tokens are reserved in the order of `acquire` calls,
+    the caller sleeps until its reserved tokens are refilled,
+    so callers sharing the bucket never exceed the rate together.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Takes `tokens`, sleeps if they are not available,
+        returns the number of seconds slept"""
+        if not self.rate:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self.rate)
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class GeolocClient:
+    """Client of a geolocation API with concurrent requests.
+
+    All requests (including retries) of all threads share one
+    `TokenBucket` limiting them to `rate` requests per second
+    with bursts of `burst` requests. `geolocate_many` pipelines
+    requests in `workers` threads, so slow responses do not waste the rate.
+
+    Failed requests (connection errors, timeouts after `timeout` seconds,
+    HTTP status codes from `RETRY_STATUS_CODES`) are retried
+    at most `retries` times, with exponential backoff starting
+    at `backoff` seconds.
+
+    Parameters
+    ----------
+    base_url: str
+        URL template of the API with `{ip}` placeholder,
+        e.g. URL of a local stub server for benchmarks
+    country_field: str
+        field of the JSON response with the country
+    batch_url: str, optional
+        default: `None`; URL of a batch endpoint, if the API offers one,
+        which accepts POST with JSON list of IP addresses
+        and returns list of JSON objects in the same order
+        (e.g. `http://ip-api.com/batch` with `country_field="country"`),
+        one batch of at most `batch_size` IPs costs one token
+
+    Attributes
+    ----------
+    requests, retried, failures: int
+        counters of made requests, retried requests
+        and IPs which could not be geolocated
+    """
+
+    def __init__(
+        self,
+        base_url: str = GEOPLUGIN_URL,
+        country_field: str = GEOPLUGIN_COUNTRY_FIELD,
+        rate: Optional[float] = DEFAULT_GEOLOC_RATE,
+        burst: int = DEFAULT_GEOLOC_BURST,
+        workers: int = DEFAULT_GEOLOC_WORKERS,
+        retries: int = DEFAULT_GEOLOC_RETRIES,
+        backoff: float = DEFAULT_GEOLOC_BACKOFF,
+        timeout: Optional[float] = DEFAULT_GEOLOC_TIMEOUT,
+        batch_url: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.base_url = base_url
+        self.country_field = country_field
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = max(workers, 1)
+        self.retries = max(retries, 0)
+        self.backoff = backoff
+        self.timeout = timeout
+        self.batch_url = batch_url
+        self.batch_size = max(batch_size, 1)
+
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self._local = threading.local()  # `requests.Session` of each thread
+        self._lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
 
-__geoloc_tokens = None  # www.geoplugin.net api oficial limit is 120 requsts/min
-_TOKEN_MAX = 3
-__last_geoloc_ts = time.time()  # time stamp of the last call to geolocation API
-_SLEEP_TIME = 2  # seconds
-_SESSION = requests.Session()  # for geolocation API
+    def _count(self, requests_num: int = 0, retried: int = 0, failures: int = 0):
+        with self._lock:
+            self.requests += requests_num
+            self.retried += retried
+            self.failures += failures
+
+    def _request(self, method: str, url: str, **kwargs):
+        """Makes rate limited request with retries,
+        returns decoded JSON, `None` if all attempts failed"""
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count(retried=1)
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            self.bucket.acquire()
+            self._count(requests_num=1)
+            try:
+                response = self._session().request(
+                    method, url, timeout=self.timeout, **kwargs
+                )
+            except requests.RequestException:
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                continue
+            try:
+                return response.json()
+            except ValueError:
+                return None
+
+        return None
+
+    def _country(self, response) -> str:
+        try:
+            return response[self.country_field] or UNKNOWN
+        except (KeyError, TypeError):
+            return UNKNOWN
+
+    def geolocate(self, ip: str) -> str:
+        """Returns country of `ip`, `"Unknown"` if it couldn't be found"""
+        location = self._country(self._request("GET", self.base_url.format(ip=ip)))
+        if location == UNKNOWN:
+            self._count(failures=1)
+        return location
+
+    def _geolocate_batch(self, ips: List[str]) -> List[str]:
+        response = self._request("POST", self.batch_url, json=ips)
+        if not isinstance(response, list) or len(response) != len(ips):
+            response = [None] * len(ips)
+
+        locations = [self._country(item) for item in response]
+        self._count(failures=locations.count(UNKNOWN))
+        return locations
+
+    def geolocate_many(self, ips: Iterable[str]) -> Dict[str, str]:
+        """Geolocates distinct `ips` concurrently, by the batch endpoint
+        if the client has one
+
+        Returns
+        -------
+        Dict[str, str]
+            maps each IP address to its country or `"Unknown"`
+        """
+        ips = list(dict.fromkeys(ips))
+        if not ips:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            if self.batch_url is None:
+                locations = list(executor.map(self.geolocate, ips))
+            else:
+                batches = [
+                    ips[i : i + self.batch_size]
+                    for i in range(0, len(ips), self.batch_size)
+                ]
+                locations = [
+                    location
+                    for batch in executor.map(self._geolocate_batch, batches)
+                    for location in batch
+                ]
+
+        return dict(zip(ips, locations))
+
+    def summary(self) -> str:
+        """Returns one line summary of the counters"""
+        return (
+            f"geolocation API: {self.requests} requests, "
+            f"{self.retried} retries, {self.failures} failures"
+        )
+
+
+_default_client: Optional[GeolocClient] = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> GeolocClient:
+    """Returns the client used by `geolocate`,
+    a `GeolocClient` of www.geoplugin.net unless set by `set_default_client`"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = GeolocClient()
+        return _default_client
+
+
+def set_default_client(client: GeolocClient) -> None:
+    """Sets the client used by `geolocate`"""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
 
 
 def geolocate(ip: str) -> str:
@@ -26,30 +257,7 @@ def geolocate(ip: str) -> str:
     Note
     ----
     There is a limit for number of requests on the API,
-    so the function will wait if the rate exceeds 3 calls per 2 seconds.
+    calls are rate limited by the token bucket of `default_client()`,
+    which allows 3 calls per 2 seconds, shared by all threads.
     """
-    global __geoloc_tokens
-    global __last_geoloc_ts
-    time_from_last_call = __last_geoloc_ts - time.time()
-
-    if __geoloc_tokens is None or time_from_last_call > _SLEEP_TIME:
-        __geoloc_tokens = _TOKEN_MAX
-
-    if not __geoloc_tokens:
-        time.sleep(_SLEEP_TIME - time_from_last_call)
-        __geoloc_tokens = _TOKEN_MAX
-
-    __geoloc_tokens -= 1
-    __last_geoloc_ts = time.time()
-
-    return _geoplugin_call(ip)
-
-
-def _geoplugin_call(ip: str) -> str:
-    try:
-        response = _SESSION.get(f"http://www.geoplugin.net/json.gp?ip={ip}").json()
-        location = response["geoplugin_countryName"]
-    except:  # noqa: E722
-        location = "Unknown"
-
-    return location
+    return default_client().geolocate(ip)
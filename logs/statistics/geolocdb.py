@@ -1,12 +1,21 @@
 import sqlite3
 import os
 import datetime as dt
-from typing import Optional, Tuple
+from typing import Dict, Iterable, Optional, Tuple
 
 from logs.statistics.constants import DATE_FORMAT, GEOLOC_DB_PATH
 
+SQL_CHUNK = 500  # number of IPs in one `IN` clause
+
 
 class GeolocDB:
+    """SQLite database of resolved geolocations, one row for each IP address.
+
+    The database is in WAL journal mode, so commits are cheap,
+    and `get_geolocations` and `upsert_geolocations` read and write
+    many IP addresses in few statements and a single transaction.
+    """
+
     def __init__(self, path: str = GEOLOC_DB_PATH):
         self._path = path
         self.__cursor = None
@@ -18,13 +27,17 @@ class GeolocDB:
     def conntect(self):
         self.__connection = sqlite3.connect(self._path)
         self.__cursor = self.__connection.cursor()
+        self.__cursor.execute("PRAGMA journal_mode=WAL")
 
         if self._is_empty():
             self._create_geoloc_table()
+        self._ensure_unique_ip()
 
     def close(self):
         if self.__connection is not None:
             self.__connection.close()
+            self.__connection = None
+            self.__cursor = None
 
     def _is_empty(self):
         res = self.__cursor.execute(
@@ -34,10 +47,27 @@ class GeolocDB:
 
     def _create_geoloc_table(self):
         self.__cursor.execute("CREATE TABLE geolocations(ip, geolocation, timestamp)")
-        self.__cursor.execute("CREATE INDEX index_geolocations ON geolocations (ip)")
+
+    def _ensure_unique_ip(self):
+        """Creates unique index on ip, databases created by older versions
+        can contain duplicates, of which the last inserted rows are kept"""
+        res = self.__cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name='unique_geolocations_ip'"
+        )
+        if res.fetchone() is not None:
+            return
+
+        with self.__connection:
+            self.__connection.execute(
+                "DELETE FROM geolocations WHERE rowid NOT IN "
+                "(SELECT MAX(rowid) FROM geolocations GROUP BY ip)"
+            )
+            self.__connection.execute("DROP INDEX IF EXISTS index_geolocations")
+            self.__connection.execute(
+                "CREATE UNIQUE INDEX unique_geolocations_ip ON geolocations (ip)"
+            )
 
     def get_geolocation(self, ip: str) -> Optional[Tuple[str, str]]:
-        # Assumes only one row for a single ip address
         if self.__cursor is None:
             self.conntect()
 
@@ -46,6 +76,33 @@ class GeolocDB:
         )
         return res.fetchone()
 
+    def get_geolocations(self, ips: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+        """Looks up geolocations of `ips` in chunks of `SQL_CHUNK` IPs
+
+        Returns
+        -------
+        Dict[str, Tuple[str, str]]
+            maps IP addresses found in the database
+            to `(<geolocation>, <timestamp>)`
+        """
+        if self.__cursor is None:
+            self.conntect()
+
+        ips = list(set(ips))
+        found: Dict[str, Tuple[str, str]] = {}
+
+        for i in range(0, len(ips), SQL_CHUNK):
+            chunk = ips[i : i + SQL_CHUNK]
+            res = self.__cursor.execute(
+                "SELECT ip, geolocation, timestamp FROM geolocations "
+                f"WHERE ip IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for ip, geolocation, timestamp in res:
+                found[ip] = (geolocation, timestamp)
+
+        return found
+
     def get_all(self):
         if self.__cursor is None:
             self.conntect()
@@ -54,12 +111,17 @@ class GeolocDB:
         return res.fetchall()
 
     def insert_geolocation(self, ip: str, geolocation: str):
+        self.upsert_geolocations({ip: geolocation})
+
+    def upsert_geolocations(self, geolocations: Dict[str, str]) -> None:
+        """Inserts or replaces geolocations of IP addresses
+        from `geolocations`, `{<ip>: <geolocation>}`, in one transaction"""
         if self.__cursor is None:
             self.conntect()
 
-        date = dt.date.today()
-        self.__cursor.execute(
-            "INSERT INTO geolocations VALUES(?, ?, ?)",
-            (ip, geolocation, date.__format__(DATE_FORMAT)),
-        )
-        self.__connection.commit()
+        date = dt.date.today().__format__(DATE_FORMAT)
+        with self.__connection:
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO geolocations VALUES(?, ?, ?)",
+                [(ip, geolocation, date) for ip, geolocation in geolocations.items()],
+            )
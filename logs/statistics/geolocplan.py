@@ -0,0 +1,132 @@
+from typing import Dict, Iterable, List, Optional
+
+from logs.helpers.simplelogger import SimpleLogger
+from logs.statistics.geolocapi import GeolocClient
+from logs.statistics.geolocdb import GeolocDB
+from logs.statistics.geolocranges import GeolocRanges
+from logs.statistics.ipstats import UNRESLOVED, update_geolocations
+from logs.statistics.print import make_geoloc_samples, most_frequent_stats
+from logs.statistics.processing import IpStats, LogStats
+
+
+class GeolocPlan:
+    """IpStats geolocated by all outputs of a run, collected before
+    any html is made, so that each IP address is geolocated once.
+
+    The same IP address has own IpStats in each year, it can be
+    in the most frequent tables of bots, human users and histograms
+    and in samples of several years and test repetitions.
+    `resolve` looks up each distinct IP address once and sets
+    the geolocation of all its IpStats, so the outputs do not
+    geolocate anything.
+
+    Attributes
+    ----------
+    samples: Dict[int, List[IpStats]]
+        geolocation sample of each year, for `print_stats`
+    test_samples: List[List[IpStats]]
+        samples of the repetitions of `test_geolocation`
+    stats: List[IpStats]
+        all IpStats to be geolocated, without duplicates
+    """
+
+    def __init__(self):
+        self.samples: Dict[int, List[IpStats]] = {}
+        self.test_samples: List[List[IpStats]] = []
+        self.stats: List[IpStats] = []
+        self._ids = set()
+
+    def add(self, stats: Iterable[IpStats]) -> None:
+        """Adds `stats` to be geolocated"""
+        for ip_stat in stats:
+            if id(ip_stat) not in self._ids:
+                self._ids.add(id(ip_stat))
+                self.stats.append(ip_stat)
+
+    def resolve(
+        self,
+        geoloc_db: Optional[GeolocDB] = None,
+        geoloc_provider: Optional[GeolocRanges] = None,
+        client: Optional[GeolocClient] = None,
+        logger: Optional[SimpleLogger] = None,
+    ) -> None:
+        """Geolocates all planned IpStats which are not geolocated yet,
+        see `logs.statistics.ipstats.update_geolocations`,
+        the number of lookups saved by the deduplication is logged,
+        i.e. the number of valid IpStats minus the number of their distinct IPs,
+        without `geoloc_provider` also the number of IPs found in `geoloc_db`"""
+        if logger is not None:
+            logger.addTask("geolocation")
+
+        stats = [ip_stat for ip_stat in self.stats if ip_stat.geolocation == UNRESLOVED]
+        lookups = update_geolocations(stats, geoloc_db, geoloc_provider, client)
+
+        if logger is not None:
+            logger.finishTask("geolocation")
+            valid = [ip_stat for ip_stat in stats if ip_stat.valid_ip]
+            ips = len({ip_stat.ip_addr for ip_stat in valid})
+            # the provider is used instead of the database
+            found = ""
+            if geoloc_provider is None:
+                found = f"{ips - lookups} found in database, "
+            logger.logMessage(
+                f"geolocation plan: {len(valid)} IpStats of {ips} distinct IPs, "
+                f"{found}{lookups} looked up, {len(valid) - ips} lookups saved"
+            )
+
+
+def plan_geolocation(
+    log_stats: LogStats,
+    years: Iterable[int],
+    sample_size: int,
+    test_year: Optional[int] = None,
+    test_repetitions: int = 0,
+    histogram_years: Iterable[int] = (),
+) -> GeolocPlan:
+    """Makes `GeolocPlan` of the outputs of a run
+
+    Parameters
+    ----------
+    log_stats: LogStats
+    years: Iterable[int]
+        years of output htmls, their most frequent tables
+        and samples of size `sample_size` are planned
+    sample_size: int
+        size of the samples, see `logs.statistics.print.make_geoloc_samples`
+    test_year: int, optional
+        default: `None`; if given and present in `log_stats`,
+        then `test_repetitions` samples of the year
+        for `test_geolocation` are planned
+    test_repetitions: int, optional
+        default: `0`
+    histogram_years: Iterable[int], optional
+        default: `()`; years of the histogram output,
+        their most frequent tables of human users are planned
+
+    Note
+    ----
+    `log_stats.current_year` is switched by this function.
+    """
+    plan = GeolocPlan()
+
+    for year in years:
+        log_stats.switch_year(year)
+        plan.add(most_frequent_stats(log_stats.bots.stats.values()))
+        plan.add(most_frequent_stats(log_stats.people.stats.values()))
+
+        plan.samples[year] = make_geoloc_samples(log_stats, sample_size)[0]
+        plan.add(plan.samples[year])
+
+    for year in histogram_years:
+        log_stats.switch_year(year)
+        plan.add(most_frequent_stats(log_stats.people.stats.values()))
+
+    if test_year in log_stats.year_stats and test_repetitions > 0:
+        log_stats.switch_year(test_year)
+        plan.test_samples = make_geoloc_samples(
+            log_stats, sample_size, test_repetitions
+        )
+        for sample in plan.test_samples:
+            plan.add(sample)
+
+    return plan
@@ -0,0 +1,275 @@
+import csv
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from heapq import heappop, heappush
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from logs.helpers.ipaddr import IPV4, IPV4_MAPPED_PREFIX, IPV6, ip_to_int
+
+# compiled file: header, IPv4 tables, IPv6 tables, names of countries
+MAGIC = b"LGEORNG1"
+HEADER = struct.Struct("=8s4Q")  # magic, byte order, IPv4 and IPv6 ranges, names size
+BYTE_ORDER = {"little": 1, "big": 2}
+ALIGNMENT = 8
+COMPILED_SUFFIX = ".bin"
+
+UNKNOWN = "Unknown"
+MAX_IPV4 = 0xFFFFFFFF
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+# (<first address>, <last address>, <country>)
+Range = Tuple[int, int, str]
+
+
+def _parse_address(field: str) -> Optional[Tuple[int, int]]:
+    """Returns `(<version>, <integer value>)` of IP address `field`
+    in the dotted (DB-IP) or integer (IP2Location) notation"""
+    field = field.strip()
+    if not field.isdigit():
+        return ip_to_int(field)
+
+    value = int(field)
+    if value <= MAX_IPV4:
+        return (IPV4, value)
+    if value >> 32 == 0xFFFF:
+        return (IPV4, value - IPV4_MAPPED_PREFIX)
+    return (IPV6, value)
+
+
+def parse_geoloc_csv(lines: Iterable[str]) -> Dict[int, List[Range]]:
+    """Parses CSV with rows `<first IP>, <last IP>, ..., <country>`,
+    e.g. DB-IP (`start,end,country code`) or IP2Location
+    (`from,to,country code,country name`) lite databases.
+
+    The country is the last column of a row, IP addresses
+    can be in dotted or integer notation. Headers and rows
+    without valid range or country (e.g. `-`) are skipped.
+
+    Returns
+    -------
+    Dict[int, List[Range]]
+        ranges `(<first>, <last>, <country>)` for each IP version
+    """
+    ranges: Dict[int, List[Range]] = {IPV4: [], IPV6: []}
+
+    for row in csv.reader(lines):
+        if len(row) < 3:
+            continue
+
+        first = _parse_address(row[0])
+        last = _parse_address(row[1])
+        country = row[-1].strip()
+        if (
+            first is None
+            or last is None
+            or first[0] != last[0]
+            or first[1] > last[1]
+            or country in ("", "-")
+        ):
+            continue
+
+        ranges[first[0]].append((first[1], last[1], country))
+
+    return ranges
+
+
+def merge_country_ranges(ranges: Iterable[Range]) -> List[Range]:
+    """Returns disjoint ranges sorted by their first address,
+    adjacent or overlapping ranges of the same country are merged.
+
+    Where ranges of different countries overlap, the more specific one wins,
+    i.e. the one starting later, or the shorter one if they start together,
+    the parts of the other range around it are kept,
+    e.g. `(0, 100, "US"), (10, 20, "CA")` gives
+    `(0, 9, "US"), (10, 20, "CA"), (21, 100, "US")`
+    """
+    ranges = sorted(ranges, key=lambda r: (r[0], -r[1], r[2]))
+    # boundaries of segments, in which the same ranges overlap
+    bounds = sorted({r[0] for r in ranges} | {r[1] + 1 for r in ranges})
+
+    merged: List[Range] = []
+    active: List[Tuple[int, int, str]] = []  # heap of (-priority, last, country)
+    i = 0
+
+    for start, end in zip(bounds, bounds[1:]):
+        while i < len(ranges) and ranges[i][0] == start:
+            _, last, country = ranges[i]
+            heappush(active, (-i, last, country))
+            i += 1
+        while active and active[0][1] < start:
+            heappop(active)
+        if not active:
+            continue
+
+        country = active[0][2]
+        if merged and merged[-1][2] == country and merged[-1][1] + 1 == start:
+            merged[-1] = (merged[-1][0], end - 1, country)
+        else:
+            merged.append((start, end - 1, country))
+
+    return merged
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % ALIGNMENT)
+
+
+def compile_geoloc_ranges(csv_path: str, path: str) -> int:
+    """Compiles CSV `csv_path` (see `parse_geoloc_csv`)
+    into binary file `path` loadable by `GeolocRanges`,
+    returns the number of compiled ranges"""
+    with open(csv_path, "r", newline="", encoding="utf-8") as f:
+        ranges = parse_geoloc_csv(f)
+
+    countries: Dict[str, int] = {}
+    tables: List[bytes] = []
+    counts = []
+
+    for version in (IPV4, IPV6):
+        merged = merge_country_ranges(ranges[version])
+        counts.append(len(merged))
+        indexes = array(
+            "H", (countries.setdefault(c, len(countries)) for _, _, c in merged)
+        )
+
+        columns = []
+        for i in (0, 1):  # firsts, lasts
+            if version == IPV4:
+                columns.append(array("I", (r[i] for r in merged)))
+            else:
+                columns.append(array("Q", (r[i] >> 64 for r in merged)))
+                columns.append(array("Q", (r[i] & MASK_64 for r in merged)))
+
+        for column in columns + [indexes]:
+            data = column.tobytes()
+            tables.append(data + _padding(len(data)))
+
+    names = "\n".join(countries).encode("utf-8")
+    header = HEADER.pack(
+        MAGIC, BYTE_ORDER[sys.byteorder], counts[0], counts[1], len(names)
+    )
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header + _padding(len(header)))
+        for table in tables:
+            f.write(table)
+        f.write(names)
+    os.replace(tmp_path, path)
+
+    return sum(counts)
+
+
+class _Ipv6Column(Sequence[int]):
+    """Column of 128 bit integers stored as high and low 64 bits"""
+
+    def __init__(self, high: memoryview, low: memoryview):
+        self._high = high
+        self._low = low
+
+    def __len__(self) -> int:
+        return len(self._high)
+
+    def __getitem__(self, i):
+        return (self._high[i] << 64) | self._low[i]
+
+
+class GeolocRanges:
+    """Offline geolocation provider, looks up countries of IP addresses
+    in a file compiled by `compile_geoloc_ranges`.
+
+    The file is memory-mapped, so opening it is instant
+    and its pages are shared by processes. It contains sorted
+    disjoint ranges of integer addresses for each IP version,
+    an address is looked up by binary search in O(log n).
+
+    Can be used as `provider` of `IpStats.update_geolocation`
+    instead of the geolocation API. `source` is the path
+    of the compiled CSV, `path` by default.
+    """
+
+    def __init__(self, path: str, source: Optional[str] = None):
+        self.path = path
+        self.source = path if source is None else source
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: List[memoryview] = [memoryview(self._mmap)]
+
+        magic, byte_order, n4, n6, names_size = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a compiled geolocation file")
+        if byte_order != BYTE_ORDER[sys.byteorder]:
+            self.close()
+            raise ValueError(f"{path} was compiled with different byte order")
+
+        self._offset = HEADER.size + len(_padding(HEADER.size))
+        firsts = self._column("I", n4)
+        lasts = self._column("I", n4)
+        self._ipv4 = (firsts, lasts, self._column("H", n4))
+
+        firsts = _Ipv6Column(self._column("Q", n6), self._column("Q", n6))
+        lasts = _Ipv6Column(self._column("Q", n6), self._column("Q", n6))
+        self._ipv6 = (firsts, lasts, self._column("H", n6))
+
+        names = self._mmap[self._offset : self._offset + names_size]
+        self.countries = names.decode("utf-8").split("\n") if names_size else []
+
+    def _column(self, typecode: str, count: int) -> memoryview:
+        size = array(typecode).itemsize * count
+        view = self._views[0][self._offset : self._offset + size].cast(typecode)
+        self._views.append(view)
+        self._offset += size + len(_padding(size))
+        return view
+
+    def __len__(self) -> int:
+        """Returns the number of ranges"""
+        return len(self._ipv4[0]) + len(self._ipv6[0])
+
+    def geolocate(self, ip: str) -> str:
+        """Returns country of `ip`, `"Unknown"` if it is not in any range
+        or it is not an IP address"""
+        addr = ip_to_int(ip)
+        if addr is None:
+            return UNKNOWN
+
+        version, value = addr
+        firsts, lasts, indexes = self._ipv4 if version == IPV4 else self._ipv6
+        i = bisect_right(firsts, value, 0, len(firsts)) - 1
+        if i < 0 or value > lasts[i]:
+            return UNKNOWN
+
+        return self.countries[indexes[i]]
+
+    def close(self) -> None:
+        self._ipv4 = self._ipv6 = ((), (), ())
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+        self._file.close()
+
+
+def _is_compiled(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_geoloc_ranges(path: str) -> GeolocRanges:
+    """Opens `GeolocRanges` from compiled file or CSV `path`,
+    CSV is compiled into `<path>.bin` at first and recompiled
+    only if the CSV is newer than the compiled file"""
+    if _is_compiled(path):
+        return GeolocRanges(path)
+
+    compiled = path + COMPILED_SUFFIX
+    if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(
+        path
+    ):
+        compile_geoloc_ranges(path, compiled)
+
+    return GeolocRanges(compiled, source=path)
@@ -1,11 +1,14 @@
 import datetime
 import re
-import socket
-from typing import Dict, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import logs.statistics.geolocapi as geolocapi
-from logs.statistics.constants import SIMPLE_IPV4_REGEX, old_date
+from logs.helpers.dns import host_address_of, host_name_of
+from logs.helpers.ipaddr import canonical_ip, is_hostname
+from logs.statistics.constants import OLD_DATE, SIMPLE_IPV4_REGEX
+from logs.statistics.dnscache import DnsCache
 from logs.statistics.geolocdb import GeolocDB
+from logs.statistics.geolocranges import GeolocRanges
 from logs.helpers.ijsonserialize import IJsonSerialize
 UNRESLOVED = "Unresolved"
 DT_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
@@ -13,6 +16,9 @@ FORMAT_STR = (
     "ip_addr host_name geolocation bot_url is_bot requests_num sessions_num datetime valid_ip"
 )
 LOG_DELIM = '\t'
+# serialized attributes, `timestamp` is derived from `datetime`
+JSON_SLOTS = FORMAT_STR.split()
+OLD_TIMESTAMP = OLD_DATE.timestamp()
 RE_PATTERN_SIMPLE_IPV4 = re.compile(SIMPLE_IPV4_REGEX)
 
 
@@ -32,8 +38,10 @@ class IpStats(IJsonSerialize):
     sessions_num: int
     datetime: datetime
         default: 01/Jan/1980:00:00:00 +0000
+    timestamp: float
+        epoch seconds of `datetime`, not serialized
     valid_ip: Optional[bool]
-        `None` if not yet validated, `True` if `ip_addr` is valid IPv4, 
+        `None` if not yet validated, `True` if `ip_addr` is valid IPv4 or IPv6,
         `False` if valid IP could not be resovled.
 
     """
@@ -48,6 +56,7 @@ class IpStats(IJsonSerialize):
         "sessions_num",
         "datetime",
         "valid_ip",
+        "timestamp",
     )
 
     def __init__(
@@ -68,14 +77,21 @@ class IpStats(IJsonSerialize):
         self.sessions_num = 0
         self.is_bot = is_bot
         self.bot_url = bot_url
-        self.datetime = old_date()
+        self.datetime = OLD_DATE
+        self.timestamp = OLD_TIMESTAMP
         self.valid_ip = None
 
-    def update_host_name(self) -> None:
+    def update_host_name(self, dns_cache: Optional[DnsCache] = None) -> None:
         """Resolves `self.ip_addr` to host name and sets `self.host_name`
-        approprietaly or to `"Unknown"` if resolution fails"""
+        approprietaly or to `"Unknown"` if resolution fails,
+        if `dns_cache` is given, then the lookup is cached in it"""
+        if dns_cache is not None:
+            host_name = dns_cache.ip_to_host(self.ip_addr)
+            self.host_name = "Unknown" if host_name is None else host_name
+            return
+
         try:
-            self.host_name = socket.gethostbyaddr(self.ip_addr)[0]
+            self.host_name = host_name_of(self.ip_addr)
         except:  # noqa: E722
             self.host_name = "Unknown"
 
@@ -90,22 +106,30 @@ class IpStats(IJsonSerialize):
         hostname = ".".join(hostname)
         return hostname
 
-    def ensure_valid_ip_address(self, ip_map: Optional[Dict[str, str]] = None) -> bool:
-        """Does a simple validation of `self.ip_addr` and sets `self.valid_ip` accordingly.
+    def ensure_valid_ip_address(
+        self,
+        ip_map: Optional[Dict[str, str]] = None,
+        dns_cache: Optional[DnsCache] = None,
+    ) -> bool:
+        """Validates `self.ip_addr` as IPv4 or IPv6 address and sets `self.valid_ip` accordingly,
+        valid address is set to its canonical form (see `logs.helpers.ipaddr.canonical_ip`).
         If `self.ip_addr` in not an IP address,
-        than it might be a domain name,
-        so a DNS lookup will be made to find corresponding IP address
+        than it might be a domain name, if it is a valid host name,
+        a DNS lookup will be made to find corresponding IP address
         and `self.ip_addr` will be set accordingly.
 
         If `ip_map` is given and `self.ip_addr` is one of its keys,
         then `self.ip_address` is set to the corresponding value in the map
-        at the begining and the method returns.
+        instead of the DNS lookup.
 
         Parameters
         ----------
         ip_map: Dict[str, str], optional
             memo for invalid ips,
-            maps invalid ip to corresponding valid ip
+            maps invalid ip to corresponding valid ip (or canonical form),
+            ips which could not be resolved are mapped to themselves
+        dns_cache: DnsCache, optional
+            if given, then the DNS lookup is cached in it
 
         Returns
         -------
@@ -115,20 +139,37 @@ class IpStats(IJsonSerialize):
             - `False` if `self.ip_addr` is not valid
               and the address could not be resolved
         """
-        if simple_ipv4_check(self.ip_addr):
+        canonical = canonical_ip(self.ip_addr)
+        if canonical is not None:
+            if ip_map is not None and canonical != self.ip_addr:
+                ip_map[self.ip_addr] = canonical
+            self.ip_addr = canonical
             self.valid_ip = True
             return True
 
         if ip_map is not None:
             ip = ip_map.get(self.ip_addr)
 
+            if ip == self.ip_addr:
+                # already known not to be resolvable
+                self.valid_ip = False
+                return False
+
             if ip is not None:
                 self.host_name = self.ip_addr
                 self.ip_addr = ip
                 self.valid_ip = True
                 return True
 
-        valid, ip = host_to_ip(self.ip_addr)
+        if is_hostname(self.ip_addr):
+            valid, ip = (
+                host_to_ip(self.ip_addr)
+                if dns_cache is None
+                else dns_cache.host_to_ip(self.ip_addr)
+            )
+        else:
+            # e.g. `-` for unknown host, not worth a DNS lookup
+            valid, ip = (False, self.ip_addr)
 
         if ip_map is not None:
             ip_map[self.ip_addr] = ip
@@ -142,12 +183,26 @@ class IpStats(IJsonSerialize):
 
         return valid
 
-    def update_geolocation(self, database: Optional[GeolocDB] = None):
+    def update_geolocation(
+        self,
+        database: Optional[GeolocDB] = None,
+        provider: Optional[GeolocRanges] = None,
+    ):
         """Updates `self.geolocation`.
-        First tries to find the location in `database` if was given,
+        If `provider` is given (e.g. offline
+        `logs.statistics.geolocranges.GeolocRanges`), then the location
+        is looked up by `provider.geolocate` and `database` is not used.
+        Otherwise first tries to find the location in `database` if was given,
         then calls `self.geolocate_with_api()`.
         Saves found location to `database
         `"""
+        if provider is not None:
+            if not self.ensure_valid_ip_address():
+                self.geolocation = "Unknown"
+            else:
+                self.geolocation = provider.geolocate(self.ip_addr)
+            return
+
         if database is None:
             self.geolocate_with_api()
             return
@@ -177,9 +232,17 @@ class IpStats(IJsonSerialize):
     def _set_attr(self, name: str, data):
         if name == "datetime":
             self.datetime = datetime.datetime.strptime(data, DT_FORMAT)
+            self.timestamp = self.datetime.timestamp()
         else:
             setattr(self, name, data)
 
+    def json(self) -> Dict:
+        return {slot: self._get_attr(slot) for slot in JSON_SLOTS}
+
+    def from_json(self, js: Dict):
+        for slot in JSON_SLOTS:
+            self._set_attr(slot, js[slot])
+
     def log_format(
         self, format_str: Optional[str] = None, delim: Optional[str] = "\t"
     ) -> str:
@@ -262,7 +325,73 @@ def host_to_ip(host: str) -> Tuple[bool, str]:
         - `(False, host)` if IPv4 couldn't be resolved
     """
     try:
-        addr = socket.gethostbyname(host)
+        addr = host_address_of(host)
         return (True, addr)
     except:  # noqa: E722
         return (False, host)
+
+
+def update_geolocations(
+    stats: Iterable[IpStats],
+    database: Optional[GeolocDB] = None,
+    provider: Optional[GeolocRanges] = None,
+    client: Optional[geolocapi.GeolocClient] = None,
+) -> int:
+    """Updates `geolocation` of all `stats` as `IpStats.update_geolocation`,
+    but distinct IP addresses are looked up in `database` by one query,
+    those not found are geolocated concurrently by `client.geolocate_many`
+    and saved into `database` in one transaction
+
+    Parameters
+    ----------
+    stats: Iterable[IpStats]
+    database: GeolocDB, optional
+        default: `None`; database of already resolved geolocations,
+        newly resolved geolocations are saved into it
+    provider: GeolocRanges, optional
+        default: `None`; if given, then it is used
+        instead of the API and `database`
+    client: GeolocClient, optional
+        default: `geolocapi.default_client()`; client of geolocation API
+
+    Returns
+    -------
+    int
+        the number of distinct valid IP addresses geolocated
+        by `provider` or `client`
+    """
+    if provider is not None:
+        ips = set()
+        for ip_stat in stats:
+            ip_stat.update_geolocation(database, provider)
+            if ip_stat.valid_ip:
+                ips.add(ip_stat.ip_addr)
+        return len(ips)
+
+    pending: Dict[str, List[IpStats]] = {}
+    for ip_stat in stats:
+        if not ip_stat.ensure_valid_ip_address():
+            ip_stat.geolocation = "Unknown"
+        else:
+            pending.setdefault(ip_stat.ip_addr, []).append(ip_stat)
+
+    if database is not None and pending:
+        for ip, (geolocation, _) in database.get_geolocations(pending).items():
+            for ip_stat in pending.pop(ip):
+                ip_stat.geolocation = geolocation
+
+    if not pending:
+        return 0
+
+    if client is None:
+        client = geolocapi.default_client()
+
+    locations = client.geolocate_many(pending)
+    for ip, location in locations.items():
+        for ip_stat in pending[ip]:
+            ip_stat.geolocation = location
+
+    if database is not None:
+        database.upsert_geolocations(locations)
+
+    return len(locations)
@@ -1,7 +1,7 @@
 import datetime
 from typing import Dict, Tuple
 
-from logs.statistics.constants import DATE_FORMAT, old_date
+from logs.statistics.constants import DATE_FORMAT, OLD_DATE
 from logs.statistics.dailystat import DailyStats
 from logs.statistics.groupstats import GroupStats
 
@@ -31,7 +31,7 @@ class LogStats:
         self.daily_data: Dict[datetime.date, DailyStats] = {}
         self.year_stats: Dict[int, Tuple[GroupStats, GroupStats]] = {}
         self.current_year: int = None
-        self.last_entry_ts: datetime.datetime = old_date()
+        self.last_entry_ts: datetime.datetime = OLD_DATE
 
     def switch_year(self, year: int):
         """sets `self.current_year` to `year`
@@ -0,0 +1,303 @@
+import datetime
+import os
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from logs.helpers.simplelogger import SimpleLogger
+from logs.parser.logfile import MappedLog, read_lines, split_byte_ranges
+from logs.parser.logentry import USED_FIELDS
+from logs.parser.logparser import DEFAULT_MAX_LINE_LENGTH, DEFAULT_PARSER, get_parser
+from logs.parser.rejects import RejectedLines, open_quarantine
+from logs.statistics.botrules import BotRules
+from logs.statistics.columnar import process_entries_columnar
+from logs.statistics.groupstats import GroupStats
+from logs.statistics.logstats import LogStats
+from logs.statistics.processing import (
+    SESSION_DELTA,
+    get_daily_stats,
+    load_bots_set,
+    process_entries,
+)
+from logs.statistics.uacache import UserAgentCache
+
+FirstSeen = Dict[Tuple[int, bool, str], datetime.datetime]
+# maps (<year>, <is bot>, <ip address>) to the time of the first entry
+
+
+def make_stats_parallel(
+    path: str,
+    workers: int,
+    config_f: Optional[str],
+    logger: Optional[SimpleLogger] = None,
+    cached_log_stats: Optional[LogStats] = None,
+    parser: str = DEFAULT_PARSER,
+    offset: int = 0,
+    end: Optional[int] = None,
+    years: Optional[Set[int]] = None,
+    log_format: Optional[str] = None,
+    decoding: Optional[str] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+    rejects: Optional[RejectedLines] = None,
+    columnar: bool = False,
+    ua_cache: Optional[UserAgentCache] = None,
+) -> LogStats:
+    """Parses and processes log file with `path` in `workers` processes
+    and stores statistical information about the log in `log_stats`.
+
+    The file is split into `workers` byte ranges aligned to lines (shards),
+    each shard is processed into separate `LogStats`
+    which are then merged in the order of the shards.
+    Sessions continuing across shard boundaries are reconciled,
+    so the result is the same as the result of `make_stats`.
+
+    Parameters
+    ----------
+    path: str
+        path to log file, it has to be seekable regular file
+    workers: int
+        number of worker processes
+    config_f: str, optional
+        path to a blacklist file containing ip addressed considered as bots
+    logger: SimpleLogger, optional
+        default: `None`; if given then the duration of making stats will be logged
+    cached_log_stats: LogStats, optional
+        default: new empty `LogStats` object;
+        log_stats object in which statiscics from the log will be stored,
+        see `make_stats`
+    parser: str, optional
+        default: `"regex"`; name of the parser engine,
+        see `logs.parser.logparser.PARSERS`
+    offset: int, optional
+        default: `0`; byte offset of a line beginning from which the log is read,
+        see `logs.parser.logfile.find_resume_offset`
+    end: int, optional
+        default: `None`; byte offset of a line beginning before which the log is read,
+        if `None`, the log is read to its end
+    years: Set[int], optional
+        default: `None`; if given then only entries from these years are processed
+    log_format: str, optional
+        default: `None`; Apache LogFormat string or name of the format,
+        see `make_stats`
+    decoding: str, optional
+        default: `None`; if given, then the log is memory-mapped in workers
+        and decoded by `decoding`, see `logs.parser.logfile.MappedLog`
+    max_line_length: int, optional
+        default: `100`; see `make_stats`
+    rejects: RejectedLines, optional
+        default: new `RejectedLines` object without quarantine;
+        see `make_stats`, workers write their quarantined lines into
+        temporary files next to the quarantine, which are then
+        appended to it in the order of the shards
+    columnar: bool, optional
+        default: `False`; if `True`, then the entries are processed
+        by numpy in batches, see `make_stats`
+    ua_cache: UserAgentCache, optional
+        default: new empty `UserAgentCache`; see `make_stats`,
+        workers start with its classifications and their caches
+        are merged into it
+
+    Returns
+    -------
+    Log_stat
+        containing information about log from `path`
+    """
+    log_stats = LogStats() if cached_log_stats is None else cached_log_stats
+    rejects = RejectedLines() if rejects is None else rejects
+    ua_cache = UserAgentCache() if ua_cache is None else ua_cache
+    get_parser(parser, log_format)  # fail early on unknown parser or format
+
+    if logger is not None:
+        logger.addTask("Data parsing and proccessing")
+
+    ua_cache.rules.set_ips(load_bots_set(config_f))
+    shards = split_byte_ranges(path, workers, offset, end)
+    quarantines = [
+        None if rejects.quarantine is None else f"{rejects.quarantine.name}.{i}"
+        for i in range(len(shards))
+    ]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _make_shard_stats,
+                    path,
+                    start,
+                    end,
+                    ua_cache.rules,
+                    log_stats.last_entry_ts,
+                    parser,
+                    years,
+                    log_format,
+                    decoding,
+                    max_line_length,
+                    quarantine,
+                    rejects.sample,
+                    columnar,
+                    ua_cache.max_size,
+                    ua_cache.dump(),
+                )
+                for (start, end), quarantine in zip(shards, quarantines)
+            ]
+
+            # merging has to follow the order of the shards
+            for future, quarantine in zip(futures, quarantines):
+                shard_stats, first_seen, shard_rejects, shard_cache = future.result()
+                merge_log_stats(log_stats, shard_stats, first_seen)
+                rejects.update(shard_rejects, quarantine)
+                ua_cache.update(shard_cache)
+    finally:
+        # quarantines of shards which were not merged
+        for quarantine in quarantines:
+            if quarantine is not None and os.path.exists(quarantine):
+                os.remove(quarantine)
+
+    if logger is not None:
+        logger.logMessage(f"log processed in {len(shards)} shards")
+        if rejects.total():
+            logger.logMessage(rejects.summary())
+        logger.logMessage(ua_cache.summary())
+        for line in ua_cache.rules.summary():
+            logger.logMessage(line)
+        logger.finishTask("Data parsing and proccessing")
+
+    return log_stats
+
+
+def _make_shard_stats(
+    path: str,
+    start: int,
+    end: int,
+    bot_rules: BotRules,
+    from_time: datetime.datetime,
+    parser: str,
+    years: Optional[Set[int]],
+    log_format: Optional[str],
+    decoding: Optional[str],
+    max_line_length: Optional[int],
+    quarantine: Optional[str],
+    sample: int,
+    columnar: bool,
+    ua_cache_size: int,
+    ua_classifications: List[Tuple[str, bool, str]],
+) -> Tuple[LogStats, FirstSeen, RejectedLines, UserAgentCache]:
+    """Processes lines of file with `path` in byte range from `start` to `end`
+    into new `LogStats`, runs in a worker process.
+    Rejected lines are written into new `quarantine` file, if it is given.
+    Entries are classified by `bot_rules` (a copy with reset counters)
+    and new `UserAgentCache` with `ua_classifications`
+    (see `UserAgentCache.dump`)."""
+    log_stats = LogStats()
+    first_seen: FirstSeen = {}
+    rejects = RejectedLines(sample=sample)
+    bot_rules.reset()
+    ua_cache = UserAgentCache(ua_cache_size, bot_rules)
+    ua_cache.load(ua_classifications)
+    parse = get_parser(parser, log_format, USED_FIELDS, max_line_length)
+
+    with (
+        closing(read_lines(path, start, end))
+        if decoding is None
+        else MappedLog(path, start, end, decoding)
+    ) as input:
+        if quarantine is not None:
+            rejects.quarantine = open_quarantine(quarantine)
+
+        try:
+            (process_entries_columnar if columnar else process_entries)(
+                log_stats,
+                parse(input),
+                bot_rules.ip_rule,
+                from_time=from_time,
+                rejects=rejects,
+                first_seen=first_seen,
+                years=years,
+                ua_cache=ua_cache,
+            )
+        finally:
+            if rejects.quarantine is not None:
+                rejects.quarantine.close()
+                rejects.quarantine = None  # files can not be returned
+
+    return (log_stats, first_seen, rejects, ua_cache)
+
+
+def merge_log_stats(
+    log_stats: LogStats, newer: LogStats, first_seen: FirstSeen
+) -> None:
+    """Merges `newer` into `log_stats`.
+
+    Entries of `newer` have to be later than entries of `log_stats`.
+    If the first entry of an IP address in `newer` is closer than `SESSION_DELIM`
+    to its last entry in `log_stats`, then it is not a new session
+    and the session counts are corrected accordingly.
+
+    Parameters
+    ----------
+    log_stats: LogStats
+        it will contain the merged statistics
+    newer: LogStats
+        statistics of later entries, its objects are moved into `log_stats`
+    first_seen: Dict[Tuple[int, bool, str], datetime.datetime]
+        maps `(<year>, <is bot>, <ip address>)` to the time
+        of its first entry in `newer`, see `process_entries`
+    """
+    current_year = log_stats.current_year
+
+    for date, data in newer.daily_data.items():
+        daily_stats = get_daily_stats(log_stats, date)
+        daily_stats.ips.update(data.ips)
+        daily_stats.requests += data.requests
+        daily_stats.sessions += data.sessions
+
+    for year, (bots, people) in newer.year_stats.items():
+        log_stats.switch_year(year)
+        _merge_group_stats(log_stats, log_stats.bots, bots, year, True, first_seen)
+        _merge_group_stats(log_stats, log_stats.people, people, year, False, first_seen)
+
+    if newer.last_entry_ts > log_stats.last_entry_ts:
+        log_stats.last_entry_ts = newer.last_entry_ts
+
+    if newer.current_year is not None:
+        current_year = newer.current_year
+    if current_year is not None:
+        log_stats.switch_year(current_year)
+
+
+def _merge_group_stats(
+    log_stats: LogStats,
+    g_stats: GroupStats,
+    newer: GroupStats,
+    year: int,
+    is_bot: bool,
+    first_seen: FirstSeen,
+) -> None:
+    """Merges `newer` into `g_stats` which belongs to `log_stats`,
+    see `merge_log_stats`"""
+    for name in GroupStats.__slots__:
+        if name != "stats":
+            distrib = getattr(g_stats, name)
+            for i, value in enumerate(getattr(newer, name)):
+                distrib[i] += value
+
+    for ip, ip_stat in newer.stats.items():
+        known = g_stats.stats.get(ip)
+        if known is None:
+            g_stats.stats[ip] = ip_stat
+            continue
+
+        first = first_seen[(year, is_bot, ip)]
+        if abs(first - known.datetime) < SESSION_DELTA:
+            # the first entry continues the last session from `g_stats`
+            known.sessions_num -= 1
+            g_stats.day_sess_distrib[first.hour] -= 1
+            g_stats.week_sess_distrib[first.weekday()] -= 1
+            g_stats.month_sess_distrib[first.month - 1] -= 1
+            if not is_bot:
+                log_stats.daily_data[first.date()].sessions -= 1
+
+        known.requests_num += ip_stat.requests_num
+        known.sessions_num += ip_stat.sessions_num
+        known.datetime = ip_stat.datetime
+        known.timestamp = ip_stat.timestamp
@@ -1,15 +1,30 @@
+import heapq
 import io
+import os
 import random
-from typing import List, Optional, TextIO, Tuple
+import time
+from typing import Iterable, List, Optional, TextIO, Tuple
 
 import matplotlib.pyplot as plt
 
+from logs.helpers.dns import (
+    DEFAULT_DNS_BUDGET,
+    DEFAULT_DNS_TIMEOUT,
+    DEFAULT_DNS_WORKERS,
+    resolve_addresses,
+)
 from logs.htmlmaker.htmlmaker import HtmlMaker, make_table
 from logs.statistics.constants import DAYS, MONTHS
+from logs.statistics.dnscache import PTR, DnsCache
 from logs.statistics.geolocdb import GeolocDB
+from logs.statistics.geolocranges import GeolocRanges
 from logs.helpers.simplelogger import SimpleLogger
+from logs.statistics.ipstats import UNRESLOVED, update_geolocations
 from logs.statistics.processing import IpStats, LogStats
 
+MOST_FREQUENT_ROWS = 20  # number of rows of most frequent tables
+MAX_SAMPLE_SESSIONS = 50  # only IPs with at most this sessions are sampled
+
 def print_stats(
     log_stats: LogStats,
     output: TextIO,
@@ -20,6 +35,12 @@ def print_stats(
     geoloc_db: Optional[str] = None,
     display_overview_imgs: bool = False,
     logger: Optional[SimpleLogger] = None,
+    dns_cache: Optional[DnsCache] = None,
+    dns_workers: int = DEFAULT_DNS_WORKERS,
+    dns_timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+    dns_budget: Optional[float] = DEFAULT_DNS_BUDGET,
+    geoloc_provider: Optional[GeolocRanges] = None,
+    geoloc_sample: Optional[List[IpStats]] = None,
 ) -> None:
     """Transforms data for given year from `log_stats`
     into html files and writes it into `output`
@@ -52,6 +73,25 @@ def print_stats(
     logger: SimpleLogger, optional
         default: `None`; if not None then the duration of this function
         added to logger as task
+    dns_cache: DnsCache, optional
+        default: `None`; if given, then host names in most frequent tables
+        are resolved with the cache
+    dns_workers: int, optional
+        default: `32`; number of concurrent lookups of host names
+        in most frequent tables
+    dns_timeout: float, optional
+        default: `5.0`; seconds after which a lookup is abandoned
+    dns_budget: float, optional
+        default: `10.0`; seconds after which all unfinished lookups
+        are abandoned, `None` means no limit,
+        see `resolve_most_frequent_host_names`
+    geoloc_provider: GeolocRanges, optional
+        default: `None`; if given, then IP addresses are geolocated
+        by the offline provider instead of the geolocation API and `geoloc_db`
+    geoloc_sample: List[IpStats], optional
+        default: `None`; sample for geolocation of the year
+        made in advance (see `logs.statistics.geolocplan`),
+        if not given, then it is made by `make_geoloc_samples`
     """
     html: HtmlMaker = HtmlMaker()
 
@@ -71,14 +111,25 @@ def print_stats(
     if display_overview_imgs:
         display_overview_images(log_stats, html)
 
-    print_bots(log_stats, html, selected, geoloc_db)
-    print_users(log_stats, html, selected, geoloc_db)
+    resolve_most_frequent_host_names(
+        log_stats, dns_cache, dns_workers, dns_timeout, dns_budget, logger
+    )
+
+    print_bots(log_stats, html, selected, geoloc_db, dns_cache, geoloc_provider)
+    print_users(log_stats, html, selected, geoloc_db, dns_cache, geoloc_provider)
 
     if logger is not None:
         logger.finishTask("making charts of bots and human users")
 
     print_countries_stats(
-        log_stats, html, geoloc_sample_size, selected, geoloc_db, logger=logger
+        log_stats,
+        html,
+        geoloc_sample_size,
+        selected,
+        geoloc_db,
+        logger=logger,
+        geoloc_provider=geoloc_provider,
+        sample=geoloc_sample,
     )
 
     print(html.html(), file=output)
@@ -107,7 +158,13 @@ def test_geolocation(
     repetitions: int = 1,
     year: int = None,
     geoloc_db: Optional[GeolocDB] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
+    samples: Optional[List[List[IpStats]]] = None,
+    logger: Optional[SimpleLogger] = None,
 ):
+    """Geolocates `repetitions` samples of human users
+    of given `year` and writes html comparing them into `output`,
+    `samples` can be made in advance (see `logs.statistics.geolocplan`)"""
     if year is not None:
         log_stats.switch_year(year)
 
@@ -116,16 +173,24 @@ def test_geolocation(
         log_stats,
         html,
         geoloc_sample_size,
+        logger,
         selected=selected,
         repetitions=repetitions,
         geoloc_db=geoloc_db,
+        geoloc_provider=geoloc_provider,
+        samples=samples,
     )
 
     print(html.html(), file=output)
 
 
 def print_bots(
-    log_stats, html: HtmlMaker, selected=True, geoloc_db: Optional[GeolocDB] = None
+    log_stats,
+    html: HtmlMaker,
+    selected=True,
+    geoloc_db: Optional[GeolocDB] = None,
+    dns_cache: Optional[DnsCache] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
 ) -> None:
     """Transforms data about bot from `logs_stats` to html
     and appends it to `html`
@@ -146,7 +211,14 @@ def print_bots(
     selected = "selected" if selected else ""
 
     print_most_frequent(
-        html, req_sorted_stats, sess_sorted_stats, True, selected, geoloc_db=geoloc_db
+        html,
+        req_sorted_stats,
+        sess_sorted_stats,
+        True,
+        selected,
+        geoloc_db=geoloc_db,
+        dns_cache=dns_cache,
+        geoloc_provider=geoloc_provider,
     )
 
     print_day_distribution(log_stats, html, True, selected)
@@ -159,6 +231,8 @@ def print_users(
     html: HtmlMaker,
     selected=True,
     geoloc_db: Optional[GeolocDB] = None,
+    dns_cache: Optional[DnsCache] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
 ):
     """Transforms data about human users from `logs_stats` to html
     and appends it to `html`
@@ -178,7 +252,14 @@ def print_users(
     selected = "selected" if selected else ""
 
     print_most_frequent(
-        html, req_sorted_stats, sess_sorted_stats, False, selected, geoloc_db=geoloc_db
+        html,
+        req_sorted_stats,
+        sess_sorted_stats,
+        False,
+        selected,
+        geoloc_db=geoloc_db,
+        dns_cache=dns_cache,
+        geoloc_provider=geoloc_provider,
     )
     print_day_distribution(log_stats, html, False, selected)
     print_week_distribution(log_stats, html, False, selected)
@@ -242,6 +323,68 @@ def sort_stats(log_stats: LogStats, bot: bool) -> Tuple[List[IpStats], List[IpSt
     return (req_sorted_stats, sess_sorted_stats)
 
 
+def most_frequent_stats(
+    stats: Iterable[IpStats], n: int = MOST_FREQUENT_ROWS
+) -> List[IpStats]:
+    """Returns IpStats displayed in most frequent tables of `stats`,
+    i.e. `n` IpStats with the most sessions followed by `n` with the most requests,
+    without duplicates"""
+    stats = list(stats)
+    by_sessions = heapq.nlargest(n, stats, key=lambda x: x.sessions_num)
+    by_requests = heapq.nlargest(n, stats, key=lambda x: x.requests_num)
+
+    return list({id(stat): stat for stat in by_sessions + by_requests}.values())
+
+
+def resolve_most_frequent_host_names(
+    log_stats: LogStats,
+    dns_cache: Optional[DnsCache] = None,
+    dns_workers: int = DEFAULT_DNS_WORKERS,
+    dns_timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+    dns_budget: Optional[float] = DEFAULT_DNS_BUDGET,
+    logger: Optional[SimpleLogger] = None,
+) -> None:
+    """Resolves host names of all IpStats displayed in most frequent tables
+    of bots and human users of `log_stats.current_year` at once.
+
+    Distinct unresolved IP addresses of the tables are looked up
+    concurrently (see `logs.helpers.dns.resolve_concurrently`),
+    with `dns_cache` if it is given. Lookups not finished
+    in `dns_budget` seconds are abandoned, so slow DNS servers
+    can not stall the output. Host names of IpStats whose lookup
+    failed or was abandoned are set to `"Unknown"`.
+
+    Parameters
+    ----------
+    see `print_stats`
+    """
+    stats = most_frequent_stats(log_stats.bots.stats.values())
+    stats += most_frequent_stats(log_stats.people.stats.values())
+    stats = [stat for stat in stats if stat.host_name == UNRESLOVED]
+    if not stats:
+        return
+
+    ips = {stat.ip_addr for stat in stats}
+    start = time.perf_counter()
+    host_names = (
+        resolve_addresses(ips, dns_workers, dns_timeout, dns_budget)
+        if dns_cache is None
+        else dns_cache.resolve(PTR, ips, dns_workers, dns_timeout, dns_budget)
+    )
+    duration = time.perf_counter() - start
+
+    for stat in stats:
+        host_name = host_names.get(stat.ip_addr)
+        stat.host_name = "Unknown" if host_name is None else host_name
+
+    if logger is not None:
+        count = sum(host_name is not None for host_name in host_names.values())
+        logger.logMessage(
+            f"resolved host names of {count} of {len(ips)} IP addresses "
+            f"in most frequent tables in {duration:.2f} s"
+        )
+
+
 def print_most_frequent(
     html: HtmlMaker,
     req_sorted_stats: List[IpStats],
@@ -250,6 +393,8 @@ def print_most_frequent(
     selected="",
     host_name=True,
     geoloc_db: Optional[GeolocDB] = None,
+    dns_cache: Optional[DnsCache] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
 ):
     html.append("<h3>Most frequent</h3>\n")
     uniq_classes = html.print_selection(
@@ -285,14 +430,16 @@ def print_most_frequent(
             header,
             get_most_frequent_table_data(
                 sess_sorted_stats,
-                20,
+                MOST_FREQUENT_ROWS,
                 host_name=host_name,
                 bots=bots,
                 geoloc_db=geoloc_db,
+                dns_cache=dns_cache,
+                geoloc_provider=geoloc_provider,
             ),
             None,
             ["selectable", selected, uniq_classes[0]],
-            attribs_for_most_freq_table(sess_sorted_stats, 20),
+            attribs_for_most_freq_table(sess_sorted_stats, MOST_FREQUENT_ROWS),
         )
     )
 
@@ -302,14 +449,16 @@ def print_most_frequent(
             header,
             get_most_frequent_table_data(
                 req_sorted_stats,
-                20,
+                MOST_FREQUENT_ROWS,
                 host_name=host_name,
                 bots=bots,
                 geoloc_db=geoloc_db,
+                dns_cache=dns_cache,
+                geoloc_provider=geoloc_provider,
             ),
             None,
             ["selectable", selected, uniq_classes[1]],
-            attribs_for_most_freq_table(req_sorted_stats, 20),
+            attribs_for_most_freq_table(req_sorted_stats, MOST_FREQUENT_ROWS),
         )
     )
 
@@ -322,17 +471,21 @@ def get_most_frequent_table_data(
     bots: bool,
     host_name=True,
     geoloc_db: Optional[GeolocDB] = None,
+    dns_cache: Optional[DnsCache] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
 ) -> List[List]:
     """From decendingly sorted list of IpStats
-    return list of `n` rows in most frequent table"""
+    return list of `n` rows in most frequent table,
+    host names not resolved by `resolve_most_frequent_host_names`
+    are resolved one by one, with `dns_cache` if it is given"""
     n = min(n, len(sorted_data))
     rows = []
 
     for i, ip_stat in enumerate(sorted_data[:n]):
         if host_name and ip_stat.host_name == "Unresolved":
-            ip_stat.update_host_name()
+            ip_stat.update_host_name(dns_cache)
         if ip_stat.geolocation == "Unresolved":
-            ip_stat.update_geolocation(geoloc_db)
+            ip_stat.update_geolocation(geoloc_db, geoloc_provider)
 
         row = [f"{i + 1}"]
         row.append(ip_stat.ip_addr)
@@ -540,10 +693,39 @@ def print_distribution_graph(
     )
 
 
+def make_geoloc_samples(
+    log_stats: LogStats, sample_size: int, repetitions: int = 1
+) -> List[List[IpStats]]:
+    """Returns `repetitions` random samples of at most `sample_size`
+    IpStats of human users of `log_stats.current_year` for geolocation.
+
+    The porportions of the geolocations in the sample are weighted by
+    the number of sessions, so the sample is taken only from IP addresses
+    with number of sessions <= `MAX_SAMPLE_SESSIONS`. If there are
+    not more of them than `sample_size`, then all of them are the sample.
+    """
+    data: List[IpStats] = [
+        ip_stat
+        for ip_stat in log_stats.people.stats.values()
+        if ip_stat.sessions_num <= MAX_SAMPLE_SESSIONS
+    ]
+    sample_size = max(min(len(data), sample_size), 0)
+
+    return [
+        random.sample(data, sample_size) if len(data) > sample_size else data
+        for _ in range(repetitions)
+    ]
+
+
 def get_geolocations_from_sample(
-    sample: List[IpStats], geoloc_db: Optional[GeolocDB] = None
+    sample: List[IpStats],
+    geoloc_db: Optional[GeolocDB] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
 ) -> List[Tuple[str, float]]:
-    """
+    """Geolocates IpStats of `sample` which are not geolocated yet,
+    concurrently by the default geolocation API client
+    (see `logs.statistics.ipstats.update_geolocations`)
+
     Returns
     -------
     List[Tuple[str,float]
@@ -556,10 +738,13 @@ def get_geolocations_from_sample(
     geoloc_weights = {}
     weights_sum = 0
 
-    for ip_stat in sample:
-        if ip_stat.geolocation == "Unresolved":
-            ip_stat.update_geolocation(geoloc_db)
+    update_geolocations(
+        [ip_stat for ip_stat in sample if ip_stat.geolocation == UNRESLOVED],
+        geoloc_db,
+        geoloc_provider,
+    )
 
+    for ip_stat in sample:
         weight = geoloc_weights.get(ip_stat.geolocation, 0)
         weight += ip_stat.sessions_num
         geoloc_weights[ip_stat.geolocation] = weight
@@ -576,36 +761,34 @@ def _test_geolocation(
     log_stats,
     html: HtmlMaker,
     geoloc_sample_size: int,
-    logger: SimpleLogger,
+    logger: Optional[SimpleLogger] = None,
     repetitions: int = 5,
     selected: bool = False,
     geoloc_db: Optional[GeolocDB] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
+    samples: Optional[List[List[IpStats]]] = None,
 ):
     # now olnly for human users
-    def filter_f(stat: IpStats) -> bool:
-        return stat.sessions_num <= 50
-
-    data: List[IpStats] = list(filter(filter_f, log_stats.people.stats.values()))
-
-    samples: List[List[IpStats]] = []
-    sample_size = min(len(data), geoloc_sample_size)
-
-    for _ in range(repetitions):
-        if len(data) > sample_size:
-            samples.append(random.sample(data, sample_size))
-        else:
-            samples.append(data)
+    if samples is None:
+        samples = make_geoloc_samples(log_stats, geoloc_sample_size, repetitions)
+    repetitions = len(samples)
 
     # geolocation
-    logger.addTask("geolocations")
+    if logger is not None:
+        logger.addTask("geolocations")
 
     geoloc_stats = []
     for i, sample in enumerate(samples):
-        logger.addTask(f"geolocaion {i+1}")
-        geoloc_stats.append(get_geolocations_from_sample(sample, geoloc_db))
-        logger.finishTask(f"geolocaion {i+1}")
+        if logger is not None:
+            logger.addTask(f"geolocaion {i+1}")
+        geoloc_stats.append(
+            get_geolocations_from_sample(sample, geoloc_db, geoloc_provider)
+        )
+        if logger is not None:
+            logger.finishTask(f"geolocaion {i+1}")
 
-    logger.finishTask("geolocations")
+    if logger is not None:
+        logger.finishTask("geolocations")
 
     # Printing
     selected = "selected" if selected else ""
@@ -634,40 +817,32 @@ def print_countries_stats(
     selected: bool = False,
     geoloc_db: Optional[GeolocDB] = None,
     logger: Optional[SimpleLogger] = None,
+    geoloc_provider: Optional[GeolocRanges] = None,
+    sample: Optional[List[IpStats]] = None,
 ):
     """Estimates the geolocations of human users from `log_stats`
-    on a random sample of length `sample_size`.
+    on a random sample of length `sample_size`, see `make_geoloc_samples`,
+    or on `sample` if it is given.
     The porportions of the geolocations in the sample are weighted by
     the number of sessions of the IP adresses from given location.
-    Beacuse of this, the sample is taken (if enough data)
-    only from IP addresses with number of sessions <= 50.
 
     Appends to `html`:
         - table of all geolocations from server
           and their weighted proportions in the sample
         - horizontal bar graph of the geolocations sahres in the sample
     """
-    # TODO move making sample and estimating geolocations elsewhere??
-    
-    sample: List[IpStats] = list(
-        filter(
-            lambda ip_stat: ip_stat.sessions_num <= 50, log_stats.people.stats.values()
-        )
-    )
-    sample_size = min(len(sample), sample_size)
-
-    if sample_size <= 0:
+    if sample is None:
+        sample = make_geoloc_samples(log_stats, sample_size)[0]
+    if len(sample) == 0:
         return
-    if len(sample) > sample_size:
-        sample = random.sample(sample, sample_size)
-    else:
-        sample_size = len(sample)
 
     # estimate geolocations
     if logger is not None:
         logger.addTask("geolocation")
 
-    estimated_locations = get_geolocations_from_sample(sample, geoloc_db)
+    estimated_locations = get_geolocations_from_sample(
+        sample, geoloc_db, geoloc_provider
+    )
 
     if logger is not None:
         logger.finishTask("geolocation")
@@ -697,10 +872,7 @@ def print_countries_stats(
             table_body,
         )
     )
-    html.append(
-        '<a href="http://www.geoplugin.com/geolocation/">IP Geolocation</a>'
-        ' by <a href="http://www.geoplugin.com">geoPlugin</a>\n</div>'
-    )
+    html.append(f"{geolocation_attribution(geoloc_provider)}\n</div>")
 
     # geolocation graph
     html.append(
@@ -709,11 +881,19 @@ def print_countries_stats(
     print_geolocations_graph(
         html, estimated_locations, "Geolocation", left_margin=True, max_size=10
     )
-    html.append(
+    html.append(f"{geolocation_attribution(geoloc_provider)}\n</div>")
+    html.append("</div>")
+
+
+def geolocation_attribution(geoloc_provider: Optional[GeolocRanges] = None) -> str:
+    """Returns html crediting the source of geolocations"""
+    if geoloc_provider is not None:
+        return f"IP Geolocation from {os.path.basename(geoloc_provider.source)}"
+
+    return (
         '<a href="http://www.geoplugin.com/geolocation/">IP Geolocation</a>'
-        ' by <a href="http://www.geoplugin.com">geoPlugin</a>\n</div>'
+        ' by <a href="http://www.geoplugin.com">geoPlugin</a>'
     )
-    html.append("</div>")
 
 
 def print_geolocations_graph(
@@ -1,50 +1,107 @@
 import datetime
 import json
-import re
-from typing import Callable, Dict, Optional, Set, TextIO, Tuple
+import time
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
+from logs.helpers.dns import DEFAULT_DNS_TIMEOUT, DEFAULT_DNS_WORKERS, resolve_hosts
+from logs.helpers.ipaddr import IpBlocklist, canonical_ip, is_hostname
 from logs.helpers.simplelogger import SimpleLogger
 
-from logs.parser.logparser import LogEntry, regex_parser
-from logs.statistics.constants import (
-    BOT_URL_REGEX,
-    BOT_USER_AGENT_REGEX,
-    LOG_DT_FORMAT,
-    SESSION_DELIM,
+from logs.parser.logentry import BAD_TIME, USED_FIELDS
+from logs.parser.logparser import (
+    DEFAULT_MAX_LINE_LENGTH,
+    DEFAULT_PARSER,
+    LogEntry,
+    get_parser,
 )
+from logs.parser.merge import merged_parser
+from logs.parser.rejects import RejectedLines
+from logs.parser.timestamp import TimestampDecoder
+from logs.statistics.constants import SESSION_DELIM
 from logs.statistics.dailystat import DailyStats
+from logs.statistics.dnscache import FORWARD, DnsCache
 from logs.statistics.groupstats import GroupStats
 from logs.statistics.ipstats import IpStats
+from logs.statistics.botrules import (
+    BOT_WITHOUT_URL,
+    NO_URL,
+    NOT_BOT,
+    RE_PATTERN_BOT_URL,
+    classify_user_agent,
+)
 from logs.statistics.logstats import LogStats
+from logs.statistics.uacache import UserAgentCache
 
-RE_PATTERN_BOT_USER_AGENT = re.compile(BOT_USER_AGENT_REGEX)
-RE_PATTERN_BOT_URL = re.compile(BOT_URL_REGEX)
-
-NO_URL = ""
+SESSION_DELTA = datetime.timedelta(minutes=SESSION_DELIM)
+SESSION_SECONDS = SESSION_DELTA.total_seconds()
 
 
 def make_stats(
-    input: TextIO,
+    input: Union[TextIO, Sequence[TextIO]],
     config_f: Optional[str],
     logger: Optional[SimpleLogger] = None,
     cached_log_stats: Optional[LogStats] = None,
+    parser: str = DEFAULT_PARSER,
+    years: Optional[Set[int]] = None,
+    log_format: Optional[str] = None,
+    max_line_length: Optional[int] = DEFAULT_MAX_LINE_LENGTH,
+    rejects: Optional[RejectedLines] = None,
+    columnar: bool = False,
+    ua_cache: Optional[UserAgentCache] = None,
 ) -> LogStats:
     """Parses and processes log in `input`
     and stores statistical information about the log in `log_stats`.
 
     Parameters
     ----------
-    input: TextIO
-        log files as plaintext
+    input: Union[TextIO, Sequence[TextIO]]
+        log files as plaintext; if list or tuple of logs is given,
+        then their entries are merged in their time order
     log_stats: LogStats
     config_f: str, optional
         path to a blacklist file containing ip addressed considered as bots
     logger: SimpleLogger, optional
-        default: `None`; if given then the duration of making stats will be logged
+        default: `None`; if given then the duration of making stats,
+        the summary of rejected lines, of the user agent cache
+        and of its bot rules will be logged
     cached_log_stats: LogStats, optional
         default: new empty `LogStats` object;
         log_stats object in which statiscics from `input` will be stored,
         containg laoded stats from chache.
         When parsing, not entries older then cached_log_stats.last_entry_ts will be added.
+    parser: str, optional
+        default: `"regex"`; name of the parser engine used for parsing `input`,
+        see `logs.parser.logparser.PARSERS`
+    years: Set[int], optional
+        default: `None`; if given then only entries from these years are processed
+    log_format: str, optional
+        default: `None`; Apache LogFormat string or name of the format,
+        see `logs.parser.logformat.LOG_FORMATS`; if given then the log
+        is parsed by parser compiled for the format instead of `parser`
+    max_line_length: int, optional
+        default: `100`; longer lines are not matched by regex,
+        see `logs.parser.logparser.get_parser`, `None` means no limit
+    rejects: RejectedLines, optional
+        default: new `RejectedLines` object without quarantine;
+        lines which could not be parsed or processed are counted into it
+    columnar: bool, optional
+        default: `False`; if `True`, then the parsed entries are processed
+        by numpy in batches, see `logs.statistics.columnar`
+    ua_cache: UserAgentCache, optional
+        default: new empty `UserAgentCache` with default bot rules;
+        cache of user agent classifications, e.g. loaded from the log cache,
+        IP addresses from `config_f` are set to its rules
 
     Returns
     -------
@@ -53,36 +110,150 @@ def make_stats(
 
     Note
     ----
-    Log entries in input should be ordered by their time.
+    Log entries in input (each of the inputs) should be ordered by their time.
     New session is recognized when time of given entry is
     at least SESSION_DELIM seconds after the time of the
     last entry for the same host.
 
     """
     log_stats = LogStats() if cached_log_stats is None  else cached_log_stats
-    from_time = log_stats.last_entry_ts
+
+    # only the fields used by `process_entries` are sliced at once
+    if isinstance(input, (list, tuple)):
+        buffers = merged_parser(
+            input,
+            parser,
+            log_format=log_format,
+            fields=USED_FIELDS,
+            max_line_length=max_line_length,
+        )
+    else:
+        buffers = get_parser(parser, log_format, USED_FIELDS, max_line_length)(input)
+
+    if rejects is None:
+        rejects = RejectedLines()
+    if ua_cache is None:
+        ua_cache = UserAgentCache()
+
+    process = process_entries
+    if columnar:
+        # imported here, the columnar module depends on this one
+        from logs.statistics.columnar import process_entries_columnar
+
+        process = process_entries_columnar
 
     if logger is not None:
         logger.addTask("Data parsing and proccessing")
-    
-    bots_set = set()
-    if config_f is not None:
-        with open(config_f, "r") as f:
-            bots_set = set(ip_addr for ip_addr in f)
 
-    for buffer in regex_parser(input):
-        for entry in buffer:
-            if len(entry) == 9:  # correct format of the log entry
-                _log_stats_add_entry(log_stats, entry, bots_set, from_time)
-            elif logger is not None:
-                logger.logMessage(f"log entry parsing has failed (len={len(entry)}):\n{entry}")
+    process(
+        log_stats,
+        buffers,
+        ua_cache.rules.set_ips(load_bots_set(config_f)),
+        from_time=log_stats.last_entry_ts,
+        rejects=rejects,
+        years=years,
+        ua_cache=ua_cache,
+    )
 
     if logger is not None:
+        if rejects.total():
+            logger.logMessage(rejects.summary())
+        logger.logMessage(ua_cache.summary())
+        for line in ua_cache.rules.summary():
+            logger.logMessage(line)
         logger.finishTask("Data parsing and proccessing")
 
     return log_stats
 
 
+def load_bots_set(config_f: Optional[str]) -> IpBlocklist:
+    """Returns blocklist of IP addresses and networks in CIDR notation
+    from the bot configuration file `config_f`, one on each line,
+    empty lines and lines starting with `#` are skipped;
+    empty blocklist if `config_f` is `None`"""
+    items = []
+    if config_f is not None:
+        with open(config_f, "r") as f:
+            items = [line.strip() for line in f]
+
+    return IpBlocklist(item for item in items if item and not item.startswith("#"))
+
+
+def process_entries(
+    log_stats: LogStats,
+    buffers: Iterator[Iterable[LogEntry]],
+    bots_set: Container[str],
+    from_time: datetime.datetime,
+    rejects: Optional[RejectedLines] = None,
+    first_seen: Optional[Dict[Tuple[int, bool, str], datetime.datetime]] = None,
+    years: Optional[Set[int]] = None,
+    ua_cache: Optional[UserAgentCache] = None,
+) -> None:
+    """Adds parsed log entries from `buffers` to `log_stats`
+
+    Parameters
+    ----------
+    log_stats: LogStats
+    buffers: Iterator[Iterable[LogEntry]]
+        buffers of parsed log entries, as yielded by parser engines
+    bots_set: Container[str]
+        blacklist of IP addresses (see `load_bots_set`) - all entries
+        from these ips will be classified as bots
+    from_time: datetime.datetime
+        only entries later than `from_time` will be added
+    rejects: RejectedLines, optional
+        default: `None`; if given then entries which could not be parsed
+        and entries with time which can not be decoded are counted into it,
+        such entries are skipped in any case
+    first_seen: Dict[Tuple[int, bool, str], datetime.datetime], optional
+        default: `None`; if given then for each new IpStats added
+        to `log_stats` maps `(<year>, <is bot>, <ip address>)`
+        to the time of its first entry
+    years: Set[int], optional
+        default: `None`; if given then entries from other years
+        are skipped before they are classified
+    ua_cache: UserAgentCache, optional
+        default: new empty `UserAgentCache`; user agents of the entries
+        are classified by it
+    """
+    decode_time = TimestampDecoder().decode
+    from_ts = from_time.timestamp()
+    ua_cache = UserAgentCache() if ua_cache is None else ua_cache
+    last_dt = None
+    daily_stats = None
+    in_years = True
+
+    for buffer in buffers:
+        for entry in buffer:
+            if len(entry) == 9:  # correct format of the log entry
+                try:
+                    dt, ts = decode_time(entry.time)
+                except ValueError:
+                    if rejects is not None:
+                        rejects.reject(entry, BAD_TIME)
+                    continue
+
+                if ts <= from_ts:
+                    # skip entries not later than cached `last_entry_ts`
+                    continue
+
+                if dt is not last_dt:
+                    # the decoder returns the same object for the same timestamp
+                    last_dt = dt
+                    in_years = years is None or dt.year in years
+                    if in_years:
+                        daily_stats = get_daily_stats(log_stats, dt.date())
+
+                if not in_years:
+                    continue
+
+                _log_stats_add_entry(
+                    log_stats, entry, dt, ts, daily_stats, bots_set, first_seen, ua_cache
+                )
+            elif rejects is not None:
+                rejects.reject(entry)
+
+
 def _determine_bot(
     entry: LogEntry, *args: Callable[[LogEntry], bool]
 ) -> Tuple[bool, str]:
@@ -110,26 +281,33 @@ def _determine_bot(
 
     for func in args:
         if func(entry):
-            return (True, NO_URL)
+            return BOT_WITHOUT_URL
 
-    return (False, NO_URL)
+    return NOT_BOT
 
 
 def determine_bot(
-    entry: LogEntry, bots_set: Optional[Set[str]] = set()
+    entry: LogEntry,
+    bots_set: Container[str] = set(),
+    classify: Callable[[str], Tuple[bool, str]] = classify_user_agent,
 ) -> Tuple[bool, str]:
     """Classifies log entry as a bot if User-agent contains an URL
-    or if User agent matches with `BOT_USER_AGENT_REGEX` or `entry.ip_addr`
-    is in the `bots_set`
+    or if `entry.ip_addr` is in the `bots_set` or if User agent matches
+    with `BOT_USER_AGENT_REGEX`, in this order (see `BotRules`).
+    Hits of the rules are counted for each entry by
+    `UserAgentCache.classify_entry`, which is used by `process_entries` instead.
 
     Parameters
     ----------
     entry : LogEntry
         the log entry which will be classified
 
-    bots_set: Set[str], optional
-        default: empty set; set of IPs wich will be
-        automaticaly classified as bots.
+    bots_set: Container[str], optional
+        default: empty set; collection of IPs wich will be
+        automaticaly classified as bots, e.g. `IpBlocklist`.
+
+    classify: Callable[[str], Tuple[bool, str]], optional
+        default: `classify_user_agent`; classifies the user agent
 
     Returns
     -------
@@ -138,15 +316,23 @@ def determine_bot(
         - (True, NO_URL) if the bot classified based on `bot_set` or `BOT_USER_AGENT_REGEX`
         - (False, NO_URL)  otherwise
     """
-    return _determine_bot(
-        entry,
-        lambda x: x.ip_addr in bots_set,
-        lambda x: RE_PATTERN_BOT_USER_AGENT.search(x.user_agent) is not None,
-    )
+    # the same as `_determine_bot` with predicates for `bots_set`
+    # and `BOT_USER_AGENT_REGEX`, without creating them for each entry;
+    # only the user agent part of the classification can be cached
+    classification = classify(entry.user_agent)
+    if classification[1] == NO_URL and entry.ip_addr in bots_set:
+        return BOT_WITHOUT_URL
+
+    return classification
 
 
 def resolve_and_group_ips(
-    log_stats: LogStats, ip_map: Dict[str, str] = {}, logger: Optional[SimpleLogger] = None,
+    log_stats: LogStats,
+    ip_map: Dict[str, str] = {},
+    logger: Optional[SimpleLogger] = None,
+    dns_workers: int = DEFAULT_DNS_WORKERS,
+    dns_timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+    dns_cache: Optional[DnsCache] = None,
 ) -> None:
     """Resolves ip address for all data in `log_stats.year_data`
     and merges same ips together.
@@ -155,7 +341,9 @@ def resolve_and_group_ips(
     ----
     Somtimes IpStats.ip_addr is a host name, not IP address.
     This function basicly solves the problem for all
-    stored data in `log_stats`
+    stored data in `log_stats`.
+    Distinct host names of all years are resolved at first
+    concurrently into `ip_map`, see `resolve_host_names`.
 
     Parameters
     ----------
@@ -163,14 +351,23 @@ def resolve_and_group_ips(
     ip_map: Dict[str, str], optional
         maps invalid adress to resolved address
     logger: SimpleLogger, optional
-        default: `None`; if given then the duration of this function will be logged
+        default: `None`; if given then the duration of this function
+        and the throughput of the host names resolution will be logged
+    dns_workers: int, optional
+        default: `32`; number of concurrent DNS lookups
+    dns_timeout: float, optional
+        default: `5.0`; seconds after which a DNS lookup is abandoned
+    dns_cache: DnsCache, optional
+        default: `None`; if given, then DNS lookups are cached in it
     """
     if logger is not None:
         logger.addTask("IPs resolving and merging")
 
+    resolve_host_names(log_stats, ip_map, logger, dns_workers, dns_timeout, dns_cache)
+
     for bots, people in log_stats.year_stats.values():
-        _resolve_and_group_ips_in_group_stats(bots, ip_map)
-        _resolve_and_group_ips_in_group_stats(people, ip_map)
+        _resolve_and_group_ips_in_group_stats(bots, ip_map, dns_cache)
+        _resolve_and_group_ips_in_group_stats(people, ip_map, dns_cache)
         # log_stats.year_stats[year] = (bots, people)
 
     # resolve and merge log_stats.daily_data
@@ -182,16 +379,67 @@ def resolve_and_group_ips(
         for ip in ips:
             resolved = ip_map.get(ip)
             grouped_ips.add(ip if resolved is None else resolved)
-        log_stats.daily_data[date] = DailyStats(
-            date, grouped_ips, data.requests, data.sessions
-        )
+        data.ips = grouped_ips
 
     if logger is not None:
         logger.finishTask("IPs resolving and merging")
 
 
+def resolve_host_names(
+    log_stats: LogStats,
+    ip_map: Dict[str, str],
+    logger: Optional[SimpleLogger] = None,
+    dns_workers: int = DEFAULT_DNS_WORKERS,
+    dns_timeout: Optional[float] = DEFAULT_DNS_TIMEOUT,
+    dns_cache: Optional[DnsCache] = None,
+) -> None:
+    """Resolves distinct host names, which are not yet validated
+    or in `ip_map`, from all IpStats of `log_stats` concurrently
+    and stores the results to `ip_map` as `IpStats.ensure_valid_ip_address` does,
+    host names which could not be resolved are mapped to themselves.
+
+    Parameters
+    ----------
+    see `resolve_and_group_ips`
+    """
+    hosts = set()
+    for bots, people in log_stats.year_stats.values():
+        for stat in (*bots.stats.values(), *people.stats.values()):
+            host = stat.ip_addr
+            if (
+                stat.valid_ip is None
+                and host not in ip_map
+                and canonical_ip(host) is None
+                and is_hostname(host)
+            ):
+                hosts.add(host)
+
+    if not hosts:
+        return
+
+    start = time.perf_counter()
+    resolved = (
+        resolve_hosts(hosts, dns_workers, dns_timeout)
+        if dns_cache is None
+        else dns_cache.resolve(FORWARD, hosts, dns_workers, dns_timeout)
+    )
+    duration = time.perf_counter() - start
+
+    for host, ip in resolved.items():
+        ip_map[host] = host if ip is None else ip
+
+    if logger is not None:
+        count = sum(ip is not None for ip in resolved.values())
+        logger.logMessage(
+            f"resolved {count} of {len(hosts)} host names in {duration:.2f} s "
+            f"({len(hosts) / max(duration, 1e-6):.1f} lookups/s)"
+        )
+
+
 def _resolve_and_group_ips_in_group_stats(
-    g_stats: GroupStats, ip_map: Optional[Dict[str, str]] = None
+    g_stats: GroupStats,
+    ip_map: Optional[Dict[str, str]] = None,
+    dns_cache: Optional[DnsCache] = None,
 ) -> None:
     """Resolves ip address in `g_stats`
     and merges data for same ips together.
@@ -205,6 +453,8 @@ def _resolve_and_group_ips_in_group_stats(
         GroupStats which will be modified
     ip_map: Dict[str, str], optional
         maps invalid adress to resolved address
+    dns_cache: DnsCache, optional
+        cache of DNS lookups
     """
     grouped_stats: Dict[str, IpStats] = {}
     hostname_aggregation_dict: Dict[str, Dict[str, int]] = {}
@@ -212,7 +462,7 @@ def _resolve_and_group_ips_in_group_stats(
 
     for stat in g_stats.stats.values():
         if stat.valid_ip is None:
-            stat.ensure_valid_ip_address(ip_map)
+            stat.ensure_valid_ip_address(ip_map, dns_cache)
 
         ip = stat.ip_addr
         grouped = grouped_stats.get(ip)
@@ -287,75 +537,109 @@ def group_bots_on_url(log_stats: LogStats, logger: Optional[SimpleLogger] = None
 def _log_stats_add_entry(
     log_stats: LogStats,
     entry: LogEntry,
-    bots_set: Optional[Set[str]],
-    from_time: datetime.datetime,
+    dt: datetime.datetime,
+    ts: float,
+    daily_stats: DailyStats,
+    bots_set: Container[str],
+    first_seen: Optional[Dict[Tuple[int, bool, str], datetime.datetime]] = None,
+    ua_cache: Optional[UserAgentCache] = None,
 ):
-    """Adds one `entry` to the statistical informations stored in `log_stats`
+    """Adds one `entry` to the statistical informations stored in `log_stats`.
+
+    For an IP address and a day which were already seen
+    no new objects are created.
 
     Parameters
     ----------
     log_stats: LogStats
     entry: LogEntry
-    bots_set: Optional[Set[str]]
-        set of IPv4 from blacklist - all entries from these
-        ips will be classified as bots
-    from_time: datetime.datetime
-        only entries with time attribute later than `from_time` will be added
+    dt: datetime.datetime
+        decoded `entry.time`
+    ts: float
+        epoch seconds of `dt`
+    daily_stats: DailyStats
+        daily data of `log_stats` for the date of `dt`,
+        see `get_daily_stats`
+    bots_set: Container[str]
+        blacklist of IP addresses, see `process_entries`
+    first_seen: Dict[Tuple[int, bool, str], datetime.datetime], optional
+        default: `None`; see `process_entries`
+    ua_cache: UserAgentCache, optional
+        default: `None`; the entry is classified by its rules,
+        see `UserAgentCache.classify_entry`, if `None`, then by `determine_bot`
     """
-    dt = datetime.datetime.strptime(entry.time, LOG_DT_FORMAT)
-    if dt <= from_time:
-        # skip entry earlier than `from_time`
-        return
-
     if dt > log_stats.last_entry_ts:
         log_stats.last_entry_ts = dt
 
     if log_stats.current_year != dt.year:
         log_stats.switch_year(dt.year)
 
-    is_bot, bot_url = determine_bot(entry, bots_set)
+    if ua_cache is None:
+        is_bot, bot_url = determine_bot(entry, bots_set)
+    else:
+        is_bot, bot_url = ua_cache.classify_entry(
+            entry.user_agent, entry.ip_addr, bots_set
+        )
     group_stats = log_stats.bots if is_bot else log_stats.people
-    ip_stat = group_stats.stats.get(entry.ip_addr, IpStats(entry.ip_addr, is_bot, bot_url))
 
-    new_sess = _ip_stats_add_entry(ip_stat, entry)
+    ip_stat = group_stats.stats.get(entry.ip_addr)
+    if ip_stat is None:
+        ip_stat = IpStats(entry.ip_addr, is_bot, bot_url)
+        group_stats.stats[entry.ip_addr] = ip_stat
+        if first_seen is not None:
+            first_seen[(dt.year, is_bot, entry.ip_addr)] = dt
+
+    new_sess = _ip_stats_add_entry(ip_stat, dt, ts)
     # 1 if new session was created, 0 otherwise
 
-    group_stats.stats[entry.ip_addr] = ip_stat
-    group_stats.day_req_distrib[ip_stat.datetime.hour] += 1
-    group_stats.week_req_distrib[ip_stat.datetime.weekday()] += 1
-    group_stats.month_req_distrib[ip_stat.datetime.month - 1] += 1
-    group_stats.day_sess_distrib[ip_stat.datetime.hour] += new_sess
-    group_stats.week_sess_distrib[ip_stat.datetime.weekday()] += new_sess
-    group_stats.month_sess_distrib[ip_stat.datetime.month - 1] += new_sess
+    hour = dt.hour
+    weekday = dt.weekday()
+    month = dt.month - 1
+    group_stats.day_req_distrib[hour] += 1
+    group_stats.week_req_distrib[weekday] += 1
+    group_stats.month_req_distrib[month] += 1
+    if new_sess:
+        group_stats.day_sess_distrib[hour] += 1
+        group_stats.week_sess_distrib[weekday] += 1
+        group_stats.month_sess_distrib[month] += 1
 
     # making daily_data for picture overview
-    date = ip_stat.datetime.date()
-    _, ip_addrs, req_num, sess_num = log_stats.daily_data.get(
-        date, DailyStats(date, set(), 0, 0)
-    )
-    ip_addrs.add(ip_stat.ip_addr)
-    if not ip_stat.is_bot and new_sess:
-        sess_num += 1
-    log_stats.daily_data[date] = DailyStats(date, ip_addrs, req_num + 1, sess_num)
+    daily_stats.ips.add(ip_stat.ip_addr)
+    daily_stats.requests += 1
+    if not is_bot and new_sess:
+        daily_stats.sessions += 1
+
+
+def get_daily_stats(log_stats: LogStats, date: datetime.date) -> DailyStats:
+    """Returns daily data of `log_stats` for `date`,
+    empty daily data are inserted for a new date"""
+    daily_stats = log_stats.daily_data.get(date)
+
+    if daily_stats is None:
+        daily_stats = DailyStats(date, set(), 0, 0)
+        log_stats.daily_data[date] = daily_stats
+
+    return daily_stats
 
 
-def _ip_stats_add_entry(ip_stat: IpStats, entry: LogEntry) -> int:
-    """ "Adds `entry` to the `ip_stats`.
+def _ip_stats_add_entry(ip_stat: IpStats, dt: datetime.datetime, ts: float) -> int:
+    """ "Adds entry with time `dt` (`ts` epoch seconds) to the `ip_stats`.
     If  new session is recognized returns `1`, else `0`.
-    `entry` is considered in new session if the duration from
-    `ip_stat.datetime` to `entry.time` is at least `SESSION_DELIM`.
+    The entry is considered in new session if the duration from
+    `ip_stat.timestamp` to `ts` is at least `SESSION_DELIM`,
+    the durations are compared in seconds, so no objects are allocated.
     Beacuse there is no way how to enter older sessions,
     the entries has to be added in in their time order,
     otherwiese the return value is meaningless."""
     rv = 0
-    dt = datetime.datetime.strptime(entry.time, LOG_DT_FORMAT)
 
-    if abs(dt - ip_stat.datetime) >= datetime.timedelta(minutes=SESSION_DELIM):
+    if abs(ts - ip_stat.timestamp) >= SESSION_SECONDS:
         ip_stat.sessions_num += 1
         rv = 1
 
     ip_stat.requests_num += 1
     ip_stat.datetime = dt
+    ip_stat.timestamp = ts
     return rv
 
 
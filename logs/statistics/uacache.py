@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+from logs.statistics.botrules import BotRule, BotRules
+
+DEFAULT_UA_CACHE_SIZE = 10000
+# rule of loaded bot classifications without URL, matched again on lookup
+LOADED_RULE = BotRule("loaded", "")
+
+
+class UserAgentCache:
+    """Bounded LRU cache of user agent classifications by bot `rules`
+    (see `logs.statistics.botrules.BotRules.match_user_agent`).
+
+    Logs contain only few distinct user agents compared to the number
+    of requests, so the regexes are searched once for each user agent
+    and the following requests are classified by a dict lookup.
+    At most `max_size` user agents are cached, the least recently used
+    are evicted. `hits` and `misses` count the lookups.
+
+    The cache can be stored into the log cache and loaded by the next run
+    with rules of the same signature,
+    see `logs.statistics.cache.ua_cache_to_logcache`.
+    """
+
+    __slots__ = ("max_size", "rules", "hits", "misses", "_cache")
+
+    def __init__(
+        self, max_size: int = DEFAULT_UA_CACHE_SIZE, rules: Optional[BotRules] = None
+    ):
+        self.max_size = max(max_size, 1)
+        self.rules = BotRules() if rules is None else rules
+        self.hits = 0
+        self.misses = 0
+        self._cache: Dict[str, Tuple[Tuple[bool, str], Optional[BotRule]]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def lookup(self, user_agent: str) -> Tuple[Tuple[bool, str], Optional[BotRule]]:
+        """Returns classification `(<is bot>, <bot url>)` of `user_agent`
+        by the rules and the rule which decided it, cached,
+        the hit of the rule is not counted"""
+        cached = self._cache.get(user_agent)
+
+        if cached is None:
+            self.misses += 1
+            cached = self.rules.match_user_agent(user_agent)
+            if len(self._cache) >= self.max_size:
+                self._cache.popitem(last=False)
+            self._cache[user_agent] = cached
+        else:
+            self.hits += 1
+            self._cache.move_to_end(user_agent)
+            if cached[1] is LOADED_RULE:
+                cached = (cached[0], self.rules.match_user_agent(user_agent)[1])
+                self._cache[user_agent] = cached
+
+        return cached
+
+    def classify(self, user_agent: str) -> Tuple[bool, str]:
+        """Returns classification `(<is bot>, <bot url>)` of `user_agent`
+        by the rules, cached, the hit is counted to the rule which decided it"""
+        classification, rule = self.lookup(user_agent)
+        if rule is not None:
+            rule.hits += 1
+        return classification
+
+    def classify_entry(
+        self, user_agent: str, ip_addr: str, ips: Container[str]
+    ) -> Tuple[bool, str]:
+        """Returns classification `(<is bot>, <bot url>)` of log entry
+        with `user_agent` and `ip_addr` by the rules in their order,
+        `ips` are the IP addresses of bots, see `BotRules.decide`"""
+        classification, rule = self.lookup(user_agent)
+        return self.rules.decide(classification, rule, ip_addr, ips)
+
+    def update(self, other: "UserAgentCache") -> None:
+        """Adds counters of `other` (and of its rules) and its user agents
+        as the most recently used, used for merging caches of worker processes"""
+        self.hits += other.hits
+        self.misses += other.misses
+        self.rules.update(other.rules)
+        self.load(other.dump())
+
+    def dump(self) -> List[Tuple[str, bool, str]]:
+        """Returns list of `(<user agent>, <is bot>, <bot url>)`
+        from the least to the most recently used"""
+        return [
+            (user_agent, is_bot, bot_url)
+            for user_agent, ((is_bot, bot_url), _) in self._cache.items()
+        ]
+
+    def load(self, classifications: Iterable[Tuple[str, bool, str]]) -> None:
+        """Caches `classifications` as returned by `dump`,
+        counters are not changed"""
+        for user_agent, is_bot, bot_url in classifications:
+            if user_agent in self._cache:
+                self._cache.move_to_end(user_agent)
+                continue
+            if len(self._cache) >= self.max_size:
+                self._cache.popitem(last=False)
+
+            if not is_bot:
+                rule = None
+            elif bot_url:
+                rule = self.rules.url_rule
+            else:
+                rule = LOADED_RULE  # one of the user agent rules
+            self._cache[user_agent] = ((is_bot, bot_url), rule)
+
+    def summary(self) -> str:
+        """Returns one line summary of the counters"""
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0.0
+        return (
+            f"user agent cache: {self.hits} hits, {self.misses} misses "
+            f"({rate:.1f} % hit rate), {len(self)} user agents cached"
+        )